@@ -0,0 +1,90 @@
+import arcade
+import threading
+
+from collections import defaultdict
+from typing import Dict, List, Type
+from arcade import Sprite, SpriteList, Texture
+
+
+class AssetRegistry:
+    """
+    Process-wide registry of textures and pooled sprites.
+
+    Every texture is decoded and its hit box computed exactly once. Sprites
+    are recycled through per-class pools, hence resetting an episode or
+    respawning an astroid neither touches the file system nor the image
+    decoders and does not allocate new sprites once the pools are warm.
+
+    Games of several threads, e.g. the agents of rescue_ai.main, share the
+    registry, hence the cache and the pools are guarded by a lock. A pooled
+    sprite is handed to exactly one caller.
+    """
+
+    def __init__(self):
+        self._textures: Dict[str, Texture] = {}
+        self._pools: Dict[Type[Sprite], List[Sprite]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def texture(self, filename: str) -> Texture:
+        texture = self._textures.get(filename)
+        if texture is None:
+            with self._lock:
+                texture = self._textures.get(filename)
+                if texture is None:
+                    texture = arcade.load_texture(filename)
+                    # Computed lazily by arcade, force it while we are loading
+                    # anyway
+                    texture.hit_box_points
+                    self._textures[filename] = texture
+        return texture
+
+    def acquire(self, sprite_class: Type[Sprite], filename: str,
+                scale: float = 1.0, center_x: float = 0,
+                center_y: float = 0) -> Sprite:
+        """
+        Parameters:
+        sprite_class (Type[Sprite]): Sprite or one of its subclasses
+        filename (str): Texture of the sprite
+
+        Returns:
+        Sprite: A sprite of the given class, either recycled or new. Recycled
+        sprites keep their subclass specific attributes, callers reset them.
+        """
+        with self._lock:
+            pool = self._pools[sprite_class]
+            sprite = pool.pop() if pool else None
+        if sprite is None:
+            return sprite_class(texture=self.texture(filename), scale=scale,
+                                center_x=center_x, center_y=center_y)
+
+        self.retexture(sprite, filename, scale)
+        sprite.angle = 0
+        sprite.position = (center_x, center_y)
+        sprite.velocity = [0.0, 0.0]
+        sprite.change_angle = 0.0
+        sprite.force = [0, 0]
+        return sprite
+
+    def retexture(self, sprite: Sprite, filename: str, scale: float):
+        """ Swaps texture, hit box and scale of a sprite in place """
+        texture = self.texture(filename)
+        sprite.texture = texture
+        sprite.set_hit_box(texture.hit_box_points)
+        sprite.scale = scale
+
+    def release(self, sprite: Sprite):
+        """ Detaches a sprite from its lists and physics engines and pools it """
+        sprite.remove_from_sprite_lists()
+        with self._lock:
+            self._pools[type(sprite)].append(sprite)
+
+    def release_list(self, sprite_list: SpriteList):
+        """ Releases all sprites of a list, leaving the list empty """
+        sprites = list(sprite_list)
+        sprite_list.clear()
+        for sprite in sprites:
+            self.release(sprite)
+
+
+# Shared by all games of a process
+assets = AssetRegistry()
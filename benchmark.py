@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import torch
+
+from typing import Callable, Dict, List
+from env import Environment
+from ppo_model import CustomPolicy, Custom_Policy
+from vec_env import BatchedEnvironment
+
+'''
+Micro and macro benchmarks of the environment and the policy. Results are
+flat JSON, metric name -> value, and can be stored as a baseline which later
+runs are compared against.
+'''
+
+SCREEN = dict(screen_width=512, screen_height=512, screen_title="RescueAI",
+              renderer="software")
+
+# Throughputs get better when growing, everything else is a latency
+HIGHER_IS_BETTER = ("steps_per_s",)
+# Tail latencies are too noisy to flag regressions on
+COMPARED = ("p50_ms", "mean_ms", "steps_per_s")
+
+
+def _timings(fn: Callable, repeats: int, warmup: int = 10) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    latencies = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - start
+    latencies *= 1000
+    return {"p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_ms": float(latencies.mean())}
+
+
+def _prefixed(prefix: str, timings: Dict[str, float]) -> Dict[str, float]:
+    return {f"{prefix}.{key}": value for key, value in timings.items()}
+
+
+def _stepper(env: Environment, seed: int) -> Callable:
+    """ Steps with random actions and resets whenever an episode ends """
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed)
+
+    def step():
+        done = env.step(rng.integers(0, 4, size=1))[2]
+        if done:
+            env.reset()
+    return step
+
+
+def bench_env(repeats: int, astroid_counts: List[int], seed: int = 0) -> Dict[str, float]:
+    """ Reset, step, observation and reward latencies """
+    results = {}
+    env = Environment(**SCREEN)
+    env.reset(seed=seed)
+    results.update(_prefixed("env.reset", _timings(env.reset, repeats)))
+
+    step = _stepper(env, seed)
+    for _ in range(20):
+        step()
+    results.update(_prefixed("env.get_obs", _timings(env.get_obs, repeats)))
+    obs = {key: value.copy() for key, value in env.get_obs().items()}
+    results.update(_prefixed("env.reward_function",
+                             _timings(lambda: env.reward_function(obs), repeats)))
+
+    for count in astroid_counts:
+        env.game.num_astroids = count
+        step = _stepper(env, seed)
+        results.update(_prefixed(f"env.step.astroids_{count}",
+                                 _timings(step, repeats)))
+    env.close()
+    return results
+
+
+def bench_policy(repeats: int, batch_sizes: List[int], seed: int = 0) -> Dict[str, float]:
+    """ Custom_Policy forward passes, i.e. the feature extractor """
+    torch.manual_seed(seed)
+    model = Custom_Policy().eval()
+    results = {}
+    for batch_size in batch_sizes:
+        features = {"numerical": torch.rand(batch_size, 4),
+                    "image": torch.randint(0, 256, (batch_size, 300, 300),
+                                           dtype=torch.uint8)}
+
+        def forward():
+            with torch.inference_mode():
+                model(features)
+        # Large batches take long, fewer repeats keep the suite short
+        results.update(_prefixed(
+            f"policy.forward.batch_{batch_size}",
+            _timings(forward, max(3, repeats // batch_size), warmup=2)))
+    return results
+
+
+def bench_rollout(num_steps: int, num_envs: int, seed: int = 0) -> Dict[str, float]:
+    """ Policy in the loop, as when collecting a PPO rollout """
+    venv = BatchedEnvironment(num_envs, **SCREEN)
+    venv.seed(seed)
+    torch.manual_seed(seed)
+    policy = CustomPolicy(venv.observation_space, venv.action_space,
+                          lr_schedule=lambda _: 0.0).eval()
+
+    obs = venv.reset()
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        actions, _ = policy.predict(obs)
+        obs = venv.step(actions)[0]
+    elapsed = time.perf_counter() - start
+    venv.close()
+    return {f"rollout.envs_{num_envs}.steps_per_s": num_steps * num_envs / elapsed}
+
+
+def run(repeats: int = 200, astroid_counts: List[int] = (0, 8, 16, 32),
+        batch_sizes: List[int] = (1, 4, 16, 64, 256, 1024),
+        rollout_steps: int = 200, num_envs: int = 4, seed: int = 0,
+        groups: List[str] = ("env", "policy", "rollout")) -> Dict:
+    """
+    Runs the selected benchmark groups.
+
+    Returns:
+    Dict: Machine description and the metrics, name -> value
+    """
+    torch.set_num_threads(1)
+    metrics = {}
+    if "env" in groups:
+        metrics.update(bench_env(repeats, list(astroid_counts), seed))
+    if "policy" in groups:
+        metrics.update(bench_policy(repeats, list(batch_sizes), seed))
+    if "rollout" in groups:
+        metrics.update(bench_rollout(rollout_steps, num_envs, seed))
+    return {"machine": {"python": sys.version.split()[0],
+                        "torch": torch.__version__,
+                        "numpy": np.__version__,
+                        "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+            "metrics": metrics}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.1) -> List[Dict]:
+    """
+    Parameters:
+    threshold (float): Relative change beyond which a metric regressed
+
+    Returns:
+    List: The regressed metrics with their baseline and current value
+    """
+    regressions = []
+    for name, value in results["metrics"].items():
+        reference = baseline["metrics"].get(name)
+        if not reference or not name.endswith(COMPARED):
+            continue
+        change = (value - reference) / reference
+        if name.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append({"metric": name, "baseline": reference,
+                                "current": value, "change": change})
+    return regressions
+
+
+def main():
+    '''
+    Benchmarks the environment and the policy, e.g.
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.1
+    Exits with 1 if any metric regressed beyond the threshold.
+    '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--groups", nargs="+", default=["env", "policy", "rollout"],
+                        choices=["env", "policy", "rollout"])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--astroids", type=int, nargs="+", default=[0, 8, 16, 32])
+    parser.add_argument("--batch-sizes", type=int, nargs="+",
+                        default=[1, 4, 16, 64, 256, 1024])
+    parser.add_argument("--rollout-steps", type=int, default=200)
+    parser.add_argument("--envs", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON, e.g. a baseline")
+    parser.add_argument("--baseline", help="Compare against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slow down flagged as a regression")
+    args = parser.parse_args()
+
+    results = run(args.repeats, args.astroids, args.batch_sizes,
+                  args.rollout_steps, args.envs, args.seed, args.groups)
+    for name, value in results["metrics"].items():
+        print(f"{name:45s} {value:12.4f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print("REGRESSION {metric}: {baseline:.4f} -> {current:.4f} "
+                  "({change:+.1%})".format(**regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
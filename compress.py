@@ -0,0 +1,216 @@
+import argparse
+import copy
+import io
+import json
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+
+from typing import Callable, Dict, List
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from stable_baselines3 import PPO
+from env import Environment
+from evaluate import README_ASTROID_SPEED, README_ASTROIDS, model_actor, play
+from export import ActionModel
+
+
+def _to_tensors(obs: Dict[str, np.ndarray]):
+    return (torch.as_tensor(obs["numerical"], dtype=torch.float32)[None],
+            torch.as_tensor(obs["image"])[None])
+
+
+def make_env(curriculum: Dict | None = None) -> Environment:
+    """ Evaluation game, curriculum as in evaluate.evaluate """
+    env = Environment(512, 512, "RescueAI", renderer="software")
+    env.set_curriculum(**(curriculum or {}))
+    return env
+
+
+def collect_observations(model: nn.Module, num_obs: int = 256, seed: int = 0,
+                         curriculum: Dict | None = None) -> List[Dict[str, np.ndarray]]:
+    """ Observations visited by the given model, e.g. for calibration """
+    env = make_env(curriculum)
+    act = model_actor(model, seed)
+    obs = env.reset(seed=seed)[0]
+    observations = []
+    while len(observations) < num_obs:
+        observations.append({key: value.copy() for key, value in obs.items()})
+        obs, _, done = env.step(act(obs))[0:3]
+        if done:
+            obs = env.reset()[0]
+    env.close()
+    return observations
+
+
+def prune_fc1(model: ActionModel, keep: float = 0.5) -> ActionModel:
+    """
+    Structured pruning of fc1, the widest layer of the image branch.
+
+    The output neurons of fc1 with the smallest weight norms are removed
+    together with the matching inputs of fc2, i.e. the layers really shrink
+    instead of being masked.
+
+    Parameters:
+    keep (float): Fraction of the fc1 neurons to keep
+    """
+    model = copy.deepcopy(model)
+    extractor = model.features_extractor.extractor
+    fc1, fc2 = extractor.fc1, extractor.fc2
+
+    num_keep = max(1, round(keep * fc1.out_features))
+    kept = fc1.weight.norm(dim=1).argsort(descending=True)[:num_keep].sort().values
+
+    pruned_fc1 = nn.Linear(fc1.in_features, num_keep)
+    pruned_fc2 = nn.Linear(num_keep, fc2.out_features)
+    with torch.no_grad():
+        pruned_fc1.weight.copy_(fc1.weight[kept])
+        pruned_fc1.bias.copy_(fc1.bias[kept])
+        pruned_fc2.weight.copy_(fc2.weight[:, kept])
+        pruned_fc2.bias.copy_(fc2.bias)
+
+    extractor.fc1, extractor.fc2 = pruned_fc1, pruned_fc2
+    return model
+
+
+def quantize_linear(model: ActionModel) -> ActionModel:
+    """ Dynamic int8 quantization of all linear layers, weights are int8 """
+    return quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_cnn(model: ActionModel,
+                 calibration: List[Dict[str, np.ndarray]]) -> ActionModel:
+    """
+    Static int8 quantization of the CNN. Activation ranges are calibrated on
+    the given observations, e.g. from collect_observations.
+    """
+    model = copy.deepcopy(model)
+    extractor = model.features_extractor.extractor
+    image_shape = model.features_extractor._observation_space["image"].shape
+
+    extractor.cnn = prepare_fx(
+        extractor.cnn,
+        get_default_qconfig_mapping(torch.backends.quantized.engine),
+        example_inputs=(torch.zeros(1, 1, *image_shape),))
+    with torch.inference_mode():
+        for obs in calibration:
+            model(*_to_tensors(obs))
+    extractor.cnn = convert_fx(extractor.cnn)
+    return model
+
+
+def model_size(model: nn.Module) -> int:
+    """ Bytes of the serialized state dict """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def step_latency(model: nn.Module, observations: List[Dict[str, np.ndarray]],
+                 repeats: int = 500) -> Dict[str, float]:
+    """ Latency of single observation forward passes in milliseconds """
+    inputs = [_to_tensors(obs) for obs in observations]
+    latencies = []
+    with torch.inference_mode():
+        for i in range(repeats + 20):
+            start = time.perf_counter()
+            model(*inputs[i % len(inputs)])
+            if i >= 20:
+                latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {"latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p99_ms": float(np.percentile(latencies, 99))}
+
+
+def success_rate(model: nn.Module, num_actions: int = 50000, seed: int = 0,
+                 curriculum: Dict | None = None,
+                 deterministic: bool = False) -> Dict[str, float]:
+    """
+    The README's evaluation protocol in this process, see evaluate.play.
+    Actions are sampled as by evaluate.model_actor, every variant with a
+    generator of the same seed.
+    """
+    env = make_env(curriculum)
+    result = play(env, model_actor(model, seed, deterministic), num_actions, seed)
+    env.close()
+    result["success_rate"] = result["successes"] / result["runs"] \
+        if result["runs"] else 0.0
+    return result
+
+
+# Variant name -> builder taking the float model and calibration observations
+VARIANTS: Dict[str, Callable] = {
+    "fp32": lambda model, calibration, keep: model,
+    "int8_linear": lambda model, calibration, keep: quantize_linear(model),
+    "int8_cnn": lambda model, calibration, keep: quantize_cnn(model, calibration),
+    "int8": lambda model, calibration, keep: quantize_linear(
+        quantize_cnn(model, calibration)),
+    "pruned": lambda model, calibration, keep: prune_fc1(model, keep),
+    "pruned_int8": lambda model, calibration, keep: quantize_linear(
+        quantize_cnn(prune_fc1(model, keep), calibration)),
+}
+
+
+def benchmark(checkpoint: str, variants: List[str], num_actions: int = 50000,
+              keep: float = 0.5, seed: int = 0,
+              curriculum: Dict | None = None,
+              deterministic: bool = False) -> List[Dict]:
+    """
+    Builds each variant of a checkpoint and reports size, per-step latency
+    and success rate. All variants are evaluated on the same seeded games,
+    sampling their actions with equally seeded generators unless
+    deterministic.
+    """
+    model = ActionModel(PPO.load(checkpoint, device="cpu").policy).eval()
+    calibration = collect_observations(model, seed=seed + 1, curriculum=curriculum)
+
+    report = []
+    for name in variants:
+        variant = VARIANTS[name](model, calibration, keep).eval()
+        result = {"variant": name, "size_bytes": model_size(variant)}
+        result.update(step_latency(variant, calibration))
+        result.update(success_rate(variant, num_actions, seed, curriculum,
+                                   deterministic))
+        print(json.dumps(result))
+        report.append(result)
+    return report
+
+
+def main():
+    '''
+    Compares quantized and pruned variants of a checkpoint, e.g.
+    python compress.py checkpoints/ckpt_3 --variants fp32 int8 pruned_int8
+    '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("checkpoint")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS),
+                        choices=list(VARIANTS))
+    parser.add_argument("--actions", type=int, default=50000)
+    parser.add_argument("--keep", type=float, default=0.5,
+                        help="Fraction of fc1 neurons kept by pruning")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--astroids", type=int, default=README_ASTROIDS,
+                        help="Number of astroids")
+    parser.add_argument("--astroid-speed", type=int, nargs=2,
+                        default=README_ASTROID_SPEED, metavar=("LOW", "HIGH"))
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Take the most likely actions instead of sampling")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    report = benchmark(args.checkpoint, args.variants, args.actions,
+                       args.keep, args.seed,
+                       {"num_astroids": args.astroids,
+                        "astroid_speed": tuple(args.astroid_speed)},
+                       args.deterministic)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import torch
+
+from typing import Dict, List
+from stable_baselines3 import PPO
+from stable_baselines3.common.policies import ActorCriticPolicy
+from game import make_game
+from physics import PHYSICS_BACKENDS
+from ppo_model import CompactRolloutBuffer, Custom_Policy, CustomPolicy
+from vec_env import BatchedEnvironment
+
+'''
+Trains RescueAI through the curriculum of the README. Every stage configures
+the game, freezes parts of Custom_Policy, warm starts from the checkpoint of
+the previous stage and ends once the agent succeeds often enough, or after a
+budget of timesteps. Each stage is saved to <output_dir>/<name>.zip, by
+default under runs/curriculum instead of over the shipped checkpoints. A
+stage which runs out of budget below its threshold stops the curriculum,
+unless it sets 'advance_on_budget'.
+'''
+
+# Movement first, then growing numbers of ever faster astroids with the
+# decoder, which learnt the navigation, frozen
+DEFAULT_STAGES = [
+    {"name": "movement_ckpt", "screen_size": 448, "num_astroids": 0,
+     "frozen": [], "success_threshold": 0.9, "max_timesteps": 2_000_000},
+    {"name": "ckpt_1", "screen_size": 512, "num_astroids": 2,
+     "astroid_speed": [30, 60], "frozen": ["decoder"],
+     "success_threshold": 0.7, "max_timesteps": 2_000_000},
+    {"name": "ckpt_2", "screen_size": 512, "num_astroids": 3,
+     "astroid_speed": [50, 100], "frozen": ["decoder"],
+     "success_threshold": 0.65, "max_timesteps": 2_000_000},
+    {"name": "ckpt_3", "screen_size": 512, "num_astroids": 4,
+     "astroid_speed": [80, 150], "frozen": ["decoder"],
+     "success_threshold": 0.6, "max_timesteps": 2_000_000},
+]
+
+# Stage keys forwarded to Simulation.set_curriculum
+CURRICULUM_KEYS = ("num_astroids", "astroid_borders", "astroid_margin",
+                   "astroid_speed")
+REQUIRED_KEYS = ("name", "max_timesteps", "success_threshold")
+STAGE_KEYS = REQUIRED_KEYS + CURRICULUM_KEYS + (
+    "screen_size", "physics", "frozen", "advance_on_budget", "warm_start")
+
+
+def validate_stages(stages: List[Dict]):
+    """
+    Checks every stage up front, so a typo does not surface only once the
+    stages before it have trained for hours.
+
+    Raises:
+    ValueError: On missing or unknown keys, duplicate names, budgets or
+    thresholds out of range, unknown physics backends, frozen names which
+    are no submodules of Custom_Policy, and parameters
+    Simulation.set_curriculum rejects
+    """
+    if not stages:
+        raise ValueError("The curriculum has no stages")
+    submodules = dict(Custom_Policy().named_modules())
+    names = set()
+    for i, stage in enumerate(stages):
+        label = f"Stage {stage.get('name', i)}"
+        missing = [key for key in REQUIRED_KEYS if key not in stage]
+        if missing:
+            raise ValueError(f"{label} lacks {', '.join(missing)}")
+        unknown = [key for key in stage if key not in STAGE_KEYS]
+        if unknown:
+            raise ValueError(f"{label} has unknown keys {', '.join(unknown)}")
+        if stage["name"] in names:
+            raise ValueError(f"{label} is defined twice")
+        names.add(stage["name"])
+        if not isinstance(stage["max_timesteps"], int) or stage["max_timesteps"] < 1:
+            raise ValueError(f"{label}: max_timesteps must be a positive integer")
+        if not 0 <= stage["success_threshold"] <= 1:
+            raise ValueError(f"{label}: success_threshold must lie within [0, 1]")
+        frozen = stage.get("frozen", [])
+        if not isinstance(frozen, list):
+            raise ValueError(f"{label}: frozen must be a list of submodule names")
+        for name in frozen:
+            if not name or name not in submodules:
+                raise ValueError(f"{label}: '{name}' is no submodule of Custom_Policy")
+
+        if stage.get("physics", "pymunk") not in PHYSICS_BACKENDS:
+            raise ValueError(f"{label}: physics must be one of "
+                             f"{', '.join(PHYSICS_BACKENDS)}")
+        size = stage.get("screen_size", 512)
+        game = make_game(size, size, None, renderer="software",
+                         physics=stage.get("physics", "pymunk"))
+        try:
+            game.set_curriculum(**{key: stage[key] for key in CURRICULUM_KEYS
+                                   if key in stage})
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"{label}: {error}") from error
+        finally:
+            game.close()
+
+
+def freeze(policy: ActorCriticPolicy, frozen: List[str]) -> int:
+    """
+    Freezes submodules of the policy's Custom_Policy and unfreezes the rest.
+    Frozen parameters get no gradients, hence autograd skips them in the
+    backward pass and Adam leaves them and their moments alone. The
+    optimizer keeps all parameters, so checkpoints load into a policy with
+    the usual parameter groups.
+
+    Parameters:
+    policy (ActorCriticPolicy): E.g. the policy of a PPO model
+    frozen (List[str]): Submodule names of Custom_Policy, e.g. 'decoder' or
+    'cnn.0'
+
+    Returns:
+    int: Number of trainable parameters
+    """
+    for parameter in policy.parameters():
+        parameter.requires_grad_(True)
+
+    # Actor and critic share the extractor unless configured otherwise
+    extractors = {id(extractor): extractor.extractor for extractor in (
+        policy.pi_features_extractor, policy.vf_features_extractor)}
+    for extractor in extractors.values():
+        for name in frozen:
+            extractor.get_submodule(name).requires_grad_(False)
+
+    return sum(parameter.numel() for parameter in policy.parameters()
+               if parameter.requires_grad)
+
+
+def make_env(stage: Dict, num_envs: int, seed: int) -> BatchedEnvironment:
+    """ Games of the stage's screen size with its astroid parameters """
+    size = stage.get("screen_size", 512)
+    venv = BatchedEnvironment(num_envs, size, size,
+                              physics=stage.get("physics", "pymunk"))
+    venv.env_method("set_curriculum", **{
+        key: stage[key] for key in CURRICULUM_KEYS if key in stage})
+    venv.seed(seed)
+    return venv
+
+
+def success_rate(model: PPO) -> float | None:
+    """ Over SB3's window of recent episodes, None before any ended """
+    if not model.ep_success_buffer:
+        return None
+    return float(np.mean(model.ep_success_buffer))
+
+
+def train_stage(stage: Dict, warm_start: str | None, output_dir: str,
+                num_envs: int = 8, chunk_timesteps: int = 20_000,
+                min_episodes: int = 50, seed: int = 0, **ppo_kwargs) -> Dict:
+    """
+    Trains one stage in chunks of timesteps, checking the success rate
+    after every chunk.
+
+    Parameters:
+    stage (Dict): See DEFAULT_STAGES and validate_stages
+    warm_start (str): Checkpoint to continue from, a fresh model if None
+    chunk_timesteps (int): Timesteps between success rate checks
+    min_episodes (int): Episodes needed before the rate can end the stage
+    ppo_kwargs: Further PPO arguments of fresh models, e.g. n_steps
+
+    Returns:
+    Dict: The stage's checkpoint path, timesteps, success rate and whether
+    the threshold was reached
+    """
+    venv = make_env(stage, num_envs, seed)
+    if warm_start is None:
+        model = PPO(CustomPolicy, venv, seed=seed,
+                    rollout_buffer_class=CompactRolloutBuffer, **ppo_kwargs)
+    else:
+        model = PPO.load(warm_start, env=venv,
+                         rollout_buffer_class=CompactRolloutBuffer)
+    trainable = freeze(model.policy, stage.get("frozen", []))
+    print(f"Stage {stage['name']}: {trainable} trainable parameters, "
+          f"warm start {warm_start}")
+
+    threshold = stage["success_threshold"]
+    timesteps, rate, passed = 0, None, False
+    while timesteps < stage["max_timesteps"]:
+        chunk = min(chunk_timesteps, stage["max_timesteps"] - timesteps)
+        model.learn(chunk, reset_num_timesteps=timesteps == 0)
+        timesteps = model.num_timesteps
+        rate = success_rate(model)
+        print(f"Stage {stage['name']}: {timesteps} timesteps, success rate {rate}")
+        if rate is not None and len(model.ep_success_buffer) >= min_episodes \
+                and rate >= threshold:
+            passed = True
+            break
+
+    path = os.path.join(output_dir, stage["name"])
+    model.save(path)
+    venv.close()
+    return {"stage": stage["name"], "checkpoint": path + ".zip",
+            "timesteps": timesteps, "success_rate": rate, "passed": passed}
+
+
+def run(stages: List[Dict], output_dir: str = "runs/curriculum",
+        warm_start: str | None = None, first_stage: str | None = None,
+        **kwargs) -> List[Dict]:
+    """
+    Trains the stages in order, each warm starting from the previous one.
+    Stops after a stage which missed its success threshold, unless the stage
+    sets 'advance_on_budget'. Its checkpoint is saved regardless, e.g. to
+    resume it with a larger budget.
+
+    Parameters:
+    warm_start (str): Checkpoint of the first trained stage, overridden by
+    a stage's own 'warm_start'
+    first_stage (str): Name of the stage to resume at, the stage before it
+    is warm started from, e.g. runs/curriculum/ckpt_1.zip
+    kwargs: See train_stage
+
+    Returns:
+    List: Per stage results, see train_stage, up to the stage the run
+    stopped at
+    """
+    validate_stages(stages)
+    names = [stage["name"] for stage in stages]
+    if first_stage is not None and first_stage not in names:
+        raise ValueError(f"Unknown first stage {first_stage}, the stages are "
+                         f"{', '.join(names)}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    if first_stage is not None:
+        start = names.index(first_stage)
+        if warm_start is None and start > 0:
+            warm_start = os.path.join(output_dir, names[start - 1] + ".zip")
+        stages = stages[start:]
+
+    results = []
+    for stage in stages:
+        result = train_stage(stage, stage.get("warm_start", warm_start),
+                             output_dir, **kwargs)
+        results.append(result)
+        if not result["passed"] and not stage.get("advance_on_budget", False):
+            print(f"Stage {stage['name']} missed its success threshold, stopping. "
+                  f"Resume with --first-stage {stage['name']} "
+                  f"--warm-start {result['checkpoint']}")
+            break
+        warm_start = result["checkpoint"]
+    return results
+
+
+def main():
+    '''
+    Trains the curriculum, e.g.
+    python curriculum.py --envs 8 --output-dir runs/curriculum
+    python curriculum.py --stages stages.json --first-stage ckpt_2
+    Stage files hold a JSON list shaped like DEFAULT_STAGES. The exit status
+    is 1 if the last trained stage missed its success threshold.
+    '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--stages", help="JSON stage list, DEFAULT_STAGES if omitted")
+    parser.add_argument("--output-dir", default="runs/curriculum",
+                        help="Stage checkpoints are saved here, existing ones "
+                             "of the same name are overwritten")
+    parser.add_argument("--warm-start", help="Checkpoint of the first stage")
+    parser.add_argument("--first-stage", help="Resume at this stage")
+    parser.add_argument("--envs", type=int, default=8)
+    parser.add_argument("--chunk", type=int, default=20_000,
+                        help="Timesteps between success rate checks")
+    parser.add_argument("--min-episodes", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stages = DEFAULT_STAGES
+    if args.stages:
+        with open(args.stages) as file:
+            stages = json.load(file)
+    try:
+        validate_stages(stages)
+    except ValueError as error:
+        parser.error(str(error))
+
+    torch.manual_seed(args.seed)
+    results = run(stages, args.output_dir, args.warm_start, args.first_stage,
+                  num_envs=args.envs, chunk_timesteps=args.chunk,
+                  min_episodes=args.min_episodes, seed=args.seed)
+    for result in results:
+        print(json.dumps(result))
+    if results and not results[-1]["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
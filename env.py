@@ -2,35 +2,70 @@ import gymnasium as gym
 import math
 import numpy as np
 
-from collections import deque
-from game import Game
+from game import Simulation, make_game
+from profiling import profiler
+from reward import SmoothedReward
 from auxilary import Move, Rescuer
+from proximity import hit_box_polygons, min_distances
+from spatial_index import bounding_radius
 from typing import List, Tuple
 from arcade import SpriteList, Sprite
 
 
 class Environment(gym.Env):
-    def __init__(self, screen_width, screen_height, screen_title):
+    def __init__(self, screen_width, screen_height, screen_title,
+                 renderer: str = "window", obs_size: int = 300,
+                 obs_downsample: int = 1, frame_skip: int = 1,
+                 physics: str = "pymunk"):
+        """
+        Parameters:
+        renderer (str): See make_game
+        physics (str): Physics backend, 'pymunk' or 'numpy', see make_game
+        obs_size (int): Side length of the agent centered crop in pixels
+        obs_downsample (int): The crop is averaged over blocks of this size,
+        i.e. images are obs_size // obs_downsample pixels wide
+        frame_skip (int): Number of physics steps an action is repeated for
+        """
         super(Environment, self).__init__()
         self.screen_width = screen_width
 
-        # Create game environment
-        self.game: Game = Game(screen_width, screen_height, screen_title)
+        if obs_size % obs_downsample != 0:
+            raise ValueError("obs_size must be a multiple of obs_downsample")
+        if frame_skip < 1:
+            raise ValueError("frame_skip must be at least 1")
+        self.obs_size = obs_size
+        self.obs_downsample = obs_downsample
+        self.frame_skip = frame_skip
+        image_size = obs_size // obs_downsample
+
+        # Create game environment, 'software' renders without any display
+        self.game: Simulation = make_game(
+            screen_width, screen_height, screen_title, renderer, physics)
         self.game.setup()
 
         # Define the numerical part of the observation space
         self.numerical_obs_space = gym.spaces.Box(
             low=0, high=1, shape=(4,), dtype=np.float32)
-        # Define the image part of the observation space
+        # Define the image part of the observation space. Images are raw grey
+        # values in [0, 255] and normalized by the policy, the bounds are kept
+        # as declared when the checkpoints were trained.
         self.image_obs_space = gym.spaces.Box(
             low=0, high=1, shape=(
-                300, 300), dtype=np.uint8)
+                image_size, image_size), dtype=np.uint8)
 
         # Combine them into a dictionary-based observation space
         self.observation_space = gym.spaces.Dict(
             {'numerical': self.numerical_obs_space,
              'image': self.image_obs_space})
 
+        # Observations are written into these buffers, see get_obs
+        self._obs_buffers = {
+            key: np.zeros(space.shape, dtype=space.dtype)
+            for key, space in self.observation_space.spaces.items()}
+        # Full resolution crop, only needed when downsampling
+        self._patch = np.zeros((obs_size, obs_size), dtype=np.uint8)
+        self._pooled = np.zeros((image_size, image_size), dtype=np.float32)
+
         # Define actions
         self.action_space = gym.spaces.MultiDiscrete([4])
 
@@ -42,23 +77,28 @@ class Environment(gym.Env):
             3: (0, 250),
         }
 
-        self.prev_movement_distance: float | None = None
-        self.prev_avoidance_distance: float | None = None
+        # Smoothing state of reward_function
+        self.reward_state = SmoothedReward(1)
+        # Leave the reward of running episodes to the caller, e.g. a batched
+        # VecEnv computing them for all of its envs at once
+        self.defer_reward = False
 
-        self.movement_reward_queue = deque()
-        self.avoidance_reward_queue = deque()
+        # Astroids closer than this contribute to the avoidance reward
+        self.vicinity = 130
+        self.asteroid_distances: np.ndarray = np.empty(0)
 
     def reset(self, seed=None):
+        # Seeding once makes all following episodes of this env reproducible
+        if seed is not None:
+            self.game.seed(seed)
+
         # Return the initial observation
         self.game.reset()
         self.game.custom_draw()
         self.game.dispatch_events()
         self.game.flip()
 
-        self.prev_movement_distance = None
-        self.prev_avoidance_distance = None
-        self.movement_reward_queue.clear()
-        self.avoidance_reward_queue.clear()
+        self.reward_state.reset()
 
         obs = self.get_obs()
         return obs, {}
@@ -66,6 +106,10 @@ class Environment(gym.Env):
     def close(self):
         self.game.close()
 
+    def set_curriculum(self, **params):
+        """ See Simulation.set_curriculum, e.g. via VecEnv.env_method """
+        self.game.set_curriculum(**params)
+
     def reward_function(self, obs: List) -> float:
         """
         Calculate the reward for an agent based on its movement towards a target 
@@ -90,75 +134,20 @@ class Environment(gym.Env):
         - The agent is punished for moving closer to asteroids and rewarded for moving away.
         - This reward is only active if an asteroid is within the vicinity of the agent.
 
-        The reward is a weighted sum of both rewards.
+        The reward is a weighted sum of both rewards. Both are smoothed with
+        their last 10 values, see SmoothedReward.
         """
 
-        ########################################################
-        ############### Rescuer movement reward ################
-        ########################################################
-
-        obs = obs["numerical"]
-        curr_dist = self._euclidean_distance(obs[0], obs[1], obs[2], obs[3])
-
-        if self.prev_movement_distance is not None:
-            progress = self.prev_movement_distance - curr_dist
-        else:
-            progress = 0
-        self.prev_movement_distance = curr_dist
-
-        num_movement_rewards = len(
-            self.movement_reward_queue) if self.movement_reward_queue else 1
-
-        # Maintain a maximum of 10 rewards in the queue
-        if num_movement_rewards == 10:
-            self.movement_reward_queue.popleft()
-        self.movement_reward_queue.append(progress)
-
-        # Calculate the average reward
-        total = sum(self.movement_reward_queue)
-        movement_reward = 0.5 * progress + 0.5 * (total / num_movement_rewards)
-
-        ########################################################
-        ############### Astroid avoidance reward ###############
-        ########################################################
-
-        rescuer: Rescuer = self.game.rescuer_list[0]
-        astroids: SpriteList = self.game.asteroids_list
-        distances = []
-
-        for astroid in astroids:
-            dist = self._get_distance_between_sprites(rescuer, astroid)
-            if dist < 130:
-                distances.append(dist)
-
-        if not distances:
-            # Clear list, since no astroids in vicinity
-            self.avoidance_reward_queue.clear()
-            progress = 0
-        else:
-            # Agent is rewarded if he moves away from astroid
-            curr_dist = min(distances)
-            if self.prev_avoidance_distance is not None:
-                progress = curr_dist - self.prev_avoidance_distance
-            else:
-                progress = 0
-            self.prev_avoidance_distance = curr_dist
-
-        num_avoidance_rewards = len(
-            self.avoidance_reward_queue) if self.avoidance_reward_queue else 1
-
-        # Maintain a maximum of 10 rewards in the queue
-        if num_avoidance_rewards == 10:
-            self.avoidance_reward_queue.popleft()
-        self.avoidance_reward_queue.append(progress)
-
-        total = sum(self.avoidance_reward_queue)
+        numerical = obs["numerical"]
+        return float(self.reward_state.step(
+            numerical[None, 0:2], numerical[None, 2:4],
+            [self.nearest_asteroid_distance()])[0])
 
-        avoidance_reward = 0.5 * progress + \
-            0.5 * (total / num_avoidance_rewards)
-
-        # Scaling to match magnitude
-        return 1000 * movement_reward + avoidance_reward
+    def nearest_asteroid_distance(self) -> float:
+        """ Distance to the closest astroid in the vicinity, else infinity """
+        distances = self.update_asteroid_distances()
+        distances = distances[distances < self.vicinity]
+        return float(distances.min()) if len(distances) else math.inf
 
     def step(self, actions: List[int]) -> Tuple:
         """
@@ -174,16 +163,33 @@ class Environment(gym.Env):
         Returns:
         Tuple: A tuple containing:
             - obs: Coordination information and image of vicinity
-            - reward: The reward obtained from the actions.
+            - reward: The reward obtained from the actions, None if
+            defer_reward is set and the episode goes on
             - done: A boolean indicating whether the episode has ended.
             - truncated: A boolean indicating whether the episode was truncated.
             - info: Additional information about the environment.
+
+        The actions are repeated for frame_skip physics steps, stopping early
+        once the episode ends. Only the final state is drawn and observed.
         """
-        reward = 0
         self.rescued_alfred = False
 
+        with profiler.phase("step"):
+            for _ in range(self.frame_skip):
+                self.queue_actions(actions)
+
+                with profiler.phase("custom_update"):
+                    made_mistake = self.game.custom_update()
+
+                if self.frame_ended(made_mistake):
+                    break
+
+            return self.finish_step(made_mistake)
+
+    def queue_actions(self, actions: List[int]):
+        """ Starts a frame of step, the game applies the actions on update """
         rescuer: Rescuer = self.game.rescuer_list[0]
-        has_carried_resource = rescuer.carries_resource
+        self._has_carried_resource = rescuer.carries_resource
 
         # Process all actions
         for action in actions:
@@ -192,16 +198,26 @@ class Environment(gym.Env):
                 'MOVEMENT', rescuer, force)
             self.game.action_list.append(movement_action)
 
-        made_mistake = self.game.custom_update()
-        self.game.custom_draw()
-        self.game.dispatch_events()
-        self.game.flip()
-
-        if has_carried_resource != rescuer.carries_resource and has_carried_resource:
+    def frame_ended(self, made_mistake: bool) -> bool:
+        """ Whether the frame of step, once updated, ended the episode """
+        rescuer: Rescuer = self.game.rescuer_list[0]
+        if self._has_carried_resource != rescuer.carries_resource and \
+                self._has_carried_resource:
             self.rescued_alfred = True
 
+        return made_mistake or self.rescued_alfred
+
+    def finish_step(self, made_mistake: bool) -> Tuple:
+        """ Draws and observes the last frame of step, returns as step """
+        with profiler.phase("custom_draw"):
+            self.game.custom_draw()
+        with profiler.phase("dispatch_events_flip"):
+            self.game.dispatch_events()
+            self.game.flip()
+
         done, obs, reward = self.decision(made_mistake)
-        info = {}
+        # Read by SB3 into its success rate, e.g. for curriculum.py
+        info = {"is_success": self.rescued_alfred} if done else {}
 
         return obs, reward, done, False, info
 
@@ -214,7 +230,8 @@ class Environment(gym.Env):
         Returns:
         Tuple:
             - obs: The current observation after performing the actions.
-            - reward: The reward obtained from the actions.
+            - reward: The reward obtained from the actions, None if
+            defer_reward is set and the episode goes on
             - done: A boolean indicating whether the episode has ended.
         """
 
@@ -224,8 +241,15 @@ class Environment(gym.Env):
             done = True
         else:
             done = self.rescued_alfred
-            obs = self.get_obs() if not done else {}
-            reward = self.reward_function(obs) if not done else 10
+            with profiler.phase("get_obs"):
+                obs = self.get_obs() if not done else {}
+            if done:
+                reward = 10
+            elif self.defer_reward:
+                reward = None
+            else:
+                with profiler.phase("reward_function"):
+                    reward = self.reward_function(obs)
 
         return done, obs, reward
 
@@ -234,40 +258,46 @@ class Environment(gym.Env):
         Returns: An observation of the environment in dict format.
         Dict:
             - numerical: Contains the information about the target and the agent's
-            current position
-            - image: Contains a grey scale image of the agent's vicinity. 
-            It is agent centered and of size 300x300
+            current position, normalized by the screen width
+            - image: Contains a grey scale uint8 image of the agent's vicinity.
+            It is agent centered, covers obs_size x obs_size pixels and is
+            downsampled by obs_downsample
+
+        The arrays are preallocated and overwritten by the next observation,
+        copy them to keep an observation around.
         """
-        rescuer: SpriteList = self.game.rescuer_list[0]
-        obs = []
+        rescuer: Rescuer = self.game.rescuer_list[0]
 
         if rescuer.carries_resource:
-            mothership: Sprite = self.game.mother_ship_list[0]
-            obs = [mothership.center_x,
-                   mothership.center_y,
-                   rescuer.center_x,
-                   rescuer.center_y]
+            target: Sprite = self.game.mother_ship_list[0]
         else:
-            alien: Sprite = self.game.alien_list[0]
-            obs = [alien.center_x,
-                   alien.center_y,
-                   rescuer.center_x,
-                   rescuer.center_y]
-
-        image_data = self.game.get_image(
-            rescuer.center_x - 150,
-            rescuer.center_y - 150,
-            300,
-            300)
-
-        image_data = image_data.convert("L")
-        image_data = np.array(image_data)
-
-        return {
-            "numerical": np.array(obs) /
-            self.screen_width,
-            "image": image_data /
-            255.0}
+            target: Sprite = self.game.alien_list[0]
+
+        numerical = self._obs_buffers["numerical"]
+        numerical[0] = target.center_x
+        numerical[1] = target.center_y
+        numerical[2] = rescuer.center_x
+        numerical[3] = rescuer.center_y
+        numerical /= self.screen_width
+
+        image = self._obs_buffers["image"]
+        half = self.obs_size // 2
+        with profiler.phase("get_patch"):
+            patch = self.game.get_patch(
+                rescuer.center_x - half,
+                rescuer.center_y - half,
+                self.obs_size,
+                self.obs_size,
+                out=image if self.obs_downsample == 1 else self._patch)
+
+        if self.obs_downsample > 1:
+            # Block average, i.e. the crop as seen at a lower resolution
+            size, d = image.shape[0], self.obs_downsample
+            patch.reshape(size, d, size, d).mean(axis=(1, 3), out=self._pooled)
+            np.rint(self._pooled, out=self._pooled)
+            np.copyto(image, self._pooled, casting="unsafe")
+
+        return self._obs_buffers
 
     def _euclidean_distance(self, x1, y1, x2, y2):
         return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
@@ -281,19 +311,27 @@ class Environment(gym.Env):
             mothership.center_x,
             mothership.center_y)
 
-    def _get_distance_between_sprites(self, rescuer: Rescuer, astroid: Sprite):
-        # Get the points on the edges of the hitboxes
-        points1 = rescuer.get_adjusted_hit_box()
-        points2 = astroid.get_adjusted_hit_box()
-
-        min_distance = float('inf')
+    def update_asteroid_distances(self) -> np.ndarray:
+        """
+        Computes the distances between the hit boxes of the rescuer and all
+        astroids in one go. Astroids which are certainly outside of the
+        vicinity, according to the game's asteroid_index, are culled and
+        reported as infinitely far away.
 
-        # Calculate the shortest distance between any point on sprite1 and any
-        # point on sprite2
-        for point1 in points1:
-            for point2 in points2:
-                distance = math.dist(point1, point2)
-                if distance < min_distance:
-                    min_distance = distance
+        Returns:
+        np.ndarray: Per astroid distance, also kept in self.asteroid_distances
+        """
+        rescuer: Rescuer = self.game.rescuer_list[0]
+        astroids: SpriteList = self.game.asteroids_list
 
-        return min_distance
+        # Only astroids the spatial index finds near the rescuer are measured
+        nearby = self.game.asteroid_index.query_radius(
+            rescuer.center_x, rescuer.center_y,
+            bounding_radius(rescuer) + self.vicinity)
+        self.asteroid_distances = np.full(len(astroids), np.inf)
+        if len(nearby):
+            self.asteroid_distances[nearby] = min_distances(
+                np.array(rescuer.get_adjusted_hit_box()),
+                hit_box_polygons([astroids[i] for i in nearby.tolist()]),
+                cutoff=self.vicinity)
+        return self.asteroid_distances
@@ -0,0 +1,221 @@
+import argparse
+import glob
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+
+from typing import Callable, Dict, List
+
+'''
+Reproduces the README evaluation: every agent is granted a budget of actions,
+every finished run counts and a run succeeds once Alfred is delivered. The
+budget is split over worker processes, each playing its own seeded games.
+Checkpoints sample their actions as PPO.predict does, from a generator
+seeded per worker.
+'''
+
+RANDOM_AGENT = "random"
+
+# The README's evaluation ran 4 astroids at the speed of the last checkpoint
+README_ASTROIDS = 4
+README_ASTROID_SPEED = (80, 150)
+
+
+def wilson_interval(successes: int, trials: int, z: float = 1.96) -> List[float]:
+    """ Confidence interval of a rate, 95% by default """
+    if trials == 0:
+        return [0.0, 1.0]
+    rate = successes / trials
+    denominator = 1 + z ** 2 / trials
+    center = (rate + z ** 2 / (2 * trials)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / trials
+                           + z ** 2 / (4 * trials ** 2)) / denominator
+    return [max(0.0, center - margin), min(1.0, center + margin)]
+
+
+def play(env, act: Callable, num_actions: int, seed: int) -> Dict[str, int]:
+    """
+    Steps an environment for a fixed number of actions.
+
+    Parameters:
+    env (Environment): Environment to play in
+    act (Callable): Maps an observation to an action
+    num_actions (int): Action budget
+    seed (int): Seed of the first reset, later episodes follow from it
+
+    Returns:
+    Dict: Counts of runs, successes and the game's pick up, delivery and
+    collision counters over the budget
+    """
+    game = env.game
+    obs = env.reset(seed=seed)[0]
+    pick_up, delivery, collision = game.pick_up, game.delivery, game.collision
+
+    runs = successes = 0
+    for _ in range(num_actions):
+        obs, _, done = env.step(act(obs))[0:3]
+        if done:
+            runs += 1
+            successes += env.rescued_alfred
+            obs = env.reset()[0]
+
+    return {"actions": num_actions,
+            "runs": runs,
+            "successes": successes,
+            "pick_ups": game.pick_up - pick_up,
+            "deliveries": game.delivery - delivery,
+            "collisions": game.collision - collision}
+
+
+def model_actor(model, seed: int, deterministic: bool = False) -> Callable:
+    """
+    Action function of an export.ActionModel, or a compressed variant of it.
+
+    Parameters:
+    seed (int): Seed of the generator actions are sampled with
+    deterministic (bool): Whether to take the most likely actions instead of
+    sampling them, as PPO.predict does by default
+    """
+    import torch
+    from policy_runtime import actions_from_logits
+    from profiling import profiler
+
+    rng = None if deterministic else np.random.default_rng(seed)
+
+    def act(obs):
+        with torch.inference_mode(), profiler.phase("policy_inference"):
+            logits = model(
+                torch.as_tensor(obs["numerical"], dtype=torch.float32)[None],
+                torch.as_tensor(obs["image"])[None]).numpy()
+        return actions_from_logits(logits, model.action_dims, rng)[0]
+    return act
+
+
+def load_agent(agent: str, seed: int, deterministic: bool = False) -> Callable:
+    """ Action function of a checkpoint, or of the random baseline """
+    if agent == RANDOM_AGENT:
+        rng = np.random.default_rng(seed)
+        return lambda obs: rng.integers(0, 4, size=1)
+
+    from stable_baselines3 import PPO
+    from export import ActionModel
+
+    model = ActionModel(PPO.load(agent, device="cpu").policy).eval()
+    return model_actor(model, seed, deterministic)
+
+
+def _worker(agent: str, num_actions: int, seed: int, env_kwargs: Dict,
+            curriculum: Dict, deterministic: bool) -> Dict:
+    import torch
+    from env import Environment
+
+    # Parallelism comes from the processes
+    torch.set_num_threads(1)
+    env = Environment(**env_kwargs)
+    env.set_curriculum(**curriculum)
+    try:
+        return play(env, load_agent(agent, seed, deterministic), num_actions, seed)
+    finally:
+        env.close()
+
+
+def evaluate(agent: str, num_actions: int = 50000, num_workers: int = 4,
+             seed: int = 0, env_kwargs: Dict | None = None,
+             curriculum: Dict | None = None, deterministic: bool = False) -> Dict:
+    """
+    Parameters:
+    agent (str): Checkpoint path or 'random'
+    num_actions (int): Total action budget, split evenly over the workers
+    num_workers (int): Number of worker processes
+    seed (int): Worker i plays games seeded with seed + i
+    curriculum (Dict): Arguments of Simulation.set_curriculum, e.g.
+    num_astroids, the game's defaults if None
+    deterministic (bool): Take the most likely actions instead of sampling
+    them with the worker's seeded generator
+
+    Returns:
+    Dict: Aggregated counts, success and collision rates with 95% Wilson
+    confidence intervals, and the per worker results
+    """
+    env_kwargs = dict(screen_width=512, screen_height=512,
+                      screen_title="RescueAI", renderer="software",
+                      **(env_kwargs or {}))
+    budgets = [num_actions // num_workers + (i < num_actions % num_workers)
+               for i in range(num_workers)]
+    seeds = [seed + i for i in range(num_workers)]
+
+    start = time.perf_counter()
+    ctx = mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods()
+                         else "spawn")
+    with ctx.Pool(num_workers) as pool:
+        results = pool.starmap(
+            _worker, [(agent, budget, worker_seed, env_kwargs, curriculum or {},
+                       deterministic)
+                      for budget, worker_seed in zip(budgets, seeds)])
+
+    totals = {key: sum(result[key] for result in results) for key in results[0]}
+    runs = totals["runs"]
+    return {
+        "agent": agent,
+        **totals,
+        "success_rate": totals["successes"] / runs if runs else 0.0,
+        "success_rate_ci95": wilson_interval(totals["successes"], runs),
+        "collision_rate": totals["collisions"] / runs if runs else 0.0,
+        "collision_rate_ci95": wilson_interval(min(totals["collisions"], runs), runs),
+        "workers": num_workers,
+        "seeds": seeds,
+        "curriculum": curriculum or {},
+        "deterministic": deterministic,
+        "wall_time_s": time.perf_counter() - start,
+        "per_worker": results}
+
+
+def main():
+    '''
+    Evaluates checkpoints and the random baseline, e.g.
+    python evaluate.py checkpoints/ckpt_3 random --workers 8 --output report.json
+    Passing 'all' evaluates every checkpoint under checkpoints/.
+    '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("agents", nargs="+",
+                        help="Checkpoint paths, 'random' or 'all'")
+    parser.add_argument("--actions", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--astroids", type=int, default=README_ASTROIDS,
+                        help="Number of astroids")
+    parser.add_argument("--astroid-speed", type=int, nargs=2,
+                        default=README_ASTROID_SPEED, metavar=("LOW", "HIGH"))
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Take the most likely actions instead of sampling, "
+                             "the README's results were sampled")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+    curriculum = {"num_astroids": args.astroids,
+                  "astroid_speed": tuple(args.astroid_speed)}
+
+    agents = []
+    for agent in args.agents:
+        if agent == "all":
+            agents += sorted(glob.glob("checkpoints/*.zip"))
+        else:
+            agents.append(agent)
+
+    report = []
+    for agent in agents:
+        result = evaluate(agent, args.actions, args.workers, args.seed,
+                          curriculum=curriculum, deterministic=args.deterministic)
+        summary = {key: value for key, value in result.items() if key != "per_worker"}
+        print(json.dumps(summary))
+        report.append(result)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import torch
+import torch.nn as nn
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.policies import ActorCriticPolicy
+
+
+class ActionModel(nn.Module):
+    """
+    The action path of an ActorCriticPolicy as a plain module.
+
+    Takes the raw observation tensors, i.e. normalized numerical values and
+    uint8 images, and returns the action logits of all action dimensions,
+    concatenated as in SB3's MultiCategorical distribution. Actions are
+    sampled from them, or taken as their argmax, by
+    policy_runtime.actions_from_logits. The value head and the distribution
+    objects are left out.
+    """
+
+    def __init__(self, policy: ActorCriticPolicy):
+        super().__init__()
+        self.features_extractor = policy.pi_features_extractor
+        self.policy_net = policy.mlp_extractor.policy_net
+        self.action_net = policy.action_net
+        self.action_dims = [int(n) for n in policy.action_space.nvec]
+
+    def forward(self, numerical: torch.Tensor, image: torch.Tensor) -> torch.Tensor:
+        features = self.features_extractor(
+            {"numerical": numerical.float(), "image": image.float()})
+        return self.action_net(self.policy_net(features))
+
+
+def export(checkpoint: str, output: str, onnx: bool = True) -> list:
+    """
+    Exports a PPO checkpoint to TorchScript and ONNX. Both artifacts output
+    the action logits and carry the sizes of the action dimensions as
+    'action_dims' metadata, see policy_runtime.ExportedPolicy.
+
+    Parameters:
+    checkpoint (str): Path of the SB3 checkpoint, e.g. checkpoints/ckpt_3
+    output (str): Path prefix of the artifacts, '.pt' and '.onnx' are appended
+    onnx (bool): Whether to also write the ONNX model
+
+    Returns:
+    list: Paths of the written artifacts
+    """
+    model = PPO.load(checkpoint, device="cpu")
+    action_model = ActionModel(model.policy).eval()
+
+    spaces = model.observation_space.spaces
+    example = (torch.zeros((1, *spaces["numerical"].shape), dtype=torch.float32),
+               torch.zeros((1, *spaces["image"].shape), dtype=torch.uint8))
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    paths = []
+    action_dims = json.dumps(action_model.action_dims)
+
+    with torch.inference_mode():
+        scripted = torch.jit.trace(action_model, example)
+        scripted = torch.jit.freeze(scripted)
+    torch.jit.save(scripted, output + ".pt",
+                   _extra_files={"action_dims": action_dims})
+    paths.append(output + ".pt")
+
+    if onnx:
+        import onnx as onnx_lib
+
+        torch.onnx.export(
+            action_model,
+            example,
+            output + ".onnx",
+            input_names=["numerical", "image"],
+            output_names=["logits"],
+            dynamic_axes={"numerical": {0: "batch"},
+                          "image": {0: "batch"},
+                          "logits": {0: "batch"}},
+            dynamo=False)
+        exported = onnx_lib.load(output + ".onnx")
+        onnx_lib.helper.set_model_props(exported, {"action_dims": action_dims})
+        onnx_lib.save(exported, output + ".onnx")
+        paths.append(output + ".onnx")
+
+    return paths
+
+
+def main():
+    '''
+    Exports a checkpoint for serving with policy_runtime, e.g.
+    python export.py checkpoints/ckpt_3 exported/ckpt_3
+    '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("checkpoint")
+    parser.add_argument("output")
+    parser.add_argument("--no-onnx", action="store_true")
+    args = parser.parse_args()
+
+    for path in export(args.checkpoint, args.output, onnx=not args.no_onnx):
+        print("Exported " + path)
+
+
+if __name__ == "__main__":
+    main()
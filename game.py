@@ -1,11 +1,28 @@
 import math
+import os
 import random
+import struct
+import sys
+
+# Without an X server arcade has to run on EGL, which it only picks when the
+# variable is set before its import
+if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+    os.environ.setdefault("ARCADE_HEADLESS", "1")
+
 import arcade
+import numpy as np
+import pymunk
 
-from typing import List
+from typing import List, Tuple
 from arcade.pymunk_physics_engine import PymunkPhysicsEngine
 from arcade import SpriteList, Sprite
+from physics import NumpyPhysicsEngine, PymunkBackend, make_physics_engine
 from auxilary import Rescuer, Action, Move, Resource
+from assets import assets
+from profiling import profiler
+from rasterizer import SoftwareRasterizer
+from spatial_index import UniformGrid, bounding_radius
+from recorder import EpisodeRecorder
 
 '''
 Code skeleton from Python Arcade:
@@ -13,13 +30,37 @@ https://api.arcade.academy/en/latest/
 '''
 
 
-class Game(arcade.Window):
-    """ Main Game """
-
-    def __init__(self, width, height, title):
-        """ Init """
-        super().__init__(width, height, title, visible=True)
-
+# Borders astroids can enter from
+ASTROID_BORDERS = ("top", "bottom", "left", "right")
+
+# Layout of snapshots, all little endian
+_SNAPSHOT_VERSION = 1
+# version, pick ups, deliveries, collisions, carries resource, alien alive,
+# number of astroids
+_HEADER = struct.Struct("<HIII??H")
+# Mersenne Twister state and the cached gaussian, NaN if there is none
+_RNG_STATE = struct.Struct("<625Id")
+# position, angle, velocity, angular velocity, pending force
+_BODY = struct.Struct("<8d")
+# texture index, scale, moment of inertia
+_ASTROID = struct.Struct("<Bdd")
+# rescuer health, position of the carried resource
+_RESCUER = struct.Struct("<3d")
+
+
+class Simulation:
+    """ Game state and physics, independent of how the game is rendered """
+
+    # Textures astroids are drawn from
+    _astroid_textures = ("textures/astroid_1.png",
+                         "textures/astroid_1.png")
+
+    def __init__(self, width, height, physics: str = "pymunk"):
+        """
+        Parameters:
+        physics (str): Physics backend, see make_physics_engine
+        """
+        self.physics = physics
         self.background = arcade.load_texture(
             "textures/background.png")
 
@@ -30,7 +71,7 @@ class Game(arcade.Window):
         self.asteroids_list: SpriteList
         self.wall_list: SpriteList
 
-        self.physics_engine: PymunkPhysicsEngine
+        self.physics_engine: PymunkBackend | NumpyPhysicsEngine
 
         self.action_list: List[Action] = []
 
@@ -41,8 +82,76 @@ class Game(arcade.Window):
         self._sprite_image_size = 128
         self._sprite_size = int(self._sprite_scaling * self._sprite_image_size)
 
-        self.frames = []
-        self.num = 0
+        # Recording is opt-in, see enable_recording
+        self.recorder: EpisodeRecorder | None = None
+
+        # Every game draws from its own stream, see seed
+        self.rng = random.Random()
+        # Whether the next reset starts a seeded episode, see reset
+        self._seeded = False
+
+        # Curriculum parameters of the astroids, see set_curriculum
+        self.num_astroids = 8
+        self.astroid_borders = ASTROID_BORDERS
+        # Respawned astroids are 40 pixels wide, closer to the border they
+        # would not fit on screen, see set_curriculum
+        self.astroid_margin = (20, 50)
+        self.astroid_speed = (50, 100)
+
+        # Bounding circles of all astroids, see update_asteroid_index
+        self.asteroid_index = UniformGrid(width, height)
+
+    def seed(self, seed: int | None = None):
+        """ Reseeds the game's random number generator """
+        self.rng.seed(seed)
+        self._seeded = True
+
+    def set_curriculum(self, num_astroids: int | None = None,
+                       astroid_borders: Tuple[str, ...] | None = None,
+                       astroid_margin: Tuple[int, int] | None = None,
+                       astroid_speed: Tuple[int, int] | None = None):
+        """
+        Adjusts the difficulty, parameters left out keep their value. The
+        number of astroids applies from the next reset, the others from the
+        next spawn.
+
+        Parameters:
+        num_astroids (int): Size of the astroid pool
+        astroid_borders (tuple): Borders astroids enter from, a subset of
+        ASTROID_BORDERS
+        astroid_margin (tuple): Bounds of the spawn distance from the border,
+        respawned astroids have to fit between the border and the opposite one
+        astroid_speed (tuple): Bounds of the per axis push towards the center,
+        an impulse on respawn and a force on reset
+        """
+        if num_astroids is not None:
+            if num_astroids < 0:
+                raise ValueError("num_astroids must not be negative")
+            self.num_astroids = num_astroids
+        if astroid_borders is not None:
+            if not astroid_borders or not set(astroid_borders) <= set(ASTROID_BORDERS):
+                raise ValueError(f"astroid_borders must be a subset of {ASTROID_BORDERS}")
+            # Kept in the canonical order, so equal sets draw equally
+            self.astroid_borders = tuple(
+                border for border in ASTROID_BORDERS if border in astroid_borders)
+        for name, bounds in (("astroid_margin", astroid_margin),
+                             ("astroid_speed", astroid_speed)):
+            if bounds is not None:
+                low, high = bounds
+                if not 0 <= low <= high:
+                    raise ValueError(f"{name} must be bounds 0 <= low <= high")
+                if name == "astroid_margin":
+                    self._check_astroid_margin(low, high)
+                setattr(self, name, (int(low), int(high)))
+
+    def _check_astroid_margin(self, low, high):
+        """ Respawned astroids have to fit on screen at any margin """
+        half_extent = self._astroid_half_extent()
+        if low < half_extent or high > min(self.width, self.height) - half_extent:
+            raise ValueError(
+                f"astroid_margin must lie within [{half_extent:g}, "
+                f"{min(self.width, self.height) - half_extent:g}], where "
+                "respawned astroids are fully on screen")
 
     def setup(self):
 
@@ -50,142 +159,35 @@ class Game(arcade.Window):
         self.mother_ship_list = SpriteList(use_spatial_hash=True)
         self.alien_list = SpriteList()
         self.resource_list = SpriteList()
-        self.asteroids_list = SpriteList(use_spatial_hash=True)
+        # Collision and vicinity queries go through asteroid_index instead
+        self.asteroids_list = SpriteList()
         self.wall_list = SpriteList(use_spatial_hash=True)
 
         self.pick_up = 0
         self.delivery = 0
         self.collision = 0
 
-    def reset(self):
-        self.rescuer_list.clear()
-        self.mother_ship_list.clear()
-        self.alien_list.clear()
-        self.resource_list.clear()
-        self.asteroids_list.clear()
-        self.wall_list.clear()
-
-        # Create first rescuer
-        rescuer: Sprite = Rescuer(
-            filename="textures/rescuer.png",
-            scale=self._sprite_scaling,
-            center_x=self._get_random_coord(
-                lb=100),
-            center_y=self._get_random_coord(
-                lb=100),
-            health=5)
-        self.rescuer_list.append(rescuer)
-
-        mothership_x, mothership_y, alien_x, alien_y = self._no_overlapping_coords()
-
-        # Provide the mothership
-        mothership: Sprite = Sprite(
-            filename="textures/mothership.png",
-            scale=self._sprite_scaling / 2,
-            center_x=mothership_x,
-            center_y=mothership_y)
-
-        self.mother_ship_list.append(mothership)
-
-        # Provide the alien, Alfred
-        alien: Sprite = Sprite(
-            filename="textures/alfred.png",
-            scale=self._sprite_scaling / 2.5,
-            center_x=alien_x,
-            center_y=alien_y)
-
-        self.alien_list.append(alien)
-
-        for _ in range(8):
-            # Provide the the astroids
-            texture_name = self._get_random_astroid_texture()
-            start_x, start_y = self._get_random_astroid_coord()
-            scaling = random.randint(1, 3)
-            astroid: Sprite = Sprite(
-                filename=texture_name,
-                scale=self._sprite_scaling / 1.5 * scaling,
-                center_x=start_x,
-                center_y=start_y)
-
-            self.asteroids_list.append(astroid)
-
-        # Set up the walls
-        for x in range(0, self.width + 1, self._sprite_size):
-            wall = arcade.Sprite(":resources:images/tiles/brickGrey.png",
-                                 self._sprite_scaling)
-            wall.center_x = x
-            wall.center_y = 0
-            self.wall_list.append(wall)
-
-            wall = arcade.Sprite(":resources:images/tiles/brickGrey.png",
-                                 self._sprite_scaling)
-            wall.center_x = x
-            wall.center_y = self.height
-            self.wall_list.append(wall)
-
-        # Set up the walls
-        for y in range(self._sprite_size, self.height, self._sprite_size):
-            wall = arcade.Sprite(":resources:images/tiles/brickGrey.png",
-                                 self._sprite_scaling)
-            wall.center_x = 0
-            wall.center_y = y
-            self.wall_list.append(wall)
-
-            wall = arcade.Sprite(":resources:images/tiles/brickGrey.png",
-                                 self._sprite_scaling)
-            wall.center_x = self.width
-            wall.center_y = y
-            self.wall_list.append(wall)
-
         # ---------------------------------------------------------------------------------------------------
         # --------------------------------Pymunk Physics Engine Setup ---------
         # ---------------------------------------------------------------------------------------------------
+        # The physics world, the walls and the collision handlers persist
+        # across episodes, reset only moves the dynamic bodies
         damping = 1
         gravity = (0, 0)
 
-        self.physics_engine = PymunkPhysicsEngine(damping=damping,
+        self.physics_engine = make_physics_engine(self.physics,
+                                                  damping=damping,
                                                   gravity=gravity)
 
-        # Add rescuer to physics engine
-        for rescuer in self.rescuer_list:
-            self.physics_engine.add_sprite(
-                rescuer,
-                friction=0.2,
-                moment_of_inertia=PymunkPhysicsEngine.MOMENT_INF,
-                damping=1,
-                collision_type="rescuer",
-                max_velocity=400)
-
-        # Add mothership to physics engine
-        self.physics_engine.add_sprite_list(
-            self.mother_ship_list,
-            friction=0.2,
-            collision_type="mothership",
-            body_type=PymunkPhysicsEngine.STATIC)
-
-        # Add alien to physics engine
-        for alien in self.alien_list:
-            self.physics_engine.add_sprite(
-                alien,
-                friction=0.0,
-                moment_of_inertia=PymunkPhysicsEngine.DYNAMIC,
-                damping=0.9,
-                collision_type="alien",
-                max_velocity=400)
-
-        # Add alien to physics engine
-        for astroid in self.asteroids_list:
-            self.physics_engine.add_sprite(
-                astroid,
-                friction=0.0,
-                moment_of_inertia=PymunkPhysicsEngine.DYNAMIC,
-                damping=1,
-                collision_type="astroid",
-                max_velocity=400)
+        # Set up the walls
+        for x in range(0, self.width + 1, self._sprite_size):
+            self.wall_list.append(self._get_wall(x, 0))
+            self.wall_list.append(self._get_wall(x, self.height))
 
-        for astroid in self.asteroids_list:
-            self.physics_engine.apply_force(
-                astroid, self._get_random_force(astroid))
+        # Set up the walls
+        for y in range(self._sprite_size, self.height, self._sprite_size):
+            self.wall_list.append(self._get_wall(0, y))
+            self.wall_list.append(self._get_wall(self.width, y))
 
         # Add walls to physics engine
         self.physics_engine.add_sprite_list(
@@ -198,15 +200,9 @@ class Game(arcade.Window):
                 sprite_a, sprite_b, arbiter, space, data):
             """ Called for rescuer/alien collision """
 
-            # Retrieve rescuer considered in the collision
-            rescuer = arbiter.shapes[0]
-            alien = arbiter.shapes[1]
-
-            rescuer: Rescuer = self.physics_engine.get_sprite_for_shape(
-                rescuer)
-
-            alien: Sprite = self.physics_engine.get_sprite_for_shape(
-                alien)
+            # Sprites arrive in the order the handler was registered with
+            rescuer: Rescuer = sprite_a
+            alien: Sprite = sprite_b
 
             # Check if the rescuer is free to carry a resource
             if not rescuer.carries_resource:
@@ -215,8 +211,9 @@ class Game(arcade.Window):
                 rescuer.carries_resource = True
 
                 # Instantiate new resource to be carried
-                resource: Resource = Resource(
-                    filename="textures/alfred.png",
+                resource: Resource = assets.acquire(
+                    Resource,
+                    "textures/alfred.png",
                     scale=self._sprite_scaling / 3,
                     center_x=rescuer.center_x,
                     center_y=rescuer.center_y)
@@ -230,15 +227,14 @@ class Game(arcade.Window):
                 self.resource_list.append(resource)
 
                 rescuer.resource_carried = resource
-                alien.remove_from_sprite_lists()
+                assets.release(alien)
 
         def rescuer_mother_ship_collision_handler(
                 sprite_a, sprite_b, arbiter, space, data):
             """ Called for rescuer/mother_shipt collision """
 
             # Retrieve rescuer considered in the collision
-            rescuer: Rescuer = arbiter.shapes[0]
-            rescuer = self.physics_engine.get_sprite_for_shape(rescuer)
+            rescuer: Rescuer = sprite_a
 
             # Check if rescuer is carrying resources when it touches the head
             # quarter
@@ -249,45 +245,322 @@ class Game(arcade.Window):
 
                 # Let resource disappear, as it has been delivered
                 resource: Resource = rescuer.resource_carried
-                resource.remove_from_sprite_lists()
+                assets.release(resource)
 
                 rescuer.resource_carried = None
 
         def ignore_collision(sprite_a, sprite_b, arbiter, space, data):
             return False
 
-        self.physics_engine.add_collision_handler(
-            "wall",
-            "astroid",
-            begin_handler=ignore_collision)
+        # Kept to register them again whenever the space is rebuilt
+        self._collision_handlers = [
+            ("wall", "astroid", dict(begin_handler=ignore_collision)),
+            ("rescuer", "alien",
+             dict(post_handler=rescuer_alien_collision_handler)),
+            ("rescuer", "mothership",
+             dict(post_handler=rescuer_mother_ship_collision_handler))]
 
-        self.physics_engine.add_collision_handler(
-            "rescuer",
-            "alien",
-            post_handler=rescuer_alien_collision_handler)
-        self.physics_engine.add_collision_handler(
-            "rescuer", "mothership", post_handler=rescuer_mother_ship_collision_handler)
+        for first_type, second_type, handlers in self._collision_handlers:
+            self.physics_engine.add_collision_handler(
+                first_type, second_type, **handlers)
+
+    def reset(self):
+        if self.recorder is not None:
+            self.recorder.start_episode()
+
+        # The carried resource is the only sprite without a body
+        assets.release_list(self.resource_list)
+
+        # Provide the rescuer
+        rescuer_x = self._get_random_coord(lb=100)
+        rescuer_y = self._get_random_coord(lb=100)
+        if self.rescuer_list:
+            rescuer: Rescuer = self.rescuer_list[0]
+            self.physics_engine.place(rescuer, rescuer_x, rescuer_y)
+        else:
+            rescuer: Rescuer = assets.acquire(
+                Rescuer,
+                "textures/rescuer.png",
+                scale=self._sprite_scaling,
+                center_x=rescuer_x,
+                center_y=rescuer_y)
+            self.rescuer_list.append(rescuer)
+            self.physics_engine.add_sprite(
+                rescuer,
+                friction=0.2,
+                moment_of_inertia=PymunkPhysicsEngine.MOMENT_INF,
+                damping=1,
+                collision_type="rescuer",
+                max_velocity=400)
+        rescuer.health = 5
+        rescuer.carries_resource = False
+        rescuer.resource_carried = None
+
+        mothership_x, mothership_y, alien_x, alien_y = self._no_overlapping_coords()
+
+        # Provide the mothership
+        if self.mother_ship_list:
+            self.physics_engine.place(self.mother_ship_list[0], mothership_x, mothership_y)
+        else:
+            mothership: Sprite = assets.acquire(
+                Sprite,
+                "textures/mothership.png",
+                scale=self._sprite_scaling / 2,
+                center_x=mothership_x,
+                center_y=mothership_y)
+            self.mother_ship_list.append(mothership)
+            self.physics_engine.add_sprite(
+                mothership,
+                friction=0.2,
+                collision_type="mothership",
+                body_type=PymunkPhysicsEngine.STATIC)
+
+        # Provide the alien, Alfred. It loses its body when being picked up
+        if self.alien_list:
+            self.physics_engine.place(self.alien_list[0], alien_x, alien_y)
+        else:
+            self._add_alien(alien_x, alien_y)
+
+        for i in range(self.num_astroids):
+            # Provide the the astroids, recycling the bodies of the last episode
+            texture_name = self._get_random_astroid_texture()
+            start_x, start_y = self._get_random_astroid_coord()
+            scaling = self.rng.randint(1, 3)
+            scale = self._sprite_scaling / 1.5 * scaling
+            if i < len(self.asteroids_list):
+                astroid: Sprite = self.asteroids_list[i]
+                if astroid.texture is not assets.texture(texture_name) or \
+                        astroid.scale != scale:
+                    assets.retexture(astroid, texture_name, scale)
+                    self.physics_engine.reshape(astroid)
+                else:
+                    # The moment reshape gives, respawns change it
+                    self.physics_engine.set_moment(astroid, pymunk.moment_for_box(
+                        1, (astroid.width, astroid.height)))
+                self.physics_engine.place(astroid, start_x, start_y)
+            else:
+                self._add_astroid(texture_name, scale, start_x, start_y,
+                                  PymunkPhysicsEngine.DYNAMIC)
+
+        for astroid in self.asteroids_list[self.num_astroids:]:
+            assets.release(astroid)
+
+        for astroid in self.asteroids_list:
+            self.physics_engine.apply_force(
+                astroid, self._get_random_force(astroid))
+
+        # Only seeded episodes have to replay exactly, the others keep the
+        # space, which saves building a new one every episode
+        if self._seeded:
+            self._seeded = False
+            self._rebuild_space()
+        self.update_asteroid_index()
+
+    def _add_alien(self, x, y) -> Sprite:
+        alien: Sprite = assets.acquire(
+            Sprite,
+            "textures/alfred.png",
+            scale=self._sprite_scaling / 2.5,
+            center_x=x,
+            center_y=y)
+        self.alien_list.append(alien)
+        self.physics_engine.add_sprite(
+            alien,
+            friction=0.0,
+            moment_of_inertia=PymunkPhysicsEngine.DYNAMIC,
+            damping=0.9,
+            collision_type="alien",
+            max_velocity=400)
+        return alien
+
+    def _add_astroid(self, texture_name: str, scale: float, x, y,
+                     moment_of_inertia: float) -> Sprite:
+        astroid: Sprite = assets.acquire(
+            Sprite,
+            texture_name,
+            scale=scale,
+            center_x=x,
+            center_y=y)
+        self.asteroids_list.append(astroid)
+        self.physics_engine.add_sprite(
+            astroid,
+            friction=0.0,
+            moment_of_inertia=moment_of_inertia,
+            damping=1,
+            collision_type="astroid",
+            max_velocity=400)
+        return astroid
 
     # ---------------------------------------------------------------------------------------------------
-    # ---------------------------------------- UPDATE HANDLING ---------------
+    # ---------------------------------------- SNAPSHOTS ---------------------
     # ---------------------------------------------------------------------------------------------------
 
-    def custom_draw(self):
-        arcade.start_render()
-        # arcade.set_background_color(arcade.color.BLACK)
-        arcade.draw_lrwh_rectangle_textured(
-            0, 0, self.width, self.height, self.background)
-        self.rescuer_list.draw()
-        self.mother_ship_list.draw()
-        self.alien_list.draw()
-        self.resource_list.draw()
-        self.asteroids_list.draw()
+    def snapshot(self) -> bytes:
+        """
+        Captures the game state in a compact binary struct, about 3 KB.
+
+        Returns:
+        bytes: Counters, carry state, the state of the random number generator
+        and position, angle, velocities and pending forces of every body.
+
+        Restoring the same snapshot and replaying the same actions always
+        yields the same trajectory, with pymunk if restore rebuilds the
+        physics space. It may drift slightly from the run the snapshot was
+        taken in, since pymunk does not expose the solver's contact cache and
+        bias velocities, which restore clears instead.
+        """
+        rescuer: Rescuer = self.rescuer_list[0]
+        resource: Resource | None = rescuer.resource_carried
+        _, rng_state, gauss_next = self.rng.getstate()
+
+        parts = [
+            _HEADER.pack(_SNAPSHOT_VERSION, self.pick_up, self.delivery,
+                         self.collision, rescuer.carries_resource,
+                         len(self.alien_list) > 0, len(self.asteroids_list)),
+            _RNG_STATE.pack(*rng_state,
+                            math.nan if gauss_next is None else gauss_next),
+            _RESCUER.pack(rescuer.health,
+                          resource.center_x if resource else 0,
+                          resource.center_y if resource else 0),
+            self._pack_body(rescuer),
+            self._pack_body(self.mother_ship_list[0])]
+
+        if self.alien_list:
+            parts.append(self._pack_body(self.alien_list[0]))
 
-        frame = arcade.get_image()
-        self.frames.append(frame)
+        for astroid in self.asteroids_list:
+            texture_index = next(
+                i for i, name in enumerate(self._astroid_textures)
+                if assets.texture(name) is astroid.texture)
+            parts.append(_ASTROID.pack(texture_index, astroid.scale,
+                                       self.physics_engine.get_moment(astroid)))
+            parts.append(self._pack_body(astroid))
+
+        return b"".join(parts)
+
+    def restore(self, snapshot: bytes, rebuild: bool = False):
+        """
+        Returns the game to the state captured by snapshot. Bodies and sprites
+        are recycled, only astroids whose texture or scale differ get a new
+        shape.
+
+        Parameters:
+        rebuild (bool): Rebuild the physics space even if the snapshot has the
+        same bodies. Bodies are otherwise updated in place, which with pymunk
+        may order the solver's collision pairs differently and let a replay
+        drift by rounding errors, see PymunkBackend.forget_contacts
+        """
+        version, pick_up, delivery, collision, carries_resource, alien_alive, \
+            num_astroids = _HEADER.unpack_from(snapshot)
+        if version != _SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        # The astroid pool or the alien coming or going changes the bodies
+        rebuild = rebuild or num_astroids != len(self.asteroids_list) or \
+            alien_alive != (len(self.alien_list) > 0)
+        offset = _HEADER.size
+
+        *rng_state, gauss_next = _RNG_STATE.unpack_from(snapshot, offset)
+        offset += _RNG_STATE.size
+        self.rng.setstate(
+            (3, tuple(rng_state), None if math.isnan(gauss_next) else gauss_next))
+
+        health, resource_x, resource_y = _RESCUER.unpack_from(snapshot, offset)
+        offset += _RESCUER.size
+
+        self.pick_up, self.delivery, self.collision = pick_up, delivery, collision
+
+        rescuer: Rescuer = self.rescuer_list[0]
+        offset = self._unpack_body(rescuer, snapshot, offset)
+        rescuer.health = health
+
+        if self.resource_list:
+            assets.release_list(self.resource_list)
+        rescuer.carries_resource = carries_resource
+        rescuer.resource_carried = None
+        if carries_resource:
+            resource: Resource = assets.acquire(
+                Resource,
+                "textures/alfred.png",
+                scale=self._sprite_scaling / 3,
+                center_x=resource_x,
+                center_y=resource_y)
+            resource.is_stuck = True
+            self.resource_list.append(resource)
+            rescuer.resource_carried = resource
+
+        offset = self._unpack_body(self.mother_ship_list[0], snapshot, offset)
+
+        if alien_alive:
+            alien = self.alien_list[0] if self.alien_list else self._add_alien(0, 0)
+            offset = self._unpack_body(alien, snapshot, offset)
+        else:
+            assets.release_list(self.alien_list)
+
+        for i in range(num_astroids):
+            texture_index, scale, moment = _ASTROID.unpack_from(snapshot, offset)
+            offset += _ASTROID.size
+            texture_name = self._astroid_textures[texture_index]
+            if i < len(self.asteroids_list):
+                astroid: Sprite = self.asteroids_list[i]
+                if astroid.texture is not assets.texture(texture_name) or \
+                        astroid.scale != scale:
+                    assets.retexture(astroid, texture_name, scale)
+                    self.physics_engine.reshape(astroid)
+                self.physics_engine.set_moment(astroid, moment)
+            else:
+                astroid = self._add_astroid(texture_name, scale, 0, 0, moment)
+            offset = self._unpack_body(astroid, snapshot, offset)
+
+        for astroid in self.asteroids_list[num_astroids:]:
+            assets.release(astroid)
+
+        if rebuild:
+            self._rebuild_space()
+        else:
+            self.physics_engine.forget_contacts(
+                [*self.rescuer_list, *self.alien_list, *self.asteroids_list])
+        self.update_asteroid_index()
+
+    def _rebuild_space(self):
+        """
+        Drops the physics engine's hidden state, e.g. cached contacts, and
+        re-adds all bodies in a fixed order. Following steps depend only on
+        the state of the bodies, hence seeded episodes and restored
+        snapshots replay exactly.
+        """
+        self.physics_engine.rebuild(
+            [self.wall_list, self.mother_ship_list, self.rescuer_list,
+             self.alien_list, self.asteroids_list],
+            self._collision_handlers)
+
+    def _pack_body(self, sprite: Sprite) -> bytes:
+        return _BODY.pack(*self.physics_engine.get_state(sprite))
+
+    def _unpack_body(self, sprite: Sprite, snapshot: bytes, offset: int) -> int:
+        self.physics_engine.set_state(sprite, _BODY.unpack_from(snapshot, offset))
+        return offset + _BODY.size
+
+    # ---------------------------------------------------------------------------------------------------
+    # ---------------------------------------- UPDATE HANDLING ---------------
+    # ---------------------------------------------------------------------------------------------------
 
     def custom_update(self) -> bool:
-        # Apply all queued actions
+        """
+        Advances the game by one frame.
+
+        Returns:
+        bool: Whether the rescuer collided with an astroid or left the screen
+        """
+        self.apply_actions()
+
+        # Update the environment via the physics engine
+        with profiler.phase("physics_step"):
+            self.physics_engine.step()
+
+        return self.after_physics_step()
+
+    def apply_actions(self):
+        """ First part of custom_update, applies and clears the queued actions """
         for action in self.action_list:
             move_action: Move = action
             self.physics_engine.apply_impulse(
@@ -303,48 +576,37 @@ class Game(arcade.Window):
         # Clear the list after application
         self.action_list.clear()
 
-        # Update the environment via the physics engine
-        self.physics_engine.step()
-
+    def after_physics_step(self) -> bool:
+        """
+        Last part of custom_update, once the physics engine stepped, e.g.
+        together with others through step_engines. Respawns astroids and
+        checks for collisions, see custom_update.
+        """
         # Manage all astroids
-        to_be_removed_astroids = []
-        for astroid in self.asteroids_list:
-            if self._has_moved_beyond_screen(astroid):
-                # In case we have an astroid wandering off, remove it
-                to_be_removed_astroids.append(astroid)
-                # Add a new astroid with random force and starting position on
-                # the borders
-                texture_name = self._get_random_astroid_texture()
-                start_x, start_y = self._get_random_astroid_coord()
-                astroid: Sprite = Sprite(
-                    filename=texture_name,
-                    scale=self._sprite_scaling / 1.5,
-                    center_x=start_x,
-                    center_y=start_y)
-
-                self.physics_engine.add_sprite(
-                    astroid,
-                    friction=0.0,
-                    moment_of_inertia=PymunkPhysicsEngine.STATIC,
-                    damping=1,
-                    collision_type="astroid",
-                    max_velocity=400)
-
-                self.physics_engine.apply_impulse(
-                    astroid, self._get_random_force(astroid))
-
-                self.asteroids_list.append(astroid)
-
-        for astroid in to_be_removed_astroids:
-            astroid.remove_from_sprite_lists()
-
-        collided_with_astroid = False if len(
-            arcade.check_for_collision_with_list(
-                self.rescuer_list[0],
-                self.asteroids_list)) == 0 else True
-
-        rescuer_in_environment = True if self._has_moved_beyond_screen(
-            self.rescuer_list[0]) else False
+        with profiler.phase("asteroid_index"):
+            self.update_asteroid_index()
+
+        with profiler.phase("respawn_astroids"):
+            # Only astroids near the border can have left the screen
+            respawned = False
+            for i in self.asteroid_index.query_outside(
+                    0, 0, self.width, self.height).tolist():
+                astroid = self.asteroids_list[i]
+                if self._has_moved_beyond_screen(astroid):
+                    self._respawn_astroid(astroid)
+                    respawned = True
+            if respawned:
+                self.update_asteroid_index()
+
+        with profiler.phase("collision_check"):
+            rescuer: Rescuer = self.rescuer_list[0]
+            collided_with_astroid = any(
+                arcade.check_for_collision(rescuer, self.asteroids_list[i])
+                for i in self.asteroid_index.query_radius(
+                    rescuer.center_x, rescuer.center_y, bounding_radius(rescuer)))
+
+            rescuer_in_environment = True if self._has_moved_beyond_screen(
+                self.rescuer_list[0]) else False
 
         if collided_with_astroid:
             print("Collision")
@@ -352,50 +614,90 @@ class Game(arcade.Window):
 
         return collided_with_astroid or rescuer_in_environment
 
-    def get_image(self, x: int, y: int, width: int, height: int):
-        return arcade.get_image(x, y, width=width, height=height)
+    def update_asteroid_index(self):
+        """ Moves the astroids' bounding circles in asteroid_index to their sprites """
+        bounds = np.array([(astroid.center_x, astroid.center_y,
+                            astroid.width, astroid.height)
+                           for astroid in self.asteroids_list]).reshape(-1, 4)
+        self.asteroid_index.update(
+            bounds[:, :2], np.hypot(bounds[:, 2], bounds[:, 3]) / 2)
+
+    def _respawn_astroid(self, astroid: Sprite):
+        """
+        Recycles an astroid which wandered off in place: it gets a new
+        texture, starting position on the borders and a random push, while
+        its sprite and body are kept. The starting position is moved inside
+        the screen where the astroid would stick out.
+        """
+        texture_name = self._get_random_astroid_texture()
+        start_x, start_y = self._get_random_astroid_coord()
+        scale = self._respawn_scale()
+        if astroid.texture is not assets.texture(texture_name) or \
+                astroid.scale != scale:
+            assets.retexture(astroid, texture_name, scale)
+            self.physics_engine.reshape(astroid)
+        start_x = min(max(start_x, astroid.width / 2), self.width - astroid.width / 2)
+        start_y = min(max(start_y, astroid.height / 2), self.height - astroid.height / 2)
+        self.physics_engine.place(astroid, start_x, start_y)
+        # Respawned astroids always had this moment
+        self.physics_engine.set_moment(astroid, PymunkPhysicsEngine.STATIC)
+        self.physics_engine.apply_impulse(astroid, self._get_random_force(astroid))
+
+    def _respawn_scale(self) -> float:
+        return self._sprite_scaling / 1.5
+
+    def _astroid_half_extent(self) -> float:
+        """ Half the longest side of respawned astroids """
+        return max(max(texture.width, texture.height)
+                   for texture in map(assets.texture, self._astroid_textures)
+                   ) * self._respawn_scale() / 2
+
+    def _get_wall(self, x, y) -> Sprite:
+        return assets.acquire(Sprite,
+                              ":resources:images/tiles/brickGrey.png",
+                              scale=self._sprite_scaling,
+                              center_x=x,
+                              center_y=y)
 
     def _get_random_coord(self, lb) -> tuple:
         lower_bound = lb
         upper_bound = self.height - lb
-        return random.randint(lower_bound, upper_bound)
+        return self.rng.randint(lower_bound, upper_bound)
 
     def _get_random_astroid_coord(self):
-        border = random.choice(['top', 'bottom', 'left', 'right'])
-        margin = random.randint(15, 50)
+        border = self.rng.choice(self.astroid_borders)
+        margin = self.rng.randint(*self.astroid_margin)
         if border == 'top':
-            x = random.randint(margin, self.width)
+            x = self.rng.randint(margin, self.width)
             y = margin
         elif border == 'bottom':
-            x = random.randint(margin, self.width)
+            x = self.rng.randint(margin, self.width)
             y = self.height - margin
         elif border == 'left':
             x = margin
-            y = random.randint(margin, self.height)
+            y = self.rng.randint(margin, self.height)
         elif border == 'right':
             x = self.width - margin
-            y = random.randint(margin, self.height)
+            y = self.rng.randint(margin, self.height)
         return (x, y)
 
     def _get_random_force(self, asteroid: Sprite) -> tuple:
         center_x = self.width / 2
         center_y = self.height / 2
+        low, high = self.astroid_speed
         if asteroid.center_x < center_x:
-            x_force = random.randint(50, 100)
+            x_force = self.rng.randint(low, high)
         else:
-            x_force = random.randint(-100, -50)
+            x_force = self.rng.randint(-high, -low)
 
         if asteroid.center_y < center_y:
-            y_force = random.randint(50, 100)
+            y_force = self.rng.randint(low, high)
         else:
-            y_force = random.randint(-100, -50)
+            y_force = self.rng.randint(-high, -low)
         return (x_force, y_force)
 
     def _get_random_astroid_texture(self):
-        return {
-            0: "textures/astroid_1.png",
-            1: "textures/astroid_1.png"
-        }[random.randint(0, 1)]
+        return self._astroid_textures[self.rng.randint(0, 1)]
 
     def _has_moved_beyond_screen(self, sprite: Sprite) -> bool:
         if sprite.left < 0 or \
@@ -417,16 +719,206 @@ class Game(arcade.Window):
             if math.sqrt((x_2 - x_1)**2 + (y_2 - y_1)**2) > 200:
                 break
         return x_1, y_1, x_2, y_2
-    
-    def _save_video(self):
-        self.frames[0].save(
-            "Rescue-Mission_" + str(self.num) + ".gif",
-            save_all=True,
-            append_images=self.frames[1:],
-            duration=1000 / 45,  # 60 fps
-            loop=0
-        )
-        self.frames.clear()
-        self.num += 1
-        print("Video saved as Rescue-Mission.gif")
 
+    def enable_recording(self, max_episodes: int = 4, downsample: int = 2,
+                         max_frames: int = 1024) -> EpisodeRecorder:
+        """
+        Keep the last `max_episodes` episodes, see EpisodeRecorder. A previous
+        recorder finishes its pending encodings and is replaced.
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+        self.recorder = EpisodeRecorder(max_episodes, downsample,
+                                        max_frames=max_frames)
+        return self.recorder
+
+    def drawn_sprite_lists(self) -> List[SpriteList]:
+        """ Sprite lists in the order they are drawn, back to front """
+        return [self.rescuer_list,
+                self.mother_ship_list,
+                self.alien_list,
+                self.resource_list,
+                self.asteroids_list]
+
+    def sprites_in_view(self, x: float, y: float, width: float,
+                        height: float) -> List[List[Sprite]]:
+        """
+        Like drawn_sprite_lists, but astroids which cannot reach the region
+        are culled through the asteroid_index.
+        """
+        visible = self.asteroid_index.query_box(x, y, x + width, y + height)
+        lists = self.drawn_sprite_lists()
+        lists[-1] = [self.asteroids_list[i] for i in visible.tolist()]
+        return lists
+
+
+class Game(Simulation, arcade.Window):
+    """ Main Game, rendered into a visible window """
+
+    def __init__(self, width, height, title, physics: str = "pymunk"):
+        """ Init """
+        arcade.Window.__init__(self, width, height, title, visible=True)
+        Simulation.__init__(self, width, height, physics)
+
+    def custom_draw(self):
+        arcade.start_render()
+        # arcade.set_background_color(arcade.color.BLACK)
+        arcade.draw_lrwh_rectangle_textured(
+            0, 0, self.width, self.height, self.background)
+        for sprite_list in self.drawn_sprite_lists():
+            sprite_list.draw()
+
+        # Full frame read back only happens while recording
+        if self.recorder is not None:
+            self.recorder.capture(np.asarray(arcade.get_image().convert("RGB")))
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        super().close()
+
+    def get_image(self, x: int, y: int, width: int, height: int):
+        return arcade.get_image(x, y, width=width, height=height)
+
+    def get_patch(self, x: int, y: int, width: int, height: int,
+                  out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Grey scale uint8 patch of the rendered frame, top row first. Written
+        into `out` if given.
+        """
+        patch = np.asarray(self.get_image(x, y, width, height).convert("L"))
+        if out is None:
+            return np.array(patch)
+        np.copyto(out, patch)
+        return out
+
+
+class HeadlessGame(Simulation):
+    """
+    Game without a window or OpenGL context.
+
+    Observations are composed by the SoftwareRasterizer straight from the
+    sprite positions, hence event handling and buffer flips are no-ops and
+    drawing only matters while recording.
+    """
+
+    def __init__(self, width, height, title=None, physics: str = "pymunk"):
+        """ Init """
+        super().__init__(width, height, physics)
+        self.rasterizer = SoftwareRasterizer(width, height, self.background)
+
+    def custom_draw(self):
+        if self.recorder is not None:
+            self.recorder.capture(self.rasterizer.render(
+                self.drawn_sprite_lists(), 0, 0, self.width, self.height))
+
+    def dispatch_events(self):
+        pass
+
+    def flip(self):
+        pass
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def get_patch(self, x: int, y: int, width: int, height: int,
+                  out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Grey scale uint8 patch of the scene, top row first. Written into `out`
+        if given.
+        """
+        return self.rasterizer.render(
+            self.sprites_in_view(x, y, width, height), x, y, width, height, out)
+
+
+class OffscreenGame(Simulation, arcade.Window):
+    """
+    Game rendered through OpenGL into offscreen framebuffers.
+
+    The window is never shown, events are never dispatched and buffers are
+    never swapped, so steps do not wait for the compositor or vsync. Nothing
+    is drawn per step, get_patch renders just the requested region into a
+    framebuffer of its size, with the projection set to the region, and
+    reads it back. Without an X server, arcade runs on EGL, see
+    ARCADE_HEADLESS at the top of this module.
+    """
+
+    def __init__(self, width, height, title, physics: str = "pymunk"):
+        """ Init """
+        arcade.Window.__init__(self, width, height, title, visible=False)
+        Simulation.__init__(self, width, height, physics)
+        # Framebuffers by region size, reused across renders
+        self._framebuffers = {}
+
+    def custom_draw(self):
+        # Only recordings need the full frame
+        if self.recorder is not None:
+            self.recorder.capture(
+                self._render(0, 0, self.width, self.height)[..., :3])
+
+    def _render(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """ RGBA pixels of a region of the scene, top row first """
+        framebuffer = self._framebuffers.get((width, height))
+        if framebuffer is None:
+            framebuffer = self._framebuffers[(width, height)] = self.ctx.framebuffer(
+                color_attachments=[self.ctx.texture((width, height), components=4)])
+
+        projection = self.ctx.projection_2d
+        with framebuffer.activate():
+            framebuffer.clear()
+            self.ctx.projection_2d = (x, x + width, y, y + height)
+            arcade.draw_lrwh_rectangle_textured(
+                0, 0, self.width, self.height, self.background)
+            # Sprite lists are drawn from their GPU buffers as a whole, the
+            # parts outside of the region are clipped without shading
+            for sprite_list in self.drawn_sprite_lists():
+                sprite_list.draw()
+            self.ctx.projection_2d = projection
+            data = framebuffer.read(components=4)
+        return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)[::-1]
+
+    def dispatch_events(self):
+        pass
+
+    def flip(self):
+        pass
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        super().close()
+
+    def get_patch(self, x: int, y: int, width: int, height: int,
+                  out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Grey scale uint8 patch of the scene, top row first. Pixels outside
+        of the frame are black. Written into `out` if given.
+        """
+        rgb = self._render(int(x), int(y), width, height).astype(np.uint32)
+        # ITU-R 601 luma in fixed point, exactly as PIL's convert("L")
+        grey = (rgb[..., 0] * 19595 + rgb[..., 1] * 38470 +
+                rgb[..., 2] * 7471 + 0x8000) >> 16
+        if out is None:
+            return grey.astype(np.uint8)
+        np.copyto(out, grey, casting="unsafe")
+        return out
+
+
+def make_game(width, height, title, renderer: str = "window",
+              physics: str = "pymunk") -> Simulation:
+    """
+    Parameters:
+    renderer (str): 'window' renders through arcade into a visible window,
+    'offscreen' through OpenGL into a hidden framebuffer, e.g. for training
+    on machines without a display, 'software' composes observations in
+    NumPy without any OpenGL context.
+    physics (str): 'pymunk' or 'numpy', see make_physics_engine
+    """
+    if renderer == "window":
+        return Game(width, height, title, physics)
+    if renderer == "offscreen":
+        return OffscreenGame(width, height, title, physics)
+    if renderer == "software":
+        return HeadlessGame(width, height, title, physics)
+    raise ValueError(f"Unknown renderer '{renderer}'")
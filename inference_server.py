@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+import numpy as np
+import torch
+
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+from stable_baselines3 import PPO
+from stable_baselines3.common.policies import ActorCriticPolicy
+from profiling import profiler
+
+
+class InferenceServer:
+    """
+    Serves actions of a policy to many environments at once.
+
+    Observations submitted from any thread are collected into micro-batches,
+    which are closed once `max_batch_size` observations have arrived or
+    `max_delay` seconds have passed since the first one. Every batch is
+    evaluated by a single forward pass under torch.inference_mode, hence the
+    PyTorch dispatch overhead is paid per batch instead of per agent.
+    """
+
+    def __init__(self, policy: ActorCriticPolicy, max_batch_size: int = 64,
+                 max_delay: float = 0.002, deterministic: bool = False,
+                 history: int = 10000):
+        """
+        Parameters:
+        policy (ActorCriticPolicy): E.g. the policy of a loaded PPO model
+        max_batch_size (int): Upper bound of observations per forward pass
+        max_delay (float): Seconds a request waits for others to join its batch
+        deterministic (bool): Whether to take the most likely actions instead
+        of sampling them, as the policy was trained and evaluated
+        history (int): Number of recent requests and batches kept for stats
+        """
+        self.policy = policy.eval()
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.deterministic = deterministic
+
+        self._requests: queue.Queue = queue.Queue()
+        self._latencies: deque = deque(maxlen=history)
+        self._batch_sizes: deque = deque(maxlen=history)
+        self._stats_lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._running = True
+        self._thread.start()
+
+    @classmethod
+    def from_checkpoint(cls, path: str, device: str = "auto",
+                        **kwargs) -> "InferenceServer":
+        """ Serves the policy of a PPO checkpoint, see __init__ for kwargs """
+        model = PPO.load(path, device=device)
+        return cls(model.policy, **kwargs)
+
+    def submit(self, obs: Dict[str, np.ndarray]) -> Future:
+        """
+        Parameters:
+        obs (dict): A single, non batched observation
+
+        Returns:
+        Future: Resolves to the action for this observation
+        """
+        future: Future = Future()
+        # The observation buffers of the envs are reused, keep a copy
+        obs = {key: np.array(value) for key, value in obs.items()}
+        self._requests.put((obs, future, time.perf_counter()))
+        return future
+
+    def predict(self, obs: Dict[str, np.ndarray]) -> np.ndarray:
+        """ Blocking variant of submit """
+        return self.submit(obs).result()
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+        Dict: Latency percentiles in milliseconds, measured from submission
+        to the result being available, and a histogram of batch sizes over
+        the recent history.
+        """
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000
+            batch_sizes = list(self._batch_sizes)
+
+        return {
+            "requests": len(latencies),
+            "batches": len(batch_sizes),
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "latency_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else None,
+            "batch_size_histogram": dict(sorted(Counter(batch_sizes).items()))}
+
+    def close(self):
+        """ Answers all pending requests and stops the server """
+        self._running = False
+        self._requests.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _serve(self):
+        while self._running:
+            batch = self._collect()
+            if batch:
+                self._evaluate(batch)
+
+        # Drain whatever was submitted before closing
+        batch = []
+        while not self._requests.empty():
+            request = self._requests.get_nowait()
+            if request is not None:
+                batch.append(request)
+        for start in range(0, len(batch), self.max_batch_size):
+            self._evaluate(batch[start:start + self.max_batch_size])
+
+    def _collect(self) -> List[Tuple]:
+        """ Blocks for a first request, then gathers more until the deadline """
+        request = self._requests.get()
+        if request is None:
+            return []
+
+        batch = [request]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self._requests.get(timeout=max(timeout, 0)) \
+                    if timeout > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _evaluate(self, batch: List[Tuple]):
+        observations = {key: np.stack([obs[key] for obs, _, _ in batch])
+                        for key in batch[0][0]}
+        try:
+            with torch.inference_mode(), profiler.phase("policy_inference"):
+                obs_tensor, _ = self.policy.obs_to_tensor(observations)
+                actions = self.policy._predict(
+                    obs_tensor, deterministic=self.deterministic)
+            actions = actions.cpu().numpy().reshape(
+                (len(batch), *self.policy.action_space.shape))
+        except Exception as exception:
+            for _, future, _ in batch:
+                future.set_exception(exception)
+            return
+
+        finished = time.perf_counter()
+        for (_, future, submitted), action in zip(batch, actions):
+            future.set_result(action)
+
+        with self._stats_lock:
+            self._latencies.extend(finished - submitted for _, _, submitted in batch)
+            self._batch_sizes.append(len(batch))
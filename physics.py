@@ -0,0 +1,535 @@
+import heapq
+import math
+import numpy as np
+import pymunk
+
+from typing import Callable, Dict, List, Tuple
+from arcade import Sprite, SpriteList
+from arcade.pymunk_physics_engine import PymunkPhysicsEngine
+
+'''
+Physics backends of the game. Both share the PymunkPhysicsEngine interface
+the game uses (add_sprite, apply_impulse, apply_force, step, collision
+handlers) and add what restoring and resetting bodies needs: place,
+reshape, rebuild, forget_contacts, body states and moments.
+'''
+
+# position, angle, velocity, angular velocity, pending force
+BodyState = Tuple[float, float, float, float, float, float, float, float]
+
+
+class PymunkBackend(PymunkPhysicsEngine):
+    """ The full rigid body simulation of pymunk, as the game always used """
+
+    def place(self, sprite: Sprite, x, y):
+        """ Teleports a sprite and its body, which comes to a halt """
+        body = self.get_physics_object(sprite).body
+        body.position = (x, y)
+        body.angle = 0
+        if body.body_type == self.STATIC:
+            self.space.reindex_shapes_for_body(body)
+        else:
+            body.velocity = (0, 0)
+            body.angular_velocity = 0
+            body.force = (0, 0)
+            # An empty position update clears the solver's bias velocities
+            pymunk.Body.update_position(body, 0)
+        sprite.position = (x, y)
+        sprite.angle = 0
+
+    def reshape(self, sprite: Sprite):
+        """ Replaces the shape of a body after its sprite was retextured or scaled """
+        physics_object = self.get_physics_object(sprite)
+        body, old_shape = physics_object.body, physics_object.shape
+
+        poly = [[x * sprite.scale for x in z] for z in sprite.get_hit_box()]
+        shape = pymunk.Poly(body, poly)
+        shape.collision_type = old_shape.collision_type
+        shape.friction = old_shape.friction
+        shape.elasticity = old_shape.elasticity
+
+        self.space.remove(old_shape)
+        self.space.add(shape)
+        physics_object.shape = shape
+
+        # Same moment as add_sprite defaults to
+        body.moment = pymunk.moment_for_box(body.mass, (sprite.width, sprite.height))
+
+    def rebuild(self, sprite_lists: List[SpriteList], collision_handlers: List):
+        """
+        Moves all bodies into a fresh pymunk space, in the given order.
+
+        The space caches contacts between steps and orders its collision
+        pairs by internal shape ids, neither of which is part of the game
+        state. A fresh space makes the following steps depend only on the
+        state of the bodies, hence seeded episodes and restored snapshots
+        replay exactly.
+        """
+        old_space = self.space
+        old_space.remove(*old_space.shapes, *old_space.bodies)
+
+        space = pymunk.Space()
+        space.gravity = old_space.gravity
+        space.damping = old_space.damping
+        for sprite_list in sprite_lists:
+            for sprite in sprite_list:
+                physics_object = self.get_physics_object(sprite)
+                space.add(physics_object.body, physics_object.shape)
+        self.space = space
+
+        for first_type, second_type, handlers in collision_handlers:
+            self.add_collision_handler(first_type, second_type, **handlers)
+
+    def forget_contacts(self, sprites: List[Sprite]):
+        """
+        Drops the cached contacts of the given sprites' bodies, by taking
+        their shapes out of the space and adding them back in order.
+
+        Far cheaper than rebuild, but the shapes get new internal ids, which
+        may order the collision pairs differently than in a fresh space. The
+        following steps then differ from a rebuilt space by rounding errors.
+        """
+        shapes = [self.get_physics_object(sprite).shape for sprite in sprites]
+        self.space.remove(*shapes)
+        self.space.add(*shapes)
+
+    def get_state(self, sprite: Sprite) -> BodyState:
+        body = self.get_physics_object(sprite).body
+        return (*body.position, body.angle, *body.velocity,
+                body.angular_velocity, *body.force)
+
+    def set_state(self, sprite: Sprite, state: BodyState):
+        x, y, angle, velocity_x, velocity_y, angular_velocity, force_x, force_y = state
+        # As place, without setting every attribute twice
+        body = self.get_physics_object(sprite).body
+        body.position = (x, y)
+        body.angle = angle
+        if body.body_type == self.STATIC:
+            self.space.reindex_shapes_for_body(body)
+        else:
+            body.velocity = (velocity_x, velocity_y)
+            body.angular_velocity = angular_velocity
+            body.force = (force_x, force_y)
+            pymunk.Body.update_position(body, 0)
+        sprite.position = (x, y)
+        sprite.angle = math.degrees(angle)
+
+    def get_moment(self, sprite: Sprite) -> float:
+        return self.get_physics_object(sprite).body.moment
+
+    def set_moment(self, sprite: Sprite, moment: float):
+        self.get_physics_object(sprite).body.moment = moment
+
+
+def _integrate(position, velocity, force, inverse_mass, damping, max_velocity,
+               dynamic, gravity, delta_time):
+    """ One step of the semi-implicit Euler chipmunk uses, in place """
+    # Positions move with the velocity of the last step, as in chipmunk
+    position[dynamic] += velocity[dynamic] * delta_time
+    velocity[dynamic] = velocity[dynamic] * damping[dynamic][:, None] ** delta_time \
+        + (gravity + force[dynamic] * inverse_mass[dynamic][:, None]) * delta_time
+    speed = np.hypot(velocity[:, 0], velocity[:, 1])
+    too_fast = dynamic & (speed > max_velocity)
+    velocity[too_fast] *= (max_velocity[too_fast] / speed[too_fast])[:, None]
+    force[:] = 0
+
+
+def _candidate_pairs(dynamic: np.ndarray, active: np.ndarray):
+    """
+    Pairs which may touch: every two dynamic bodies, and every static body
+    with every dynamic one.
+    """
+    moving = np.flatnonzero(active & dynamic)
+    fixed = np.flatnonzero(active & ~dynamic)
+    first, second = np.triu_indices(len(moving), k=1)
+    return (moving[first], moving[second],
+            np.repeat(fixed, len(moving)), np.tile(moving, len(fixed)))
+
+
+def _contacts(position, radius, half_extent, first, second, box, circle):
+    """
+    Overlapping pairs among the candidates, dynamic circles against dynamic
+    circles and against static boxes.
+
+    Returns:
+    Tuple: First and second body, contact normal pointing from the first to
+    the second body and penetration depth per pair
+    """
+    # Circle against circle
+    offset = position[second] - position[first]
+    distance = np.hypot(offset[:, 0], offset[:, 1])
+    depth = radius[first] + radius[second] - distance
+    touching = depth > 0
+    first, second = first[touching], second[touching]
+    offset, distance, depth = offset[touching], distance[touching], depth[touching]
+    # Coinciding centers are separated along x
+    normal = np.where(distance[:, None] > 0,
+                      offset / np.maximum(distance, 1e-12)[:, None], (1.0, 0.0))
+
+    # Box against circle, the normal points from the box to the circle
+    lower = position[box] - half_extent[box]
+    upper = position[box] + half_extent[box]
+    closest = np.clip(position[circle], lower, upper)
+    box_offset = position[circle] - closest
+    box_distance = np.hypot(box_offset[:, 0], box_offset[:, 1])
+    box_depth = radius[circle] - box_distance
+    box_touching = box_depth > 0
+    box, circle = box[box_touching], circle[box_touching]
+    box_offset, box_distance = box_offset[box_touching], box_distance[box_touching]
+    box_depth = box_depth[box_touching]
+    lower, upper = lower[box_touching], upper[box_touching]
+
+    box_normal = box_offset / np.maximum(box_distance, 1e-12)[:, None]
+    inside = box_distance == 0
+    if inside.any():
+        # Centers inside a box leave it along the axis of least penetration
+        center = position[circle[inside]]
+        gaps = np.stack([center[:, 0] - lower[inside, 0], upper[inside, 0] - center[:, 0],
+                         center[:, 1] - lower[inside, 1], upper[inside, 1] - center[:, 1]], 1)
+        side = gaps.argmin(axis=1)
+        directions = np.array([(-1.0, 0.0), (1.0, 0.0), (0.0, -1.0), (0.0, 1.0)])
+        box_normal[inside] = directions[side]
+        box_depth[inside] = radius[circle[inside]] + gaps[np.arange(len(side)), side]
+
+    return (np.concatenate([first, box]), np.concatenate([second, circle]),
+            np.concatenate([normal, box_normal]), np.concatenate([depth, box_depth]))
+
+
+# Chipmunk's defaults, overlaps up to the slop are tolerated and the rest
+# shrinks by 10% per step at 60 Hz
+_COLLISION_SLOP = 0.1
+_COLLISION_BIAS = (1 - 0.1) ** 60
+
+
+def _resolve(position, velocity, inverse_mass, first, second, normal, depth,
+             delta_time):
+    """
+    Inelastic contact response and penetration correction, in place.
+
+    As in chipmunk, penetration is only corrected gradually. Bodies pushed
+    into a wall hence sink into it, which is what makes the rescuer leave
+    the screen.
+    """
+    weight_first, weight_second = inverse_mass[first], inverse_mass[second]
+    total = weight_first + weight_second
+    total[total == 0] = 1
+
+    fraction = 1 - _COLLISION_BIAS ** delta_time
+    depth = np.maximum(depth - _COLLISION_SLOP, 0) * fraction
+    correction = normal * (depth / total)[:, None]
+    np.add.at(position, first, -correction * weight_first[:, None])
+    np.add.at(position, second, correction * weight_second[:, None])
+
+    relative = np.einsum("ij,ij->i", velocity[second] - velocity[first], normal)
+    impulse = normal * (np.minimum(relative, 0) / total)[:, None]
+    np.add.at(velocity, first, impulse * weight_first[:, None])
+    np.add.at(velocity, second, -impulse * weight_second[:, None])
+
+
+class NumpyPhysicsEngine:
+    """
+    Lightweight physics for point like bodies, kept as structure of arrays.
+
+    Dynamic bodies are circles, their radius is the mean half extent of the
+    hit box, and do not rotate. Static bodies are axis aligned boxes. Bodies
+    integrate impulses, forces, per body damping and max velocity exactly as
+    PymunkPhysicsEngine does, contacts are inelastic and frictionless.
+
+    Collision handlers follow pymunk: begin is called when two bodies start
+    touching and ignores the contact while they touch if it returns False,
+    post is called every step they touch. Handlers get the two sprites in
+    the order the handler was registered with, arbiter and space are None.
+    """
+
+    DYNAMIC = PymunkPhysicsEngine.DYNAMIC
+    STATIC = PymunkPhysicsEngine.STATIC
+    MOMENT_INF = PymunkPhysicsEngine.MOMENT_INF
+
+    def __init__(self, gravity=(0, 0), damping: float = 1.0, capacity: int = 64):
+        self.gravity = np.array(gravity, dtype=np.float64)
+        self.damping = damping
+        self.collision_types: List[str] = []
+        self.sprites: Dict[Sprite, int] = {}
+
+        self._bodies: List[Sprite | None] = [None] * capacity
+        self._free = list(range(capacity))
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.force = np.zeros((capacity, 2))
+        self.angle = np.zeros(capacity)
+        self.angular_velocity = np.zeros(capacity)
+        self.half_extent = np.zeros((capacity, 2))
+        self.radius = np.zeros(capacity)
+        self.inverse_mass = np.zeros(capacity)
+        self.moment = np.zeros(capacity)
+        self.body_damping = np.ones(capacity)
+        self.max_velocity = np.full(capacity, np.inf)
+        self.collision_type = np.zeros(capacity, dtype=np.int64)
+        self.dynamic = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        # (first type, second type) -> handlers, registered in both orders
+        self._handlers: Dict[Tuple[int, int], Tuple[bool, Dict[str, Callable]]] = {}
+        # Touching pairs of bodies -> whether their contact is processed
+        self._touching: Dict[Tuple[int, int], bool] = {}
+        # Candidate pairs, until bodies are added or removed
+        self._pairs: Tuple[np.ndarray, ...] | None = None
+
+    def _grow(self):
+        capacity = len(self._bodies)
+        for name in ("position", "velocity", "force", "angle", "angular_velocity",
+                     "half_extent", "radius", "inverse_mass", "moment",
+                     "body_damping", "max_velocity", "collision_type",
+                     "dynamic", "active"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.body_damping[capacity:] = 1
+        self.max_velocity[capacity:] = np.inf
+        self._bodies += [None] * capacity
+        self._free += list(range(capacity, 2 * capacity))
+        heapq.heapify(self._free)
+
+    def _type_id(self, collision_type: str) -> int:
+        if collision_type not in self.collision_types:
+            self.collision_types.append(collision_type)
+        return self.collision_types.index(collision_type)
+
+    def add_sprite(self, sprite: Sprite, mass: float = 1, friction: float = 0.2,
+                   elasticity: float | None = None,
+                   moment_of_inertia: float | None = None,
+                   body_type: int = DYNAMIC, damping: float | None = None,
+                   max_velocity: float | None = None,
+                   collision_type: str | None = "default"):
+        """ Same parameters as PymunkPhysicsEngine.add_sprite """
+        if sprite in self.sprites:
+            return
+        if not self._free:
+            self._grow()
+        self._pairs = None
+        # The lowest free slot, so bodies are laid out the same every episode
+        index = heapq.heappop(self._free)
+        self._bodies[index] = sprite
+        self.sprites[sprite] = index
+
+        self.dynamic[index] = body_type != self.STATIC
+        self.active[index] = True
+        self.inverse_mass[index] = 1 / mass if self.dynamic[index] else 0
+        self.body_damping[index] = self.damping if damping is None else damping
+        self.max_velocity[index] = max_velocity or np.inf
+        self.collision_type[index] = self._type_id(collision_type)
+        angle = sprite.angle
+        self.place(sprite, sprite.center_x, sprite.center_y)
+        self.angle[index] = math.radians(angle)
+        sprite.angle = angle
+        self.reshape(sprite)
+        # Zero falls back to the box moment, as in PymunkPhysicsEngine
+        if moment_of_inertia:
+            self.moment[index] = moment_of_inertia
+
+        sprite.register_physics_engine(self)
+
+    def add_sprite_list(self, sprite_list, **kwargs):
+        for sprite in sprite_list:
+            self.add_sprite(sprite, **kwargs)
+
+    def remove_sprite(self, sprite: Sprite):
+        index = self.sprites.pop(sprite)
+        self._pairs = None
+        self._bodies[index] = None
+        self.active[index] = False
+        self.dynamic[index] = False
+        heapq.heappush(self._free, index)
+        self._touching = {pair: processed for pair, processed in self._touching.items()
+                          if index not in pair}
+
+    def add_collision_handler(self, first_type: str, second_type: str,
+                              begin_handler: Callable = None,
+                              pre_handler: Callable = None,
+                              post_handler: Callable = None,
+                              separate_handler: Callable = None):
+        """ Supports begin and post handlers """
+        handlers = dict(begin=begin_handler, post=post_handler)
+        first_id, second_id = self._type_id(first_type), self._type_id(second_type)
+        self._handlers[(first_id, second_id)] = (False, handlers)
+        self._handlers[(second_id, first_id)] = (True, handlers)
+
+    def apply_impulse(self, sprite: Sprite, impulse: Tuple[float, float]):
+        index = self.sprites[sprite]
+        self.velocity[index] += np.asarray(impulse) * self.inverse_mass[index]
+
+    def apply_force(self, sprite: Sprite, force: Tuple[float, float]):
+        self.force[self.sprites[sprite]] += force
+
+    def step(self, delta_time: float = 1 / 60.0, resync_sprites: bool = True):
+        step_engines([self], delta_time, resync_sprites)
+
+    def resync_sprites(self):
+        """ Moves the sprites of all dynamic bodies to their bodies """
+        for index in np.flatnonzero(self.dynamic).tolist():
+            self._bodies[index].position = tuple(self.position[index].tolist())
+
+    def _dispatch(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """
+        Runs begin handlers of new contacts and returns which contacts are
+        processed. Contacts which ended are forgotten.
+        """
+        touching = {}
+        processed = np.ones(len(first), dtype=bool)
+        for k, pair in enumerate(zip(first.tolist(), second.tolist())):
+            state = self._touching.get(pair)
+            if state is None:
+                state = True
+                swapped, handlers = self._handlers.get(
+                    (int(self.collision_type[pair[0]]), int(self.collision_type[pair[1]])),
+                    (False, {}))
+                if handlers.get("begin") is not None:
+                    a, b = self._bodies[pair[0]], self._bodies[pair[1]]
+                    state = handlers["begin"](*((b, a) if swapped else (a, b)),
+                                              None, None, None) is not False
+            touching[pair] = processed[k] = state
+        self._touching = touching
+        return processed
+
+    def _post_solve(self, first: np.ndarray, second: np.ndarray):
+        for pair in zip(first.tolist(), second.tolist()):
+            swapped, handlers = self._handlers.get(
+                (int(self.collision_type[pair[0]]), int(self.collision_type[pair[1]])),
+                (False, {}))
+            a, b = self._bodies[pair[0]], self._bodies[pair[1]]
+            # Earlier handlers of this step may have removed a body
+            if handlers.get("post") is not None and a is not None and b is not None:
+                handlers["post"](*((b, a) if swapped else (a, b)), None, None, None)
+
+    # Interface shared with PymunkBackend
+
+    def place(self, sprite: Sprite, x, y):
+        index = self.sprites[sprite]
+        self.position[index] = (x, y)
+        self.angle[index] = 0
+        if self.dynamic[index]:
+            self.velocity[index] = 0
+            self.angular_velocity[index] = 0
+            self.force[index] = 0
+        sprite.position = (x, y)
+        sprite.angle = 0
+
+    def reshape(self, sprite: Sprite):
+        index = self.sprites[sprite]
+        hit_box = np.abs(np.array(sprite.get_hit_box(), dtype=np.float64)) * sprite.scale
+        self.half_extent[index] = hit_box.max(axis=0)
+        self.radius[index] = self.half_extent[index].mean()
+        self.moment[index] = pymunk.moment_for_box(
+            1 / self.inverse_mass[index] if self.inverse_mass[index] else 1,
+            (sprite.width, sprite.height))
+
+    def rebuild(self, sprite_lists: List[SpriteList], collision_handlers: List):
+        """ Forgets all contacts, the bodies hold no other hidden state """
+        self._touching.clear()
+
+    def forget_contacts(self, sprites: List[Sprite]):
+        """ Forgets all contacts, see rebuild """
+        self._touching.clear()
+
+    def get_state(self, sprite: Sprite) -> BodyState:
+        index = self.sprites[sprite]
+        return (*self.position[index].tolist(), float(self.angle[index]),
+                *self.velocity[index].tolist(), float(self.angular_velocity[index]),
+                *self.force[index].tolist())
+
+    def set_state(self, sprite: Sprite, state: BodyState):
+        x, y, angle, velocity_x, velocity_y, angular_velocity, force_x, force_y = state
+        self.place(sprite, x, y)
+        index = self.sprites[sprite]
+        self.angle[index] = angle
+        sprite.angle = math.degrees(angle)
+        if self.dynamic[index]:
+            self.velocity[index] = (velocity_x, velocity_y)
+            self.angular_velocity[index] = angular_velocity
+            self.force[index] = (force_x, force_y)
+
+    def get_moment(self, sprite: Sprite) -> float:
+        return float(self.moment[self.sprites[sprite]])
+
+    def set_moment(self, sprite: Sprite, moment: float):
+        self.moment[self.sprites[sprite]] = moment
+
+
+_BATCHED = ("position", "velocity", "force", "inverse_mass", "body_damping",
+            "max_velocity", "dynamic", "active", "radius", "half_extent")
+
+
+def step_engines(engines: List[NumpyPhysicsEngine], delta_time: float = 1 / 60.0,
+                 resync_sprites: bool = True):
+    """
+    Advances several NumpyPhysicsEngines by one step, integrating and
+    colliding the bodies of all of them in one batch. Bodies of different
+    engines never touch.
+    """
+    sizes = [len(engine._bodies) for engine in engines]
+    starts = np.cumsum([0] + sizes)
+    for engine in engines:
+        if engine._pairs is None:
+            engine._pairs = _candidate_pairs(engine.dynamic, engine.active)
+
+    if len(engines) == 1:
+        engine = engines[0]
+        arrays = {name: getattr(engine, name) for name in _BATCHED}
+        pairs = engine._pairs
+        gravity = engine.gravity
+    else:
+        arrays = {name: np.concatenate([getattr(engine, name) for engine in engines])
+                  for name in _BATCHED}
+        pairs = [np.concatenate([engine._pairs[i] + start
+                                 for engine, start in zip(engines, starts)])
+                 for i in range(4)]
+        gravity = np.repeat(np.stack([engine.gravity for engine in engines]),
+                            sizes, axis=0)[arrays["dynamic"]]
+
+    _integrate(arrays["position"], arrays["velocity"], arrays["force"],
+               arrays["inverse_mass"], arrays["body_damping"], arrays["max_velocity"],
+               arrays["dynamic"], gravity, delta_time)
+    first, second, normal, depth = _contacts(
+        arrays["position"], arrays["radius"], arrays["half_extent"], *pairs)
+
+    # Handlers are per engine, contacts are grouped by engine for them
+    owner = np.searchsorted(starts, first, side="right") - 1
+    order = np.argsort(owner, kind="stable")
+    first, second, normal, depth = first[order], second[order], normal[order], depth[order]
+    bounds = np.searchsorted(owner[order], np.arange(len(engines) + 1))
+
+    processed = np.zeros(len(first), dtype=bool)
+    for k, engine in enumerate(engines):
+        span = slice(bounds[k], bounds[k + 1])
+        processed[span] = engine._dispatch(first[span] - starts[k],
+                                           second[span] - starts[k])
+    _resolve(arrays["position"], arrays["velocity"], arrays["inverse_mass"],
+             first[processed], second[processed], normal[processed], depth[processed],
+             delta_time)
+
+    if len(engines) > 1:
+        for k, engine in enumerate(engines):
+            engine.position[:] = arrays["position"][starts[k]:starts[k + 1]]
+            engine.velocity[:] = arrays["velocity"][starts[k]:starts[k + 1]]
+            engine.force[:] = 0
+
+    for k, engine in enumerate(engines):
+        span = slice(bounds[k], bounds[k + 1])
+        engine._post_solve(first[span][processed[span]] - starts[k],
+                           second[span][processed[span]] - starts[k])
+        if resync_sprites:
+            engine.resync_sprites()
+
+
+PHYSICS_BACKENDS = {"pymunk": PymunkBackend, "numpy": NumpyPhysicsEngine}
+
+
+def make_physics_engine(physics: str = "pymunk", **kwargs):
+    """
+    Parameters:
+    physics (str): 'pymunk' simulates rigid polygons, 'numpy' the lighter
+    NumpyPhysicsEngine
+    kwargs: gravity and damping of the world
+    """
+    if physics not in PHYSICS_BACKENDS:
+        raise ValueError(f"Unknown physics backend '{physics}'")
+    return PHYSICS_BACKENDS[physics](**kwargs)
@@ -0,0 +1,121 @@
+import json
+import numpy as np
+
+from typing import Dict, List
+
+'''
+Serves policies exported by export.py. Only needs torch for TorchScript
+artifacts and onnxruntime for ONNX ones, neither stable_baselines3 nor
+gymnasium are imported.
+'''
+
+
+def actions_from_logits(logits: np.ndarray, action_dims: List[int],
+                        rng: np.random.Generator | None = None) -> np.ndarray:
+    """
+    Parameters:
+    logits (np.ndarray): Shape (N, sum(action_dims)), the logits of all
+    action dimensions concatenated, as exported by export.ActionModel
+    action_dims (list): Number of actions per action dimension
+    rng (np.random.Generator): Samples the actions from the softmax of the
+    logits, as PPO.predict does. Without it the most likely ones are taken.
+
+    Returns:
+    np.ndarray: Shape (N, len(action_dims)), one action per dimension
+    """
+    logits = np.asarray(logits, dtype=np.float64)
+    actions = np.empty((len(logits), len(action_dims)), dtype=np.int64)
+    start = 0
+    for i, size in enumerate(action_dims):
+        split = logits[:, start:start + size]
+        start += size
+        if rng is None:
+            actions[:, i] = split.argmax(axis=1)
+            continue
+        # Inverse transform sampling of the unnormalized softmax
+        cdf = np.cumsum(np.exp(split - split.max(axis=1, keepdims=True)), axis=1)
+        u = rng.random((len(split), 1)) * cdf[:, -1:]
+        actions[:, i] = np.minimum((cdf <= u).sum(axis=1), size - 1)
+    return actions
+
+
+class ExportedPolicy:
+    """
+    Policy loaded from a '.pt' or '.onnx' artifact.
+
+    predict takes observations as produced by Environment.get_obs, either a
+    single one or a batch with a leading dimension, and returns actions of
+    the same layout as PPO.predict. Actions are sampled from the exported
+    logits unless the policy is deterministic.
+    """
+
+    def __init__(self, path: str, num_threads: int | None = None,
+                 deterministic: bool = False, seed: int | None = None):
+        """
+        Parameters:
+        path (str): A '.pt' TorchScript or '.onnx' model
+        num_threads (int): Intra-op threads, defaults to the library's choice
+        deterministic (bool): Whether to take the most likely actions
+        seed (int): Seed of the generator actions are sampled with
+        """
+        self.path = path
+        self.deterministic = deterministic
+        self.rng = np.random.default_rng(seed)
+        if path.endswith(".onnx"):
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if num_threads is not None:
+                options.intra_op_num_threads = num_threads
+            self._session = onnxruntime.InferenceSession(
+                path, options, providers=["CPUExecutionProvider"])
+            metadata = self._session.get_modelmeta().custom_metadata_map
+            self.action_dims = json.loads(metadata["action_dims"])
+            self._run = self._run_onnx
+        else:
+            import torch
+
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+            self._torch = torch
+            extra_files = {"action_dims": ""}
+            self._module = torch.jit.load(
+                path, map_location="cpu", _extra_files=extra_files).eval()
+            self.action_dims = json.loads(extra_files["action_dims"])
+            self._run = self._run_torchscript
+
+    def predict(self, obs: Dict[str, np.ndarray]) -> np.ndarray:
+        single = np.ndim(obs["numerical"]) == 1
+        logits = self.logits(obs)
+        actions = actions_from_logits(
+            logits[None] if single else logits, self.action_dims,
+            None if self.deterministic else self.rng)
+        return actions[0] if single else actions
+
+    def logits(self, obs: Dict[str, np.ndarray]) -> np.ndarray:
+        """ Action logits of an observation or a batch, see predict """
+        numerical = np.asarray(obs["numerical"], dtype=np.float32)
+        image = np.asarray(obs["image"], dtype=np.uint8)
+
+        single = numerical.ndim == 1
+        if single:
+            numerical, image = numerical[None], image[None]
+
+        logits = self._run(np.ascontiguousarray(numerical),
+                           np.ascontiguousarray(image))
+        return logits[0] if single else logits
+
+    def _run_torchscript(self, numerical: np.ndarray, image: np.ndarray) -> np.ndarray:
+        torch = self._torch
+        with torch.inference_mode():
+            return self._module(torch.from_numpy(numerical),
+                                torch.from_numpy(image)).numpy()
+
+    def _run_onnx(self, numerical: np.ndarray, image: np.ndarray) -> np.ndarray:
+        return self._session.run(
+            None, {"numerical": numerical, "image": image})[0]
+
+
+def load_policy(path: str, **kwargs) -> ExportedPolicy:
+    """ See ExportedPolicy """
+    return ExportedPolicy(path, **kwargs)
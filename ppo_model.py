@@ -1,14 +1,21 @@
 import torch.nn as nn
 import torch
 import torch.nn.functional as F
+import numpy as np
 
 from torch.nn import MultiheadAttention
 from torch.nn import TransformerDecoderLayer
+from stable_baselines3.common.buffers import DictRolloutBuffer
 from stable_baselines3.common.policies import ActorCriticPolicy
 from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
 
 class Custom_Policy(nn.Module):
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(self, *args, image_shape=(300, 300), **kwargs) -> None:
+        """
+        Parameters:
+        image_shape (tuple): Height and width of the image observations, the
+        input size of fc1 follows from it
+        """
         super().__init__(*args, **kwargs)
 
         routing_info_width = 4
@@ -52,7 +59,11 @@ class Custom_Policy(nn.Module):
                 kernel_size=2,
                 stride=2))
 
-        self.fc1 = nn.Linear(800, 64)
+        # Flattened size of the CNN output, e.g. 800 for 300x300 images
+        with torch.no_grad():
+            cnn_output_size = self.cnn(torch.zeros(1, 1, *image_shape)).numel()
+
+        self.fc1 = nn.Linear(cnn_output_size, 64)
         self.fc2 = nn.Linear(64, proximity_info_width)
 
         self.self_attn_fusion = MultiheadAttention(
@@ -67,14 +78,17 @@ class Custom_Policy(nn.Module):
         a = self.decoder(tgt=a, memory=a)
         a = a.squeeze(0) if a.size(0) == 1 else a
 
-        b = b.unsqueeze(1)
+        # Images arrive as raw grey values, normalize on the device
+        b = b.unsqueeze(1) / 255.0
         b = self.cnn(b)
-        b = b.view(b.size(0), -1)
+        b = b.flatten(1)
         b = F.relu(self.fc1(b))
         b = self.fc2(b)
 
-        c = torch.cat((a, b), dim=1)
-        c = self.ReLU(self.self_attn_fusion(c, c, c)[0])
+        # One token per sample, so samples of a batch never attend to each
+        # other. A single observation is treated exactly as before.
+        c = torch.cat((a, b), dim=1).unsqueeze(0)
+        c = self.ReLU(self.self_attn_fusion(c, c, c)[0]).squeeze(0)
 
         return c
 
@@ -82,7 +96,8 @@ class Custom_Policy(nn.Module):
 class CustomExtractor(BaseFeaturesExtractor):
     def __init__(self, observation_space):
         super().__init__(observation_space, features_dim=8)
-        self.extractor = Custom_Policy()
+        self.extractor = Custom_Policy(
+            image_shape=observation_space['image'].shape)
 
     def forward(self, observations):
         return self.extractor(observations)
@@ -93,3 +108,20 @@ class CustomPolicy(ActorCriticPolicy):
         super(CustomPolicy,self).__init__(*args,**kwargs,
             features_extractor_class=CustomExtractor,
             features_extractor_kwargs=dict())
+
+
+class CompactRolloutBuffer(DictRolloutBuffer):
+    """
+    Rollout buffer which stores observations in the dtype of their space.
+
+    SB3 keeps every observation as float32, i.e. 4x the size of the uint8
+    images. The images are converted to float by the policy, hence storing
+    them as is shrinks the buffer and the host to device copies accordingly.
+    """
+
+    def reset(self) -> None:
+        super().reset()
+        # Replaces the float32 arrays, which are never touched and thus cheap
+        for key, space in self.observation_space.spaces.items():
+            self.observations[key] = np.zeros(
+                (self.buffer_size, self.n_envs, *space.shape), dtype=space.dtype)
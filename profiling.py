@@ -0,0 +1,181 @@
+import bisect
+import json
+import sys
+import threading
+import time
+
+from collections import deque
+from contextlib import nullcontext
+from typing import Dict, List
+
+# Upper bucket edges of the time histograms, 1us to ~17s in steps of 2^(1/4)
+_TIME_EDGES_NS = [int(1000 * 2 ** (i / 4)) for i in range(97)]
+# Upper bucket edges of the net block delta histograms, 0 to 2^20 blocks
+_NET_BLOCK_EDGES = [0] + [2 ** i for i in range(21)]
+
+_DISABLED = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start", "blocks")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.blocks = sys.getallocatedblocks()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.profiler.record(self.name, self.start, end - self.start,
+                             sys.getallocatedblocks() - self.blocks)
+
+
+class _Histogram:
+    __slots__ = ("count", "total_ns", "max_ns", "total_net_blocks", "times",
+                 "net_blocks")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.total_net_blocks = 0
+        self.times = [0] * (len(_TIME_EDGES_NS) + 1)
+        self.net_blocks = [0] * (len(_NET_BLOCK_EDGES) + 1)
+
+    def percentile_ms(self, q: float) -> float:
+        """ Upper edge of the bucket holding the q-th percentile """
+        target = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.times):
+            seen += count
+            if seen >= target and count:
+                edge = _TIME_EDGES_NS[i] if i < len(_TIME_EDGES_NS) else self.max_ns
+                return min(edge, self.max_ns) / 1e6
+        return self.max_ns / 1e6
+
+
+class Profiler:
+    """
+    Per-phase wall time and net block delta histograms of the hot paths.
+
+    Phases are timed with `with profiler.phase("name"):`. While disabled
+    this returns a shared no-op context manager, so instrumented code pays
+    for one attribute check and an empty with statement. While enabled,
+    every phase adds its duration and its net block delta to fixed-size
+    histograms, and the most recent phases are kept for Chrome trace export.
+
+    The net block delta is the change of sys.getallocatedblocks over the
+    phase, about three of which are the measurement's own. It is not an
+    allocation count: blocks allocated and freed within the phase cancel
+    out, so a phase churning through temporaries can report zero. It shows
+    what a phase retains, e.g. caches or leaks.
+    """
+
+    def __init__(self, max_events: int = 100000):
+        self.enabled = False
+        self._histograms: Dict[str, _Histogram] = {}
+        self._events: deque = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """ Drops all recorded phases """
+        with self._lock:
+            self._histograms.clear()
+            self._events.clear()
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _DISABLED
+        return _Phase(self, name)
+
+    def record(self, name: str, start_ns: int, duration_ns: int,
+               net_blocks: int = 0):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram()
+            histogram.count += 1
+            histogram.total_ns += duration_ns
+            histogram.max_ns = max(histogram.max_ns, duration_ns)
+            histogram.total_net_blocks += net_blocks
+            histogram.times[bisect.bisect_left(_TIME_EDGES_NS, duration_ns)] += 1
+            # Phases which free more than they allocate land in the first bucket
+            histogram.net_blocks[bisect.bisect_left(
+                _NET_BLOCK_EDGES, max(net_blocks, 0))] += 1
+            self._events.append((name, start_ns, duration_ns, threading.get_ident()))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+        Dict: Per phase the number of calls, mean, p50, p99 and max duration
+        in milliseconds, the total time and the mean net block delta, see
+        Profiler. Percentiles are accurate to the histogram's bucket width of
+        about 19%.
+        """
+        with self._lock:
+            return {name: {
+                "count": histogram.count,
+                "total_ms": histogram.total_ns / 1e6,
+                "mean_ms": histogram.total_ns / histogram.count / 1e6,
+                "p50_ms": histogram.percentile_ms(50),
+                "p99_ms": histogram.percentile_ms(99),
+                "max_ms": histogram.max_ns / 1e6,
+                "mean_net_blocks": histogram.total_net_blocks / histogram.count}
+                for name, histogram in self._histograms.items()}
+
+    def histograms(self) -> Dict[str, Dict[str, List]]:
+        """ Raw bucket counts with their upper edges, per phase """
+        with self._lock:
+            return {name: {
+                "time_edges_ns": _TIME_EDGES_NS,
+                "time_counts": list(histogram.times),
+                "net_block_edges": _NET_BLOCK_EDGES,
+                "net_block_counts": list(histogram.net_blocks)}
+                for name, histogram in self._histograms.items()}
+
+    def export_chrome_trace(self, filename: str):
+        """ Writes the recent phases for chrome://tracing or Perfetto """
+        with self._lock:
+            events = list(self._events)
+        trace = [{"name": name,
+                  "ph": "X",
+                  "ts": start_ns / 1000,
+                  "dur": duration_ns / 1000,
+                  "pid": 0,
+                  "tid": thread}
+                 for name, start_ns, duration_ns, thread in events]
+        with open(filename, "w") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+    def export_tensorboard(self, writer, step: int):
+        """
+        Parameters:
+        writer: A torch.utils.tensorboard SummaryWriter, or a log directory
+        step (int): Global step the scalars are logged at
+        """
+        owned = isinstance(writer, str)
+        if owned:
+            from torch.utils.tensorboard import SummaryWriter
+            writer = SummaryWriter(writer)
+        for name, stats in self.stats().items():
+            for key in ("mean_ms", "p50_ms", "p99_ms", "mean_net_blocks"):
+                writer.add_scalar(f"profile/{name}/{key}", stats[key], step)
+        # A writer created here would otherwise keep its event file open
+        if owned:
+            writer.close()
+        else:
+            writer.flush()
+
+
+# Shared by everything instrumented in a process, disabled by default
+profiler = Profiler()
@@ -0,0 +1,165 @@
+import numpy as np
+
+from typing import List
+from arcade import Sprite
+
+
+def hit_box_polygons(sprites: List[Sprite],
+                     max_points: int | None = None) -> np.ndarray:
+    """
+    Packs the adjusted hit boxes of sprites into a single array.
+
+    Parameters:
+    max_points (int): Fixed number of points, e.g. to store hit boxes of
+    many steps alike, the largest hit box's by default
+
+    Returns:
+    np.ndarray: Shape (num_sprites, max_points, 2). Hit boxes with fewer
+    points are padded by repeating their first point, which only adds
+    zero length edges and leaves distances unchanged.
+    """
+    hit_boxes = [sprite.get_adjusted_hit_box() for sprite in sprites]
+    largest = max((len(points) for points in hit_boxes), default=1)
+    if max_points is None:
+        max_points = largest
+    elif largest > max_points:
+        raise ValueError(f"Hit box of {largest} points exceeds max_points")
+    polygons = np.empty((len(hit_boxes), max_points, 2))
+    for i, points in enumerate(hit_boxes):
+        polygons[i, :len(points)] = points
+        polygons[i, len(points):] = points[0]
+    return polygons
+
+
+def min_distances(polygon: np.ndarray, polygons: np.ndarray,
+                  cutoff: float | None = None) -> np.ndarray:
+    """
+    Exact minimum distances between one polygon and many others.
+
+    Parameters:
+    polygon (np.ndarray): Shape (P, 2), e.g. the rescuer's hit box
+    polygons (np.ndarray): Shape (N, M, 2), e.g. all astroid hit boxes
+    cutoff (float): Polygons whose bounding circles are further apart than
+    this are not evaluated and get a distance of infinity
+
+    Returns:
+    np.ndarray: Shape (N,), the distance between the closest points on the
+    outlines, including points on edges, or 0 if the polygons overlap
+    """
+    distances = np.full(len(polygons), np.inf)
+    if len(polygons) == 0:
+        return distances
+
+    # Points as complex numbers x + iy keep the vector algebra free of
+    # reductions over tiny coordinate axes, which dominate at this size
+    a = _as_complex(polygon)
+    b = _as_complex(polygons)
+
+    # Bounding circle cull
+    center = a.sum() / len(a)
+    radius = np.abs(a - center).max()
+    centers = b.sum(axis=1) / b.shape[1]
+    radii = np.abs(b - centers[:, None]).max(axis=1)
+    lower_bounds = np.abs(centers - center) - radius - radii
+    candidates = np.arange(len(b)) if cutoff is None else \
+        np.flatnonzero(lower_bounds < cutoff)
+    if len(candidates) == 0:
+        return distances
+
+    others = b[candidates]
+
+    # Edge i runs from vertex i to vertex i + 1, wrapping around
+    a_edges = np.roll(a, -1) - a
+    b_edges = np.roll(others, -1, axis=1) - others
+
+    # The closest points of two disjoint outlines always include a vertex of
+    # one of them, hence vertex to edge distances in both directions suffice
+    a_to_b = _point_segment_distance(
+        a[None, :, None], others[:, None], b_edges[:, None])
+    b_to_a = _point_segment_distance(
+        others[:, :, None], a[None, None], a_edges[None, None])
+    result = np.minimum(a_to_b.min(axis=(1, 2)), b_to_a.min(axis=(1, 2)))
+
+    # Outlines can only cross or contain each other if the circles overlap
+    overlapping = np.flatnonzero(lower_bounds[candidates] <= 0)
+    if len(overlapping):
+        crossing = _segments_cross(
+            a[None, :, None], a_edges[None, :, None],
+            others[overlapping, None], b_edges[overlapping, None])
+        contained = _contains(others[overlapping], a[0]) | \
+            _contains(a[None], others[overlapping, 0])
+        result[overlapping[crossing.any(axis=(1, 2)) | contained]] = 0
+
+    distances[candidates] = result
+    return distances
+
+
+def paired_min_distances(polygons: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Exact minimum distances as in min_distances, for many polygons at once,
+    e.g. the rescuer's and the astroids' hit boxes of every recorded step.
+
+    Parameters:
+    polygons (np.ndarray): Shape (N, P, 2)
+    others (np.ndarray): Shape (N, A, M, 2), compared to polygon i of the
+    same leading index
+
+    Returns:
+    np.ndarray: Shape (N, A), 0 where polygons overlap
+    """
+    a = _as_complex(polygons)
+    b = _as_complex(others)
+    a_edges = np.roll(a, -1, axis=-1) - a
+    b_edges = np.roll(b, -1, axis=-1) - b
+
+    # Axes (N, A, P, M), see min_distances
+    a_to_b = _point_segment_distance(
+        a[:, None, :, None], b[:, :, None], b_edges[:, :, None])
+    b_to_a = _point_segment_distance(
+        b[:, :, :, None], a[:, None, None], a_edges[:, None, None])
+    result = np.minimum(a_to_b.min(axis=(2, 3)), b_to_a.min(axis=(2, 3)))
+
+    crossing = _segments_cross(
+        a[:, None, :, None], a_edges[:, None, :, None],
+        b[:, :, None], b_edges[:, :, None]).any(axis=(2, 3))
+    contained = _contains(b, a[:, None, 0]) | _contains(a[:, None], b[..., 0])
+    result[crossing | contained] = 0
+    return result
+
+
+def _as_complex(points: np.ndarray) -> np.ndarray:
+    """ Coordinates of shape (..., 2) as complex numbers of shape (...) """
+    return np.ascontiguousarray(points, dtype=np.float64).view(np.complex128)[..., 0]
+
+
+def _point_segment_distance(p: np.ndarray, s: np.ndarray,
+                            d: np.ndarray) -> np.ndarray:
+    """ Distances between points p and segments s + t * d, t in [0, 1] """
+    w = p - s
+    # Zero length segments have a zero numerator and yield t = 0
+    t = (w * d.conj()).real / np.maximum(d.real ** 2 + d.imag ** 2, 1e-12)
+    np.clip(t, 0, 1, out=t)
+    return np.abs(w - t * d)
+
+
+def _segments_cross(a: np.ndarray, a_edge: np.ndarray,
+                    b: np.ndarray, b_edge: np.ndarray) -> np.ndarray:
+    """ Whether segments a + t * a_edge and b + s * b_edge properly intersect """
+    # Imaginary parts of conj(u) * v are the 2D cross products u x v
+    d1 = (b_edge.conj() * (a - b)).imag
+    d2 = (b_edge.conj() * (a + a_edge - b)).imag
+    d3 = (a_edge.conj() * (b - a)).imag
+    d4 = (a_edge.conj() * (b + b_edge - a)).imag
+    return (d1 * d2 < 0) & (d3 * d4 < 0)
+
+
+def _contains(polygons: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """ Even-odd test of point i against polygon i, broadcasting either side """
+    v0 = polygons
+    v1 = np.roll(polygons, -1, axis=-1)
+    px = np.real(points)[..., None]
+    py = np.imag(points)[..., None]
+    straddles = (v0.imag > py) != (v1.imag > py)
+    dy = np.where(straddles, v1.imag - v0.imag, 1)
+    x_cross = v0.real + (py - v0.imag) * (v1.real - v0.real) / dy
+    return (straddles & (px < x_cross)).sum(axis=-1) % 2 == 1
@@ -0,0 +1,147 @@
+import math
+import numpy as np
+
+from typing import Dict, Tuple
+from PIL import Image
+from arcade import Sprite, Texture
+
+
+class SoftwareRasterizer:
+    """
+    Composes grey scale views of the game in NumPy.
+
+    Mirrors what Game.custom_draw followed by arcade.get_image(...).convert("L")
+    produces, without requiring a window or an OpenGL context. Textures are
+    decoded once per process into grey scale and alpha planes and shared by
+    every rasterizer, so many headless games render from the same assets.
+    """
+
+    # Decoded planes, shared across instances
+    _textures: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    _backgrounds: Dict[Tuple[str, int, int], np.ndarray] = {}
+
+    def __init__(self, width: int, height: int, background: Texture):
+        self.width = width
+        self.height = height
+
+        key = (background.name, width, height)
+        if key not in self._backgrounds:
+            # The background is stretched over the whole window when drawn
+            image = background.image.convert("RGBA").resize(
+                (width, height), Image.BOX)
+            self._backgrounds[key], _ = self._decode(image)
+        self._background = self._backgrounds[key]
+
+        # Float canvases by region size, reused across renders
+        self._canvases: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def render(self, sprite_lists, x: int, y: int, width: int, height: int,
+               out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Parameters:
+        sprite_lists (list): Sprite lists in drawing order
+        x, y (int): Bottom left corner of the region in window coordinates
+        width, height (int): Size of the region
+        out (np.ndarray): Optional uint8 array of shape (height, width) the
+        image is written into instead of allocating a new one
+
+        Returns:
+        np.ndarray: A uint8 grey scale image of shape (height, width) with
+        the same layout as arcade.get_image, i.e. the first row is the top
+        of the region. Pixels outside of the window are black.
+        """
+        x, y = int(x), int(y)
+        canvas = self._canvases.get((height, width))
+        if canvas is None:
+            canvas = np.empty((height, width), dtype=np.float32)
+            self._canvases[(height, width)] = canvas
+        canvas.fill(0)
+
+        # Background rows are stored top down, so the crop is a plain offset
+        row_offset = self.height - y - height
+        r0, r1 = max(0, -row_offset), min(height, self.height - row_offset)
+        c0, c1 = max(0, -x), min(width, self.width - x)
+        if r0 < r1 and c0 < c1:
+            canvas[r0:r1, c0:c1] = self._background[
+                r0 + row_offset:r1 + row_offset, c0 + x:c1 + x]
+
+        for sprite_list in sprite_lists:
+            for sprite in sprite_list:
+                self._draw_sprite(canvas, x, y, sprite)
+
+        if out is None:
+            out = np.empty((height, width), dtype=np.uint8)
+        np.rint(canvas, out=canvas)
+        np.clip(canvas, 0, 255, out=canvas)
+        np.copyto(out, canvas, casting="unsafe")
+        return out
+
+    def _draw_sprite(self, canvas: np.ndarray, x: int, y: int, sprite: Sprite):
+        gray, alpha = self._texture(sprite.texture)
+        height, width = canvas.shape
+        texture_height, texture_width = gray.shape[0] - 2, gray.shape[1] - 2
+
+        scale = sprite.scale
+        angle = math.radians(sprite.angle)
+        cos, sin = math.cos(angle), math.sin(angle)
+        half_w = texture_width * scale / 2
+        half_h = texture_height * scale / 2
+        extent_x = abs(half_w * cos) + abs(half_h * sin)
+        extent_y = abs(half_w * sin) + abs(half_h * cos)
+
+        # Window pixels covered by the rotated sprite, clipped to the region
+        left = max(math.floor(sprite.center_x - extent_x), x)
+        right = min(math.ceil(sprite.center_x + extent_x), x + width)
+        bottom = max(math.floor(sprite.center_y - extent_y), y)
+        top = min(math.ceil(sprite.center_y + extent_y), y + height)
+        if left >= right or bottom >= top:
+            return
+
+        # Pixel centres relative to the sprite, rows ordered top down
+        dx = np.arange(left, right, dtype=np.float32) + 0.5 - sprite.center_x
+        dy = np.arange(top - 1, bottom - 1, -1,
+                       dtype=np.float32) + 0.5 - sprite.center_y
+        dx, dy = dx[None, :], dy[:, None]
+
+        # Undo the rotation and scaling to get coordinates in the padded texture
+        u = (dx * cos + dy * sin) / scale + texture_width / 2 + 1
+        v = texture_height / 2 - (dy * cos - dx * sin) / scale + 1
+
+        sampled_gray, sampled_alpha = self._bilinear(gray, alpha, u, v)
+
+        rows = slice(y + height - top, y + height - bottom)
+        cols = slice(left - x, right - x)
+        region = canvas[rows, cols]
+        region += sampled_alpha * (sampled_gray - region)
+
+    def _texture(self, texture: Texture) -> Tuple[np.ndarray, np.ndarray]:
+        entry = self._textures.get(texture.name)
+        if entry is None:
+            gray, alpha = self._decode(texture.image.convert("RGBA"))
+            # Transparent border, so sampling outside the texture fades out
+            entry = (np.pad(gray, 1), np.pad(alpha, 1))
+            self._textures[texture.name] = entry
+        return entry
+
+    @staticmethod
+    def _decode(image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+        rgba = np.asarray(image, dtype=np.float32)
+        # ITU-R 601-2 luma transform, as used by PIL's convert("L")
+        gray = rgba[..., 0] * 0.299 + rgba[..., 1] * 0.587 + rgba[..., 2] * 0.114
+        return gray, rgba[..., 3] / 255.0
+
+    @staticmethod
+    def _bilinear(gray: np.ndarray, alpha: np.ndarray,
+                  u: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Texel centres sit at i + 0.5
+        u = np.clip(u - 0.5, 0, gray.shape[1] - 1.001)
+        v = np.clip(v - 0.5, 0, gray.shape[0] - 1.001)
+        i0, j0 = u.astype(np.intp), v.astype(np.intp)
+        fu, fv = u - i0, v - j0
+
+        def sample(plane):
+            top = plane[j0, i0] * (1 - fu) + plane[j0, i0 + 1] * fu
+            bottom = plane[j0 + 1, i0] * (1 - fu) + plane[j0 + 1, i0 + 1] * fu
+            return top * (1 - fv) + bottom * fv
+
+        return sample(gray), sample(alpha)
@@ -0,0 +1,132 @@
+import zlib
+import numpy as np
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Tuple
+from PIL import Image
+
+
+class EpisodeRecorder:
+    """
+    Opt-in recording of the most recent episodes.
+
+    Frames are downsampled and zlib compressed as they are captured, only the
+    last `max_episodes` episodes are kept and encoding to GIF/MP4 happens on a
+    background thread, so recording never blocks or grows without bound.
+    Episodes longer than `max_frames` frames keep every other frame whenever
+    the cap is reached, so they are covered in full at a lower frame rate.
+    """
+
+    def __init__(self, max_episodes: int = 4, downsample: int = 2,
+                 compression_level: int = 1, fps: int = 45,
+                 max_frames: int = 1024):
+        if max_frames < 2:
+            raise ValueError("max_frames must be at least 2")
+        self.downsample = downsample
+        self.compression_level = compression_level
+        self.fps = fps
+        self.max_frames = max_frames
+
+        # Finished episodes as frame shape, frames and stride, the oldest is
+        # dropped once the buffer is full
+        self.episodes: deque = deque(maxlen=max_episodes)
+        self._current: List[bytes] = []
+        # Every stride-th captured frame of the running episode is kept
+        self._stride = 1
+        self._num_captured = 0
+        self._frame_shape: Tuple[int, ...] | None = None
+
+        self._encoder = ThreadPoolExecutor(max_workers=1)
+        self._num_saved = 0
+
+    def start_episode(self):
+        """ Closes the running episode and starts a new one """
+        if self._current:
+            self.episodes.append((self._frame_shape, self._current, self._stride))
+        self._current = []
+        self._stride = 1
+        self._num_captured = 0
+
+    def capture(self, frame: np.ndarray):
+        """
+        Parameters:
+        frame (np.ndarray): uint8 image of shape (height, width) or
+        (height, width, channels), the first row being the top of the screen
+        """
+        skip = self._num_captured % self._stride
+        self._num_captured += 1
+        if skip:
+            return
+        if len(self._current) == self.max_frames:
+            # Kept frames stay evenly spaced, see the class docstring
+            del self._current[1::2]
+            self._stride *= 2
+            if (self._num_captured - 1) % self._stride:
+                return
+
+        frame = np.ascontiguousarray(
+            frame[::self.downsample, ::self.downsample], dtype=np.uint8)
+        self._frame_shape = frame.shape
+        self._current.append(zlib.compress(
+            frame.tobytes(), self.compression_level))
+
+    def frames(self, episode: int = -1) -> List[np.ndarray]:
+        """ Decompressed frames of a finished episode """
+        shape, frames, _ = self.episodes[episode]
+        return [np.frombuffer(zlib.decompress(frame), dtype=np.uint8).reshape(shape)
+                for frame in frames]
+
+    def save(self, episode: int = -1, filename: str | None = None) -> Future:
+        """
+        Encodes a finished episode in the background.
+
+        Parameters:
+        episode (int): Index into the buffered episodes, -1 is the latest
+        filename (str): Target file, '.gif' or '.mp4'
+
+        Returns:
+        Future: Resolves to the filename once the video has been written
+        """
+        if filename is None:
+            filename = "Rescue-Mission_" + str(self._num_saved) + ".gif"
+        self._num_saved += 1
+
+        # Grab the compressed frames now, the ring buffer may move on meanwhile
+        shape, frames, stride = self.episodes[episode]
+        return self._encoder.submit(self._encode, shape, frames,
+                                    self.fps / stride, filename)
+
+    def close(self):
+        """ Waits for pending encodings to finish """
+        self._encoder.shutdown(wait=True)
+
+    def _encode(self, shape: Tuple[int, ...], frames: List[bytes], fps: float,
+                filename: str) -> str:
+        images = [np.frombuffer(zlib.decompress(frame), dtype=np.uint8).reshape(shape)
+                  for frame in frames]
+
+        if filename.endswith(".mp4"):
+            import cv2
+
+            height, width = shape[:2]
+            writer = cv2.VideoWriter(
+                filename, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            for image in images:
+                if image.ndim == 2:
+                    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+                else:
+                    image = cv2.cvtColor(image[..., :3], cv2.COLOR_RGB2BGR)
+                writer.write(image)
+            writer.release()
+        else:
+            images = [Image.fromarray(image) for image in images]
+            images[0].save(
+                filename,
+                save_all=True,
+                append_images=images[1:],
+                duration=1000 / fps,
+                loop=0)
+
+        print("Video saved as " + filename)
+        return filename
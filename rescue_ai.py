@@ -1,5 +1,8 @@
-from stable_baselines3 import PPO
+import argparse
+import threading
+
 from env import Environment
+from inference_server import InferenceServer
 
 SCREEN_TITLE = "RescuAI"
 SPRITE_SCALING = 0.5
@@ -10,18 +13,46 @@ SPRITE_SIZE = int(SPRITE_IMAGE_SIZE * SPRITE_SCALING)
 SCREEN_WIDTH = SPRITE_SIZE * 8
 SCREEN_HEIGHT = SPRITE_SIZE * 8
 
+
+def run_agent(env: Environment, server: InferenceServer,
+              stop: threading.Event | None = None):
+    ''' Steps an environment with actions from the server until stopped '''
+    obs = env.reset()[0]
+    while stop is None or not stop.is_set():
+        obs, _, done = env.step(server.predict(obs))[0:3]
+        if done:
+            obs = env.reset()[0]
+
+
 def main():
     '''
     This function performs inference indefinitely with the most advanced checkpoint.
+
+    The first agent is shown in a window, further agents run headless in
+    their own threads. All of them share one inference server, which batches
+    their observations.
     '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--agents", type=int, default=1,
+                        help="Number of agents, all but the first run headless")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Take the most likely actions instead of sampling")
+    args = parser.parse_args()
+    if args.agents < 1:
+        parser.error("--agents must be at least 1")
+
+    server = InferenceServer.from_checkpoint(
+        "checkpoints/ckpt_3", deterministic=args.deterministic)
+
+    for _ in range(args.agents - 1):
+        env = Environment(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE,
+                          renderer="software")
+        threading.Thread(target=run_agent, args=(env, server), daemon=True).start()
+
+    # The window has to be driven from the main thread
     env = Environment(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
-    model = PPO.load("checkpoints/ckpt_3", env=env)
+    run_agent(env, server)
+
 
-    obs = env.reset()[0]
-    while True:
-        obs, _, done = env.step(model.predict(obs)[0])[0:3]
-        if done:
-            obs = env.reset()[0]
-            
 if __name__ == "__main__":
     main()
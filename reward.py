@@ -0,0 +1,276 @@
+import numpy as np
+
+from typing import Dict, List, Sequence
+
+
+class _RunningWindow:
+    """
+    Per environment ring buffer of the last `size` values and their sum.
+
+    Value k of an episode goes to slot k % size, the sum is updated
+    incrementally and recomputed exactly whenever a ring wraps around, so
+    rounding errors cannot pile up over long episodes.
+    """
+
+    def __init__(self, num_envs: int, size: int):
+        self.size = size
+        self.values = np.zeros((num_envs, size))
+        # Values pushed since the last clear
+        self.counts = np.zeros(num_envs, dtype=np.int64)
+        self.sums = np.zeros(num_envs)
+
+    def clear(self, rows):
+        # Stale values are ignored until overwritten, see push
+        self.counts[rows] = 0
+        self.sums[rows] = 0
+
+    def push(self, rows, values: np.ndarray) -> np.ndarray:
+        """
+        Appends a value per row, dropping the oldest one of full rings.
+
+        Parameters:
+        rows: Index or slice of the rows, one per value
+
+        Returns:
+        np.ndarray: The mean as Environment always computed it, i.e. the sum
+        after appending divided by the length before appending, at least 1
+        """
+        counts = self.counts[rows].copy()
+        slots = counts % self.size
+        ring = self.values[rows]
+        index = np.arange(len(counts))
+        full = counts >= self.size
+        sums = self.sums[rows] + values - ring[index, slots] * full
+        ring[index, slots] = values
+
+        wrapped = slots == self.size - 1
+        if np.count_nonzero(wrapped):
+            sums[wrapped] = ring[wrapped].sum(axis=1)
+
+        self.values[rows] = ring
+        self.sums[rows] = sums
+        self.counts[rows] = counts + 1
+        return sums / np.maximum(counts - (counts - self.size) * full, 1)
+
+
+class SmoothedReward:
+    """
+    The reward of Environment.reward_function for a batch of environments.
+
+    Navigation progress towards the target and progress away from the
+    closest astroid in the vicinity are each averaged with their last 10
+    values, see Environment.reward_function for the exact rules. All state
+    is kept in arrays with one row per environment, a step of all
+    environments is a single call.
+    """
+
+    def __init__(self, num_envs: int, window: int = 10,
+                 navigation_scale: float = 1000):
+        """
+        Parameters:
+        num_envs (int): Number of environments, i.e. rows
+        window (int): Number of past values averaged
+        navigation_scale (float): Weight of the navigation reward
+        """
+        self.num_envs = num_envs
+        self.navigation_scale = navigation_scale
+        # NaN marks that there is no previous distance yet
+        self.prev_movement_distance = np.full(num_envs, np.nan)
+        self.prev_avoidance_distance = np.full(num_envs, np.nan)
+        self.movement = _RunningWindow(num_envs, window)
+        self.avoidance = _RunningWindow(num_envs, window)
+
+    def reset(self, rows: Sequence[int] | None = None):
+        """ Starts new episodes for the given rows, all by default """
+        rows = slice(None) if rows is None else np.asarray(rows, dtype=np.int64)
+        self.prev_movement_distance[rows] = np.nan
+        self.prev_avoidance_distance[rows] = np.nan
+        self.movement.clear(rows)
+        self.avoidance.clear(rows)
+
+    def step(self, targets: np.ndarray, rescuers: np.ndarray,
+             nearest: np.ndarray, rows: Sequence[int] | None = None) -> np.ndarray:
+        """
+        Parameters:
+        targets (np.ndarray): Shape (N, 2), target positions
+        rescuers (np.ndarray): Shape (N, 2), rescuer positions, in the same
+        units as the targets
+        nearest (np.ndarray): Shape (N,), distance to the closest astroid,
+        infinity if none is in the vicinity
+        rows (Sequence[int]): Environments the inputs belong to, all by
+        default
+
+        Returns:
+        np.ndarray: Shape (N,), the rewards
+        """
+        rows = slice(None) if rows is None else np.asarray(rows, dtype=np.int64)
+
+        ########################################################
+        ############### Rescuer movement reward ################
+        ########################################################
+
+        offset = np.asarray(rescuers, dtype=np.float64) - targets
+        distance = np.sqrt(offset[:, 0] ** 2 + offset[:, 1] ** 2)
+        progress = self.prev_movement_distance[rows] - distance
+        progress[np.isnan(progress)] = 0
+        self.prev_movement_distance[rows] = distance
+        movement_reward = 0.5 * progress + 0.5 * self.movement.push(rows, progress)
+
+        ########################################################
+        ############### Astroid avoidance reward ###############
+        ########################################################
+
+        nearest = np.asarray(nearest, dtype=np.float64)
+        far = np.isinf(nearest)
+        previous = self.prev_avoidance_distance[rows]
+        progress = nearest - previous
+        # No astroid in the vicinity, or no previous distance yet
+        progress[far | np.isnan(previous)] = 0
+        # Without astroids in the vicinity the window restarts, while the
+        # previous distance is kept
+        self.prev_avoidance_distance[rows] = np.where(far, previous, nearest)
+        self.avoidance.counts[rows] *= ~far
+        self.avoidance.sums[rows] *= ~far
+        avoidance_reward = 0.5 * progress + 0.5 * self.avoidance.push(rows, progress)
+
+        # Scaling to match magnitude
+        return self.navigation_scale * movement_reward + avoidance_reward
+
+
+def _window_means(progress: np.ndarray, position: np.ndarray,
+                  window: int) -> np.ndarray:
+    """
+    The means of _RunningWindow.push over a whole stream of values.
+
+    Parameters:
+    progress (np.ndarray): Shape (T,), the pushed values
+    position (np.ndarray): Shape (T,), number of values pushed since the
+    last clear, before each value
+    """
+    # Value t is averaged with the last min(position, window - 1) values
+    sums = progress.copy()
+    for lag in range(1, window):
+        sums[lag:] += np.where(position[lag:] >= lag, progress[:-lag], 0.0)
+    return sums / np.clip(position, 1, window)
+
+
+class TrajectoryRewards:
+    """
+    Recomputes the rewards of recorded trajectories for other reward
+    parameters, without simulating again.
+
+    The expensive part, the hit box distances between the rescuer and the
+    astroids, does not depend on the parameters and is computed once. Every
+    parameter set is then a handful of array operations over the whole
+    recording, see rewards.
+    """
+
+    def __init__(self, rescuers: np.ndarray, targets: np.ndarray,
+                 nearest: np.ndarray, dones: np.ndarray, successes: np.ndarray):
+        """
+        Parameters:
+        rescuers, targets (np.ndarray): Shape (T, 2), positions in pixels
+        after each step
+        nearest (np.ndarray): Shape (T,), hit box distance to the closest
+        astroid after each step, regardless of the vicinity
+        dones (np.ndarray): Shape (T,), whether the step ended an episode.
+        The first step starts an episode.
+        successes (np.ndarray): Shape (T,), whether Alfred was delivered
+        """
+        dones = np.asarray(dones, dtype=bool)
+        # Steps which ended episodes are not smoothed, they are fixed rewards
+        self.rewarded = np.flatnonzero(~dones)
+        self.dones = dones
+        self.successes = np.asarray(successes, dtype=bool)
+        self.offsets = (np.asarray(rescuers, dtype=np.float64)
+                        - targets)[self.rewarded]
+        self.nearest = np.asarray(nearest, dtype=np.float64)[self.rewarded]
+
+        # Episode and index within it of every rewarded step
+        episodes = np.concatenate(([0], np.cumsum(dones)[:-1]))[self.rewarded]
+        steps = np.arange(len(self.rewarded))
+        starts = np.flatnonzero(np.diff(episodes, prepend=-1))
+        self._episode_start = np.repeat(starts, np.diff(np.append(starts, len(steps))))
+        self._position = steps - self._episode_start
+
+    @classmethod
+    def from_dataset(cls, reader, chunk_size: int = 4096) -> "TrajectoryRewards":
+        """ Of a dataset recorded with sprite states, see trajectory.record """
+        from proximity import paired_min_distances
+
+        nearest = np.empty(len(reader))
+        for start in range(0, len(reader), chunk_size):
+            stop = min(start + chunk_size, len(reader))
+            steps = reader.slice(start, stop, ["rescuer_hit_box", "astroid_hit_boxes"])
+            nearest[start:stop] = paired_min_distances(
+                steps["rescuer_hit_box"], steps["astroid_hit_boxes"]).min(
+                axis=1, initial=np.inf)
+        steps = reader.slice(0, len(reader), ["rescuer_position", "target_position",
+                                              "done", "success"])
+        return cls(steps["rescuer_position"], steps["target_position"], nearest,
+                   steps["done"], steps["success"])
+
+    def rewards(self, navigation_scale: float = 1000, vicinity: float = 130,
+                window: int = 10, smoothing: float = 0.5,
+                screen_width: float = 512, collision_reward: float = -10,
+                success_reward: float = 10) -> np.ndarray:
+        """
+        Parameters:
+        navigation_scale, vicinity, window: See SmoothedReward and
+        Environment.vicinity
+        smoothing (float): Weight of the window mean, 0.5 in Environment
+        screen_width (float): Positions are normalized by it, as in the
+        observations
+
+        Returns:
+        np.ndarray: Shape (T,), the reward of every recorded step
+        """
+        rewards = np.where(self.successes, success_reward, collision_reward)
+        rewarded = self.rewarded
+        if len(rewarded) == 0:
+            return rewards.astype(np.float64)
+        position, episode_start = self._position, self._episode_start
+        steps = np.arange(len(rewarded))
+
+        ########################################################
+        ############### Rescuer movement reward ################
+        ########################################################
+
+        distance = np.hypot(self.offsets[:, 0], self.offsets[:, 1]) / screen_width
+        progress = np.zeros(len(rewarded))
+        progress[1:] = distance[:-1] - distance[1:]
+        progress[position == 0] = 0
+        movement = (1 - smoothing) * progress + \
+            smoothing * _window_means(progress, position, window)
+
+        ########################################################
+        ############### Astroid avoidance reward ###############
+        ########################################################
+
+        near = self.nearest < vicinity
+        # Latest step with an astroid in the vicinity, up to the previous step
+        latest_near = np.maximum.accumulate(np.where(near, steps, -1))
+        previous_near = np.concatenate(([-1], latest_near[:-1]))
+        has_previous = previous_near >= episode_start
+        progress = np.where(
+            near & has_previous,
+            self.nearest - self.nearest[np.maximum(previous_near, 0)], 0.0)
+        # The window restarts at every step without astroids in the vicinity
+        latest_far = np.maximum.accumulate(np.where(near, -1, steps))
+        avoidance_position = steps - np.maximum(latest_far, episode_start)
+        avoidance = (1 - smoothing) * progress + \
+            smoothing * _window_means(progress, avoidance_position, window)
+
+        rewards = rewards.astype(np.float64)
+        rewards[rewarded] = navigation_scale * movement + avoidance
+        return rewards
+
+    def sweep(self, variants: List[Dict]) -> np.ndarray:
+        """
+        Parameters:
+        variants (List[Dict]): Keyword arguments of rewards
+
+        Returns:
+        np.ndarray: Shape (V, T), the rewards per variant
+        """
+        return np.stack([self.rewards(**variant) for variant in variants])
@@ -0,0 +1,123 @@
+import math
+import numpy as np
+
+from typing import Dict, List, Set
+from arcade import Sprite
+
+
+def bounding_radius(sprite: Sprite) -> float:
+    """ Radius around the center which contains the sprite at any angle """
+    return math.hypot(sprite.width, sprite.height) / 2
+
+
+class UniformGrid:
+    """
+    Uniform grid over bounding circles, e.g. of all astroids.
+
+    Every object lives in the cell containing its center. Queries visit the
+    cells overlapping the query area grown by the largest radius, hence only
+    objects near the query are tested. Updates only move the objects whose
+    cell changed.
+
+    Queries are conservative: they return every object whose bounding
+    circle reaches the query area. Callers run their exact test, e.g. hit
+    box overlap, on the returned objects only.
+    """
+
+    def __init__(self, width: float, height: float, cell_size: float = 128):
+        """
+        Parameters:
+        width, height (float): Extent of the area, objects beyond it are
+        kept in the border cells
+        cell_size (float): Side length of the cells
+        """
+        self.cell_size = cell_size
+        self.columns = max(1, int(np.ceil(width / cell_size)))
+        self.rows = max(1, int(np.ceil(height / cell_size)))
+
+        self.centers = np.empty((0, 2))
+        self.radii = np.empty(0)
+        self._cells = np.empty(0, dtype=np.int64)
+        self._buckets: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.radii)
+
+    def _cell_coords(self, points: np.ndarray) -> np.ndarray:
+        coords = np.floor(points / self.cell_size).astype(np.int64)
+        np.clip(coords[..., 0], 0, self.columns - 1, out=coords[..., 0])
+        np.clip(coords[..., 1], 0, self.rows - 1, out=coords[..., 1])
+        return coords
+
+    def update(self, centers: np.ndarray, radii: np.ndarray):
+        """
+        Parameters:
+        centers (np.ndarray): Shape (N, 2), object i keeps index i in queries
+        radii (np.ndarray): Shape (N,), bounding circle radii
+        """
+        coords = self._cell_coords(centers)
+        cells = coords[:, 1] * self.columns + coords[:, 0]
+
+        if len(cells) != len(self._cells):
+            # Objects were added or removed, start over
+            self._buckets = {}
+            moved = np.arange(len(cells))
+        else:
+            moved = np.flatnonzero(cells != self._cells)
+            for i in moved.tolist():
+                self._buckets[int(self._cells[i])].discard(i)
+
+        for i, cell in zip(moved.tolist(), cells[moved].tolist()):
+            self._buckets.setdefault(cell, set()).add(i)
+
+        self.centers = centers
+        self.radii = radii
+        self._cells = cells
+
+    def _candidates(self, left, bottom, right, top) -> List[int]:
+        """ Objects in the cells which may reach the given box """
+        if len(self.radii) == 0:
+            return []
+        grow = self.radii.max()
+        (first_column, first_row), (last_column, last_row) = self._cell_coords(
+            np.array([(left - grow, bottom - grow), (right + grow, top + grow)]))
+        candidates = []
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                bucket = self._buckets.get(row * self.columns + column)
+                if bucket:
+                    candidates.extend(bucket)
+        candidates.sort()
+        return candidates
+
+    def query_radius(self, x: float, y: float, radius: float) -> np.ndarray:
+        """ Indices of the objects whose bounding circle reaches the circle """
+        candidates = np.array(
+            self._candidates(x - radius, y - radius, x + radius, y + radius),
+            dtype=np.int64)
+        if len(candidates) == 0:
+            return candidates
+        offset = self.centers[candidates] - (x, y)
+        reach = radius + self.radii[candidates]
+        return candidates[np.einsum("ij,ij->i", offset, offset) <= reach * reach]
+
+    def query_box(self, left: float, bottom: float, right: float,
+                  top: float) -> np.ndarray:
+        """ Indices of the objects whose bounding circle reaches the box """
+        candidates = np.array(self._candidates(left, bottom, right, top),
+                              dtype=np.int64)
+        if len(candidates) == 0:
+            return candidates
+        centers = self.centers[candidates]
+        # Offset from the closest point of the box
+        offset = centers - np.clip(centers, (left, bottom), (right, top))
+        reach = self.radii[candidates]
+        return candidates[np.einsum("ij,ij->i", offset, offset) <= reach * reach]
+
+    def query_outside(self, left: float, bottom: float, right: float,
+                      top: float) -> np.ndarray:
+        """ Indices of the objects whose bounding circle is not inside the box """
+        lower = self.centers - self.radii[:, None]
+        upper = self.centers + self.radii[:, None]
+        return np.flatnonzero((lower[:, 0] < left) | (lower[:, 1] < bottom) |
+                              (upper[:, 0] > right) | (upper[:, 1] > top))
@@ -0,0 +1,14 @@
+import os
+import sys
+
+'''
+The modules live at the top level of the repository and load their textures
+relative to it, hence tests run from there, e.g. python -m pytest tests
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# Picks the headless OpenGL platform, before any test imports arcade
+import game  # noqa: E402,F401
@@ -0,0 +1,29 @@
+import threading
+
+from arcade import Sprite
+from assets import AssetRegistry
+
+
+def test_concurrent_acquire_hands_out_each_sprite_once():
+    registry = AssetRegistry()
+    sprites = [registry.acquire(Sprite, "textures/astroid_1.png") for _ in range(64)]
+    for sprite in sprites:
+        registry.release(sprite)
+
+    acquired = [[] for _ in range(8)]
+    barrier = threading.Barrier(8)
+
+    def worker(out):
+        barrier.wait()
+        for _ in range(8):
+            out.append(registry.acquire(Sprite, "textures/astroid_1.png"))
+
+    threads = [threading.Thread(target=worker, args=(out,)) for out in acquired]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [id(sprite) for out in acquired for sprite in out]
+    assert len(set(ids)) == 64
+    assert set(ids) == {id(sprite) for sprite in sprites}
@@ -0,0 +1,22 @@
+from stable_baselines3 import PPO
+from compress import make_env, prune_fc1, success_rate
+from evaluate import README_ASTROIDS, load_agent, play
+from export import ActionModel
+
+CHECKPOINT = "checkpoints/ckpt_3"
+
+
+def test_variants_are_evaluated_as_checkpoints():
+    curriculum = {"num_astroids": README_ASTROIDS}
+    model = ActionModel(PPO.load(CHECKPOINT, device="cpu").policy).eval()
+
+    result = success_rate(model, 300, seed=2, curriculum=curriculum)
+    env = make_env(curriculum)
+    expected = play(env, load_agent(CHECKPOINT, 2), 300, 2)
+    env.close()
+    assert {key: result[key] for key in expected} == expected
+
+    # Variants sample with equally seeded generators
+    pruned = prune_fc1(model, 0.5).eval()
+    assert success_rate(pruned, 300, seed=2, curriculum=curriculum) == \
+        success_rate(pruned, 300, seed=2, curriculum=curriculum)
@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+import torch
+
+from stable_baselines3 import PPO
+from curriculum import DEFAULT_STAGES, freeze, make_env, run, validate_stages
+from ppo_model import CompactRolloutBuffer, CustomPolicy
+
+
+def test_frozen_checkpoints_load(tmp_path):
+    venv = make_env({"screen_size": 448, "num_astroids": 0}, num_envs=2, seed=0)
+    model = PPO(CustomPolicy, venv, n_steps=16, batch_size=16, n_epochs=1, seed=0,
+                rollout_buffer_class=CompactRolloutBuffer)
+    trainable = freeze(model.policy, ["decoder"])
+    decoder = model.policy.features_extractor.extractor.decoder
+    assert trainable == sum(p.numel() for p in model.policy.parameters()) - \
+        sum(p.numel() for p in decoder.parameters())
+
+    frozen = {name: value.clone() for name, value in decoder.state_dict().items()}
+    model.learn(32)
+    for name, value in decoder.state_dict().items():
+        torch.testing.assert_close(value, frozen[name], rtol=0, atol=0)
+
+    model.save(tmp_path / "stage")
+    loaded = PPO.load(tmp_path / "stage", env=venv,
+                      rollout_buffer_class=CompactRolloutBuffer)
+    freeze(loaded.policy, ["decoder"])
+    loaded.learn(16)
+    venv.close()
+
+
+@pytest.mark.parametrize("change, message", [
+    ({"frozen": ["decodr"]}, "no submodule"),
+    ({"astroid_margin": [0, 10]}, "astroid_margin"),
+    ({"astroid_speed": [50, 10]}, "astroid_speed"),
+    ({"num_asteroids": 3}, "unknown keys"),
+    ({"success_threshold": 1.5}, "success_threshold"),
+    ({"max_timesteps": 0}, "max_timesteps"),
+    ({"physics": "box2d"}, "physics"),
+    ({"name": "ckpt_1"}, "twice"),
+])
+def test_invalid_stages_are_rejected(change, message):
+    stages = copy.deepcopy(DEFAULT_STAGES)
+    stages[-1].update(change)
+    with pytest.raises(ValueError, match=message):
+        validate_stages(stages)
+
+
+def test_runs_fail_before_training(tmp_path):
+    stages = copy.deepcopy(DEFAULT_STAGES)
+    del stages[-1]["success_threshold"]
+    with pytest.raises(ValueError, match="lacks success_threshold"):
+        run(stages, str(tmp_path / "run"))
+    with pytest.raises(ValueError, match="Unknown first stage"):
+        run(DEFAULT_STAGES, str(tmp_path / "run"), first_stage="ckpt_4")
+    assert not (tmp_path / "run").exists()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from stable_baselines3 import PPO
+from evaluate import load_agent
+
+CHECKPOINT = "checkpoints/ckpt_3"
+
+
+def test_checkpoints_sample_with_the_seeded_generator():
+    policy = PPO.load(CHECKPOINT, device="cpu").policy
+    policy.observation_space.seed(0)
+    observations = [policy.observation_space.sample() for _ in range(50)]
+
+    def actions(**kwargs):
+        act = load_agent(CHECKPOINT, **kwargs)
+        return np.array([act(obs) for obs in observations])
+
+    sampled = actions(seed=0)
+    np.testing.assert_array_equal(actions(seed=0), sampled)
+    assert (actions(seed=1) != sampled).any()
+
+    most_likely = actions(seed=0, deterministic=True)
+    expected = np.array([policy.predict(obs, deterministic=True)[0]
+                         for obs in observations])
+    np.testing.assert_array_equal(most_likely, expected)
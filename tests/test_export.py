@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import torch
+
+from stable_baselines3 import PPO
+from export import export
+from policy_runtime import ExportedPolicy, actions_from_logits
+
+CHECKPOINT = "checkpoints/ckpt_3"
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    paths = export(CHECKPOINT, str(tmp_path_factory.mktemp("export") / "ckpt_3"))
+    return PPO.load(CHECKPOINT, device="cpu").policy.eval(), paths
+
+
+def observations(space, n: int):
+    space.seed(n)
+    samples = [space.sample() for _ in range(n)]
+    return {key: np.stack([sample[key] for sample in samples])
+            for key in space.spaces}
+
+
+@pytest.mark.parametrize("suffix", [".pt", ".onnx"])
+@pytest.mark.parametrize("n", [1, 5, 33])
+def test_runtime_matches_policy(exported, suffix, n):
+    policy, paths = exported
+    runtime = ExportedPolicy(next(path for path in paths if path.endswith(suffix)),
+                             deterministic=True)
+    obs = observations(policy.observation_space, n)
+
+    with torch.inference_mode():
+        obs_tensor, _ = policy.obs_to_tensor(obs)
+        distributions = policy.get_distribution(obs_tensor).distribution
+        expected = torch.cat([d.logits for d in distributions], dim=1).numpy()
+    # Categorical keeps normalized logits
+    logits = runtime.logits(obs)
+    logits = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+    np.testing.assert_allclose(logits, expected, atol=1e-4)
+
+    expected_actions, _ = policy.predict(obs, deterministic=True)
+    np.testing.assert_array_equal(runtime.predict(obs), expected_actions)
+    # Single observations keep their layout
+    single = {key: value[0] for key, value in obs.items()}
+    np.testing.assert_array_equal(runtime.predict(single), expected_actions[0])
+
+
+def test_seeded_sampling_repeats(exported):
+    policy, paths = exported
+    obs = observations(policy.observation_space, 33)
+    actions = [ExportedPolicy(paths[0], seed=3).predict(obs) for _ in range(2)]
+    np.testing.assert_array_equal(*actions)
+    assert policy.action_space.contains(actions[0][0])
+
+
+def test_sampled_actions_follow_the_softmax():
+    logits = np.array([[0.0, 1.0, -1.0, 2.0, 5.0, -3.0]])
+    draws = actions_from_logits(np.repeat(logits, 40000, axis=0), [4, 2],
+                                np.random.default_rng(0))
+    for dim, (start, size) in enumerate([(0, 4), (4, 2)]):
+        split = logits[0, start:start + size]
+        expected = np.exp(split) / np.exp(split).sum()
+        frequencies = np.bincount(draws[:, dim], minlength=size) / len(draws)
+        np.testing.assert_allclose(frequencies, expected, atol=0.01)
+    np.testing.assert_array_equal(actions_from_logits(logits, [4, 2]), [[3, 0]])
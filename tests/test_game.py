@@ -0,0 +1,30 @@
+import pytest
+
+from game import make_game
+
+
+@pytest.fixture
+def game():
+    game = make_game(512, 512, None, renderer="software")
+    game.setup()
+    yield game
+    game.close()
+
+
+@pytest.mark.parametrize("margin", [(0, 0), (10, 50), (20, 500), (600, 700)])
+def test_margins_off_screen_are_rejected(game, margin):
+    with pytest.raises(ValueError):
+        game.set_curriculum(astroid_margin=margin)
+    assert game.astroid_margin == (20, 50)
+
+
+@pytest.mark.parametrize("margin", [(20, 20), (20, 50), (200, 492)])
+def test_respawned_astroids_are_on_screen(game, margin):
+    game.set_curriculum(num_astroids=8, astroid_margin=margin,
+                        astroid_speed=(200, 400))
+    game.seed(0)
+    game.reset()
+    for _ in range(300):
+        game.custom_update()
+        for astroid in game.asteroids_list:
+            assert not game._has_moved_beyond_screen(astroid)
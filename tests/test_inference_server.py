@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from env import Environment
+from inference_server import InferenceServer
+from ppo_model import CustomPolicy
+
+
+@pytest.fixture(scope="module")
+def setup():
+    env = Environment(512, 512, "test", renderer="software", obs_size=64)
+    torch.manual_seed(0)
+    policy = CustomPolicy(env.observation_space, env.action_space,
+                          lr_schedule=lambda _: 0.0).eval()
+    observations = [env.reset(seed=0)[0]]
+    rng = np.random.default_rng(0)
+    for _ in range(9):
+        obs = env.step(rng.integers(0, 4, size=1))[0]
+        observations.append({key: value.copy() for key, value in obs.items()})
+    env.close()
+    return policy, observations
+
+
+def test_full_batches_match_single_predictions(setup):
+    policy, observations = setup
+    with InferenceServer(policy, max_batch_size=4, max_delay=0.2,
+                         deterministic=True) as server:
+        futures = [server.submit(obs) for obs in observations]
+        actions = [future.result() for future in futures]
+        stats = server.stats()
+
+    # Batches close once full, the last one at its deadline
+    assert stats["batch_size_histogram"] == {2: 1, 4: 2}
+    for obs, action in zip(observations, actions):
+        expected, _ = policy.predict(obs, deterministic=True)
+        np.testing.assert_array_equal(action, expected)
+
+
+def test_lone_requests_wait_for_the_deadline(setup):
+    policy, observations = setup
+    with InferenceServer(policy, max_batch_size=64, max_delay=0.05) as server:
+        assert not server.deterministic
+        start = time.perf_counter()
+        action = server.predict(observations[0])
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+
+    assert elapsed >= 0.05
+    assert stats["batch_size_histogram"] == {1: 1}
+    assert policy.action_space.contains(action)
+
+
+def test_close_answers_pending_requests(setup):
+    policy, observations = setup
+    server = InferenceServer(policy, max_batch_size=3, max_delay=10)
+    futures = [server.submit(obs) for obs in observations]
+    server.close()
+    assert all(future.done() for future in futures)
+    assert server.stats()["requests"] == len(observations)
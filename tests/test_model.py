@@ -0,0 +1,19 @@
+import torch
+
+from ppo_model import Custom_Policy
+
+
+def test_batched_forward_matches_single_samples():
+    torch.manual_seed(0)
+    model = Custom_Policy(image_shape=(64, 64)).eval()
+    features = {"numerical": torch.rand(6, 4),
+                "image": torch.randint(0, 256, (6, 64, 64)).float()}
+
+    with torch.no_grad():
+        batched = model(features)
+        single = torch.cat([model({key: value[i:i + 1]
+                                   for key, value in features.items()})
+                            for i in range(6)])
+
+    assert batched.shape == (6, 8)
+    torch.testing.assert_close(batched, single)
@@ -0,0 +1,124 @@
+import math
+import numpy as np
+import pytest
+
+# game picks the headless OpenGL platform, before anything imports arcade
+from game import make_game
+from auxilary import Move
+
+
+def drive(game, x, y, until, max_steps=300) -> bool:
+    """
+    Pushes the rescuer towards (x, y) until `until` holds.
+
+    Returns:
+    bool: Whether the last step ended the episode
+    """
+    rescuer = game.rescuer_list[0]
+    for _ in range(max_steps):
+        dx, dy = x - rescuer.center_x, y - rescuer.center_y
+        force = (math.copysign(250, dx) if abs(dx) > 5 else 0,
+                 math.copysign(250, dy) if abs(dy) > 5 else 0)
+        game.action_list.append(Move("MOVEMENT", rescuer, force))
+        done = game.custom_update()
+        if until():
+            return done
+    pytest.fail(f"Rescuer did not reach ({x}, {y})")
+
+
+@pytest.mark.parametrize("physics", ["pymunk", "numpy"])
+def test_scripted_episode(physics):
+    game = make_game(512, 512, None, renderer="software", physics=physics)
+    game.num_astroids = 1
+    game.setup()
+    game.seed(0)
+    game.reset()
+
+    engine = game.physics_engine
+    rescuer = game.rescuer_list[0]
+    engine.place(rescuer, 150, 150)
+    engine.place(game.alien_list[0], 150, 250)
+    engine.place(game.mother_ship_list[0], 350, 250)
+    # A resting astroid, out of the way until the rescuer heads for it
+    astroid = game.asteroids_list[0]
+    engine.set_state(astroid, (400, 420, 0, 0, 0, 0, 0, 0))
+
+    assert not drive(game, 150, 250, lambda: game.pick_up == 1)
+    assert rescuer.carries_resource
+    assert len(game.alien_list) == 0
+    assert len(game.resource_list) == 1
+
+    assert not drive(game, 350, 250, lambda: game.delivery == 1)
+    assert not rescuer.carries_resource
+    assert len(game.resource_list) == 0
+
+    assert drive(game, 400, 420, lambda: game.collision == 1)
+    assert (game.pick_up, game.delivery, game.collision) == (1, 1, 1)
+    game.close()
+
+
+@pytest.mark.parametrize("physics", ["pymunk", "numpy"])
+def test_seeded_episodes_replay(physics):
+    game = make_game(512, 512, None, renderer="software", physics=physics)
+    game.setup()
+
+    def episode(seed):
+        game.seed(seed)
+        game.reset()
+        positions = []
+        for _ in range(200):
+            game.custom_update()
+            positions.append([(astroid.center_x, astroid.center_y)
+                              for astroid in game.asteroids_list])
+        return positions
+
+    first = episode(7)
+    # Unseeded episodes in between keep the physics space
+    for _ in range(3):
+        game.reset()
+        for _ in range(100):
+            game.custom_update()
+    assert episode(7) == first
+    game.close()
+
+
+@pytest.mark.parametrize("physics, rebuild", [("pymunk", True), ("numpy", True),
+                                              ("numpy", False)])
+def test_restored_snapshots_replay(physics, rebuild):
+    game = make_game(512, 512, None, renderer="software", physics=physics)
+    game.setup()
+    game.seed(1)
+    game.reset()
+    rng = np.random.default_rng(0)
+    rescuer = game.rescuer_list[0]
+
+    def push(force):
+        game.action_list.append(Move("MOVEMENT", rescuer, tuple(force)))
+        if game.custom_update():
+            game.reset()
+
+    for _ in range(60):
+        push(rng.uniform(-300, 300, 2))
+    snapshot = game.snapshot()
+    forces = rng.uniform(-300, 300, (200, 2))
+
+    def replay():
+        game.restore(snapshot, rebuild=rebuild)
+        assert game.snapshot() == snapshot
+        states = []
+        for force in forces:
+            push(force)
+            states.append([game.physics_engine.get_state(sprite) for sprite in
+                           [*game.rescuer_list, *game.asteroids_list]] +
+                          [(game.pick_up, game.delivery, game.collision)])
+        return states
+
+    first = replay()
+    # Different histories in between, some of them in a new episode
+    for i in range(4):
+        if i % 2:
+            game.reset()
+        for _ in range(rng.integers(20, 120)):
+            push(rng.uniform(-300, 300, 2))
+        assert replay() == first
+    game.close()
@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+
+import pytest
+
+from profiling import Profiler
+
+
+def profile() -> Profiler:
+    profiler = Profiler(max_events=5)
+    profiler.enable()
+    for _ in range(3):
+        with profiler.phase("outer"):
+            with profiler.phase("inner"):
+                time.sleep(0.001)
+
+    def work():
+        with profiler.phase("thread"):
+            pass
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    return profiler
+
+
+def test_chrome_trace(tmp_path):
+    profiler = profile()
+    profiler.export_chrome_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as file:
+        trace = json.load(file)
+
+    events = trace["traceEvents"]
+    # The most recent max_events phases, in the order they ended
+    assert [event["name"] for event in events] == \
+        ["inner", "outer", "inner", "outer", "thread"]
+    assert all(event["ph"] == "X" and event["pid"] == 0 for event in events)
+    assert len({event["tid"] for event in events}) == 2
+
+    # Microseconds, inner phases nest within their outer phase
+    inner, outer = events[2], events[3]
+    assert inner["dur"] >= 1000
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_tensorboard_scalars(tmp_path):
+    pytest.importorskip("tensorboard")
+    from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+
+    profiler = profile()
+    profiler.export_tensorboard(str(tmp_path), step=7)
+    accumulator = EventAccumulator(str(tmp_path))
+    accumulator.Reload()
+
+    stats = profiler.stats()
+    tags = accumulator.Tags()["scalars"]
+    assert sorted(tags) == sorted(f"profile/{name}/{key}" for name in stats for key in
+                                  ("mean_ms", "p50_ms", "p99_ms", "mean_net_blocks"))
+    for name, values in stats.items():
+        [scalar] = accumulator.Scalars(f"profile/{name}/mean_ms")
+        assert scalar.step == 7
+        assert scalar.value == pytest.approx(values["mean_ms"], rel=1e-6)
@@ -0,0 +1,68 @@
+import math
+
+import arcade
+import numpy as np
+
+from proximity import min_distances, paired_min_distances
+
+
+def random_polygons(rng, n, max_points=8) -> np.ndarray:
+    """ Convex polygons close enough to each other to overlap at times """
+    polygons = np.empty((n, max_points, 2))
+    for i in range(n):
+        num_points = rng.integers(3, max_points + 1)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, num_points))
+        radius = rng.uniform(5, 30)
+        points = rng.uniform(0, 150, 2) + radius * np.stack(
+            [np.cos(angles), np.sin(angles)], axis=1)
+        polygons[i, :num_points] = points
+        polygons[i, num_points:] = points[0]
+    return polygons
+
+
+def brute_force_distance(a, b) -> float:
+    """ Vertex to edge distances in both directions, 0 on overlap """
+    # Without the padding, whose zero length edges fool arcade's SAT test
+    a, b = [tuple(dict.fromkeys(map(tuple, polygon))) for polygon in (a, b)]
+    if arcade.are_polygons_intersecting(a, b):
+        return 0.0
+
+    def point_segment(p, s, e):
+        dx, dy = e[0] - s[0], e[1] - s[1]
+        length = dx * dx + dy * dy
+        t = 0 if length == 0 else ((p[0] - s[0]) * dx + (p[1] - s[1]) * dy) / length
+        t = min(max(t, 0), 1)
+        return math.hypot(p[0] - s[0] - t * dx, p[1] - s[1] - t * dy)
+
+    return min(point_segment(p, polygon[j], polygon[(j + 1) % len(polygon)])
+               for points, polygon in ((a, b), (b, a))
+               for p in points for j in range(len(polygon)))
+
+
+def test_min_distances_match_brute_force():
+    rng = np.random.default_rng(0)
+    overlaps = 0
+    for _ in range(20):
+        polygon, *others = random_polygons(rng, 31)
+        others = np.array(others)
+        expected = np.array([brute_force_distance(polygon, other) for other in others])
+        overlaps += (expected == 0).sum()
+        np.testing.assert_allclose(min_distances(polygon, others), expected, atol=1e-9)
+
+        # Culled polygons are at least the cutoff away
+        culled = min_distances(polygon, others, cutoff=20)
+        near = np.isfinite(culled)
+        np.testing.assert_allclose(culled[near], expected[near], atol=1e-9)
+        assert (expected[~near] >= 20).all()
+    # Both the overlapping and the disjoint case are covered
+    assert 0 < overlaps < 20 * 30
+
+
+def test_paired_min_distances_match_brute_force():
+    rng = np.random.default_rng(1)
+    polygons = random_polygons(rng, 10)
+    others = random_polygons(rng, 10 * 6).reshape(10, 6, -1, 2)
+    expected = np.array([[brute_force_distance(polygon, other) for other in row]
+                         for polygon, row in zip(polygons, others)])
+    np.testing.assert_allclose(paired_min_distances(polygons, others), expected,
+                               atol=1e-9)
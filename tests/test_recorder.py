@@ -0,0 +1,27 @@
+import numpy as np
+
+from recorder import EpisodeRecorder
+
+
+def test_long_episodes_are_strided():
+    recorder = EpisodeRecorder(max_episodes=2, downsample=1, max_frames=8)
+    for i in range(100):
+        recorder.capture(np.full((4, 4), i, dtype=np.uint8))
+    recorder.start_episode()
+
+    frames = recorder.frames()
+    assert len(frames) <= 8
+    # Evenly spaced over the whole episode
+    values = [int(frame[0, 0]) for frame in frames]
+    stride = recorder.episodes[-1][2]
+    assert values == list(range(0, 100, stride))
+    recorder.close()
+
+
+def test_short_episodes_keep_all_frames():
+    recorder = EpisodeRecorder(downsample=1, max_frames=8)
+    for i in range(8):
+        recorder.capture(np.full((4, 4), i, dtype=np.uint8))
+    recorder.start_episode()
+    assert [int(frame[0, 0]) for frame in recorder.frames()] == list(range(8))
+    recorder.close()
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from env import Environment
+
+
+@pytest.fixture(scope="module")
+def environments():
+    try:
+        offscreen = Environment(512, 512, "test", renderer="offscreen")
+    except Exception as error:
+        pytest.skip(f"No OpenGL context: {error}")
+    software = Environment(512, 512, "test", renderer="software")
+    yield offscreen, software
+    offscreen.close()
+    software.close()
+
+
+def test_rasterizer_matches_opengl(environments):
+    offscreen, software = environments
+    offscreen.reset(seed=2)
+    software.reset(seed=2)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        actions = rng.integers(0, 4, size=1)
+        obs, _, done, _, _ = offscreen.step(actions)
+        expected, _, expected_done, _, _ = software.step(actions)
+        assert done == expected_done
+        if done:
+            offscreen.reset()
+            software.reset()
+            continue
+        difference = np.abs(obs["image"].astype(int) - expected["image"])
+        assert difference.max() <= 2
+
+
+def test_full_frames_match(environments):
+    offscreen, software = environments
+    offscreen.reset(seed=3)
+    software.reset(seed=3)
+    frame = offscreen.game.get_patch(0, 0, 512, 512)
+    expected = software.game.get_patch(0, 0, 512, 512)
+    assert frame.shape == expected.shape == (512, 512)
+    assert np.abs(frame.astype(int) - expected).max() <= 2
@@ -0,0 +1,114 @@
+import math
+import numpy as np
+
+from collections import deque
+from reward import SmoothedReward
+
+
+class ReferenceReward:
+    """ Environment.reward_function as it was written, with deques """
+
+    def __init__(self):
+        self.prev_movement_distance = None
+        self.prev_avoidance_distance = None
+        self.movement_reward_queue = deque()
+        self.avoidance_reward_queue = deque()
+
+    def step(self, target, rescuer, nearest) -> float:
+        curr_dist = math.sqrt((rescuer[0] - target[0]) ** 2 +
+                              (rescuer[1] - target[1]) ** 2)
+        if self.prev_movement_distance is not None:
+            progress = self.prev_movement_distance - curr_dist
+        else:
+            progress = 0
+        self.prev_movement_distance = curr_dist
+
+        num_movement_rewards = len(
+            self.movement_reward_queue) if self.movement_reward_queue else 1
+        if num_movement_rewards == 10:
+            self.movement_reward_queue.popleft()
+        self.movement_reward_queue.append(progress)
+        total = sum(self.movement_reward_queue)
+        movement_reward = 0.5 * progress + 0.5 * (total / num_movement_rewards)
+
+        if math.isinf(nearest):
+            self.avoidance_reward_queue.clear()
+            progress = 0
+        else:
+            if self.prev_avoidance_distance is not None:
+                progress = nearest - self.prev_avoidance_distance
+            else:
+                progress = 0
+            self.prev_avoidance_distance = nearest
+
+        num_avoidance_rewards = len(
+            self.avoidance_reward_queue) if self.avoidance_reward_queue else 1
+        if num_avoidance_rewards == 10:
+            self.avoidance_reward_queue.popleft()
+        self.avoidance_reward_queue.append(progress)
+        total = sum(self.avoidance_reward_queue)
+        avoidance_reward = 0.5 * progress + \
+            0.5 * (total / num_avoidance_rewards)
+
+        return 1000 * movement_reward + avoidance_reward
+
+
+def test_smoothed_reward_matches_deques():
+    num_envs, num_steps = 6, 400
+    rng = np.random.default_rng(0)
+    smoothed = SmoothedReward(num_envs)
+    references = [ReferenceReward() for _ in range(num_envs)]
+
+    # Astroids come and go in runs of steps, so windows wrap many times as
+    # well as restart midway
+    near = np.ones(num_envs, dtype=bool)
+    for step in range(num_steps):
+        flip = rng.random(num_envs) < 0.08
+        near ^= flip
+        targets = rng.random((num_envs, 2))
+        rescuers = rng.random((num_envs, 2))
+        nearest = np.where(near, rng.uniform(0, 130, num_envs), np.inf)
+
+        # Only some environments step, others start new episodes
+        rows = np.flatnonzero(rng.random(num_envs) < 0.7)
+        rewards = smoothed.step(targets[rows], rescuers[rows], nearest[rows], rows)
+        expected = [references[i].step(targets[i], rescuers[i], nearest[i])
+                    for i in rows]
+        np.testing.assert_allclose(rewards, expected, rtol=1e-9, atol=1e-9)
+
+        ended = np.flatnonzero(rng.random(num_envs) < 0.01)
+        smoothed.reset(ended)
+        for i in ended:
+            references[i] = ReferenceReward()
+
+
+def test_single_environment_steps_all_rows():
+    rng = np.random.default_rng(1)
+    smoothed = SmoothedReward(1)
+    reference = ReferenceReward()
+    for step in range(50):
+        target, rescuer = rng.random(2), rng.random(2)
+        nearest = math.inf if step % 13 < 4 else rng.uniform(0, 130)
+        reward = smoothed.step(target[None], rescuer[None], [nearest])[0]
+        assert math.isclose(reward, reference.step(target, rescuer, nearest),
+                            rel_tol=1e-9, abs_tol=1e-9)
+
+
+def test_trajectory_rewards_match_the_recorded_rewards(tmp_path):
+    from reward import TrajectoryRewards
+    from trajectory import TrajectoryReader, record
+
+    # Random play collides often, so episodes end and restart within chunks
+    episodes = record(str(tmp_path), "random", 1500, seed=0, chunk_size=512,
+                      sprite_states=True)
+    reader = TrajectoryReader(str(tmp_path))
+    assert episodes > 1
+
+    recorded = reader.slice(0, len(reader), ["reward"])["reward"]
+    rewards = TrajectoryRewards.from_dataset(reader, chunk_size=256)
+    # The environment measures progress on the float32 observations, the
+    # rounding is scaled up by navigation_scale
+    np.testing.assert_allclose(rewards.rewards(), recorded, atol=1e-4)
+    swept = rewards.sweep([{}, {"navigation_scale": 2000}])
+    np.testing.assert_array_equal(swept[0], rewards.rewards())
+    assert (swept[1] != swept[0]).any()
@@ -0,0 +1,75 @@
+import arcade
+import numpy as np
+
+from game import make_game
+from spatial_index import UniformGrid, bounding_radius
+
+
+def linear_radius(centers, radii, x, y, radius):
+    return np.flatnonzero(np.hypot(*(centers - (x, y)).T) <= radius + radii)
+
+
+def linear_box(centers, radii, left, bottom, right, top):
+    offset = centers - np.clip(centers, (left, bottom), (right, top))
+    return np.flatnonzero(np.hypot(*offset.T) <= radii)
+
+
+def linear_outside(centers, radii, left, bottom, right, top):
+    inside = (centers - radii[:, None] >= (left, bottom)).all(axis=1) & \
+        (centers + radii[:, None] <= (right, top)).all(axis=1)
+    return np.flatnonzero(~inside)
+
+
+def test_queries_match_a_linear_scan():
+    rng = np.random.default_rng(0)
+    grid = UniformGrid(512, 384, cell_size=64)
+    centers = rng.uniform(-100, 600, (40, 2))
+    for step in range(200):
+        if step % 50 == 0:
+            # Objects added or removed
+            centers = rng.uniform(-100, 600, (rng.integers(0, 60), 2))
+        else:
+            # Some move a little, some jump across the grid
+            centers = centers + rng.normal(0, 10, centers.shape)
+            jumps = rng.random(len(centers)) < 0.05
+            centers[jumps] = rng.uniform(-100, 600, (jumps.sum(), 2))
+        radii = rng.uniform(5, 60, len(centers))
+        grid.update(centers, radii)
+
+        x, y = rng.uniform(-50, 550, 2)
+        radius = rng.uniform(0, 100)
+        np.testing.assert_array_equal(grid.query_radius(x, y, radius),
+                                      linear_radius(centers, radii, x, y, radius))
+        left, bottom = rng.uniform(-50, 500, 2)
+        box = (left, bottom, left + rng.uniform(0, 200), bottom + rng.uniform(0, 200))
+        np.testing.assert_array_equal(grid.query_box(*box),
+                                      linear_box(centers, radii, *box))
+        np.testing.assert_array_equal(grid.query_outside(0, 0, 512, 384),
+                                      linear_outside(centers, radii, 0, 0, 512, 384))
+
+
+def test_collision_queries_match_a_linear_scan():
+    game = make_game(512, 512, None, renderer="software", physics="numpy")
+    game.num_astroids = 24
+    game.setup()
+    game.seed(0)
+    game.reset()
+    rescuer = game.rescuer_list[0]
+    rng = np.random.default_rng(0)
+    collisions = 0
+    for _ in range(400):
+        impulse = tuple(rng.uniform(-400, 400, 2))
+        game.physics_engine.apply_impulse(rescuer, impulse)
+        done = game.custom_update()
+        nearby = game.asteroid_index.query_radius(
+            rescuer.center_x, rescuer.center_y, bounding_radius(rescuer))
+        colliding = [i for i in nearby.tolist()
+                     if arcade.check_for_collision(rescuer, game.asteroids_list[i])]
+        expected = [i for i, astroid in enumerate(game.asteroids_list)
+                    if arcade.check_for_collision(rescuer, astroid)]
+        assert colliding == expected
+        collisions += bool(expected)
+        if done:
+            game.reset()
+    assert collisions
+    game.close()
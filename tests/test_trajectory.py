@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from trajectory import COLUMNS, TrajectoryReader, TrajectoryWriter, sprite_columns
+
+COLUMNS_WITH_SPRITES = dict(COLUMNS, image=((8, 8), "uint8"), **sprite_columns(3))
+
+
+def random_steps(rng, n: int):
+    """ Values of every column of COLUMNS_WITH_SPRITES for n steps """
+    steps = {}
+    for name, (shape, dtype) in COLUMNS_WITH_SPRITES.items():
+        if np.dtype(dtype) == bool:
+            steps[name] = rng.random((n, *shape)) < 0.05
+        elif np.dtype(dtype).kind in "iu":
+            steps[name] = rng.integers(0, 255, (n, *shape)).astype(dtype)
+        else:
+            steps[name] = rng.normal(0, 100, (n, *shape)).astype(dtype)
+    return steps
+
+
+def write(writer, steps, start: int, stop: int):
+    writer.add_batch({"numerical": steps["numerical"][start:stop],
+                      "image": steps["image"][start:stop]},
+                     steps["action"][start:stop], steps["reward"][start:stop],
+                     steps["done"][start:stop],
+                     **{name: steps[name][start:stop] for name in sprite_columns(3)})
+
+
+def test_memmaps_read_back_what_was_written(tmp_path):
+    rng = np.random.default_rng(0)
+    steps = random_steps(rng, 250)
+    writer = TrajectoryWriter(str(tmp_path), chunk_size=64,
+                              columns=COLUMNS_WITH_SPRITES)
+    # Single steps and batches, some of them spanning chunk boundaries
+    for t in range(10):
+        writer.add({"numerical": steps["numerical"][t], "image": steps["image"][t]},
+                   steps["action"][t], steps["reward"][t], steps["done"][t],
+                   **{name: steps[name][t] for name in sprite_columns(3)})
+    for start, stop in [(10, 50), (50, 51), (51, 200), (200, 250)]:
+        write(writer, steps, start, stop)
+    assert len(writer) == 250
+    writer.close()
+
+    reader = TrajectoryReader(str(tmp_path))
+    assert len(reader) == 250
+    assert reader.chunk_lengths == [64, 64, 64, 58]
+    assert sorted(reader.columns) == sorted(COLUMNS_WITH_SPRITES)
+    everything = reader.slice(0, 250)
+    for name, values in steps.items():
+        assert everything[name].dtype == values.dtype
+        np.testing.assert_array_equal(everything[name], values)
+
+    # Within a chunk slices are views onto the mapped files
+    within = reader.slice(70, 100, ["image"])["image"]
+    assert isinstance(within.base, np.memmap)
+    np.testing.assert_array_equal(within, steps["image"][70:100])
+
+    indices = rng.integers(0, 250, 100)
+    gathered = reader.gather(indices)
+    for name, values in steps.items():
+        np.testing.assert_array_equal(gathered[name], values[indices])
+    sampled = reader.sample(32, np.random.default_rng(1), ["reward"])
+    expected = steps["reward"][np.random.default_rng(1).integers(0, 250, 32)]
+    np.testing.assert_array_equal(sampled["reward"], expected)
+
+    stops = np.flatnonzero(steps["done"]) + 1
+    np.testing.assert_array_equal(reader.episodes()[:, 1], stops)
+    np.testing.assert_array_equal(reader.episodes()[1:, 0], stops[:-1])
+
+
+def test_unfinished_datasets_read_up_to_the_last_full_chunk(tmp_path):
+    steps = random_steps(np.random.default_rng(2), 100)
+    writer = TrajectoryWriter(str(tmp_path), chunk_size=32,
+                              columns=COLUMNS_WITH_SPRITES)
+    write(writer, steps, 0, 100)
+
+    reader = TrajectoryReader(str(tmp_path))
+    assert len(reader) == 96
+    np.testing.assert_array_equal(reader.slice(0, 96, ["numerical"])["numerical"],
+                                  steps["numerical"][:96])
+    writer.close()
+    with pytest.raises(FileExistsError):
+        TrajectoryWriter(str(tmp_path))
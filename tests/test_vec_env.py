@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from vec_env import BatchedEnvironment, SharedMemoryVecEnv
+
+
+@pytest.mark.parametrize("frame_skip", [1, 3])
+def test_batched_physics_matches_env_steps(frame_skip):
+    venvs = [BatchedEnvironment(4, 512, 512, physics="numpy", frame_skip=frame_skip)
+             for _ in range(2)]
+    assert venvs[0].batched_physics
+    # The second one steps every game on its own
+    venvs[1].batched_physics = False
+
+    for venv in venvs:
+        venv.seed(3)
+    observations = [venv.reset() for venv in venvs]
+    rng = np.random.default_rng(0)
+    for _ in range(150):
+        actions = rng.integers(0, 4, size=(4, 1))
+        results = [venv.step(actions) for venv in venvs]
+        (obs, rewards, dones, _), (expected_obs, expected_rewards, expected_dones, _) = results
+        for key in obs:
+            np.testing.assert_array_equal(obs[key], expected_obs[key])
+        np.testing.assert_array_equal(rewards, expected_rewards)
+        np.testing.assert_array_equal(dones, expected_dones)
+
+    for venv in venvs:
+        venv.close()
+
+
+def test_env_method_reaches_the_indexed_environments():
+    venv = SharedMemoryVecEnv(2, 512, 512, envs_per_worker=2)
+    try:
+        # Indices 1 and 2 live in different workers
+        venv.env_method("set_curriculum", num_astroids=2, indices=[2, 1])
+        venv.reset()
+        distances = venv.env_method("update_asteroid_distances", indices=[3, 2, 1, 0])
+        assert [len(d) == 2 for d in distances] == [False, True, True, False]
+
+        venv.set_attr("frame_skip", 5, indices=[1])
+        assert venv.get_attr("frame_skip") == [1, 5, 1, 1]
+        assert venv.get_attr("frame_skip", indices=2) == [1]
+    finally:
+        venv.close()
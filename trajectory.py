@@ -0,0 +1,321 @@
+import argparse
+import glob
+import json
+import os
+import numpy as np
+
+from typing import Dict, List, Tuple
+
+'''
+Trajectories of Environment.step on disk, for offline analysis, behaviour
+cloning and reward experiments. Every column, e.g. the image observations,
+is split into chunks of `chunk_size` steps, each an .npy file which is
+memory mapped when read. Datasets of millions of steps are thus sampled
+without loading them into RAM.
+'''
+
+META_FILE = "meta.json"
+
+# Columns of every dataset, step t holds the observation the action was
+# taken on and the outcome of that action
+COLUMNS: Dict[str, Tuple[Tuple[int, ...], str]] = {
+    "numerical": ((4,), "float32"),
+    "image": ((300, 300), "uint8"),
+    "action": ((1,), "int64"),
+    "reward": ((), "float32"),
+    "done": ((), "bool"),
+}
+
+# Hit boxes are stored with a fixed number of points, see hit_box_polygons
+HIT_BOX_POINTS = 16
+# Stands in for missing astroids, too far away to ever be in the vicinity
+_FAR_AWAY = 1e9
+
+
+def sprite_columns(num_astroids: int) -> Dict[str, Tuple[Tuple[int, ...], str]]:
+    """
+    Columns of the game state after each step, in pixels, as needed to
+    recompute rewards offline, see reward.TrajectoryRewards. They are zero
+    for steps which end an episode.
+    """
+    return {"rescuer_position": ((2,), "float64"),
+            "target_position": ((2,), "float64"),
+            "rescuer_hit_box": ((HIT_BOX_POINTS, 2), "float64"),
+            "astroid_hit_boxes": ((num_astroids, HIT_BOX_POINTS, 2), "float64"),
+            "success": ((), "bool")}
+
+
+def sprite_state(env, num_astroids: int) -> Dict[str, np.ndarray]:
+    """ Values of sprite_columns of an environment's current game state """
+    from proximity import hit_box_polygons
+
+    game = env.game
+    rescuer = game.rescuer_list[0]
+    target = game.mother_ship_list[0] if rescuer.carries_resource \
+        else game.alien_list[0]
+    astroids = hit_box_polygons(list(game.asteroids_list), HIT_BOX_POINTS)
+    if len(astroids) > num_astroids:
+        raise ValueError(f"More than {num_astroids} astroids to record")
+    padding = np.full((num_astroids - len(astroids), HIT_BOX_POINTS, 2), _FAR_AWAY)
+    return {"rescuer_position": np.array([rescuer.center_x, rescuer.center_y]),
+            "target_position": np.array([target.center_x, target.center_y]),
+            "rescuer_hit_box": hit_box_polygons([rescuer], HIT_BOX_POINTS)[0],
+            "astroid_hit_boxes": np.concatenate([astroids, padding]),
+            "success": np.asarray(False)}
+
+
+class TrajectoryWriter:
+    """
+    Streams steps into a dataset directory.
+
+    Steps are written into the memory mapped chunk files directly, without
+    staging them in memory. The metadata is updated whenever a chunk is
+    full, hence a dataset stays readable while it is still being written or
+    after a crash, up to the last finished chunk.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 65536,
+                 columns: Dict[str, Tuple[Tuple[int, ...], str]] | None = None):
+        """
+        Parameters:
+        directory (str): Created if missing, must not hold a dataset yet
+        chunk_size (int): Steps per chunk file
+        columns (Dict): Name -> (per step shape, dtype), COLUMNS by default.
+        Extra columns, e.g. sprite states, are passed to add as keywords
+        """
+        if os.path.exists(os.path.join(directory, META_FILE)):
+            raise FileExistsError(f"{directory} already holds a dataset")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.columns = {name: (tuple(shape), np.dtype(dtype).str)
+                        for name, (shape, dtype) in (columns or COLUMNS).items()}
+
+        # Lengths of the finished chunks
+        self.chunk_lengths: List[int] = []
+        self._chunk: Dict[str, np.memmap] = {}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return sum(self.chunk_lengths) + self._length
+
+    def add(self, obs: Dict[str, np.ndarray], action, reward: float,
+            done: bool, **extra):
+        """ Appends one step, obs being the observation acted on """
+        self.add_batch({key: value[None] for key, value in obs.items()},
+                       np.asarray(action)[None], np.asarray(reward)[None],
+                       np.asarray(done)[None],
+                       **{key: np.asarray(value)[None] for key, value in extra.items()})
+
+    def add_batch(self, obs: Dict[str, np.ndarray], actions: np.ndarray,
+                  rewards: np.ndarray, dones: np.ndarray, **extra):
+        """
+        Appends a batch of steps, e.g. one step of all envs of a VecEnv.
+        All arrays have the batch as leading dimension.
+        """
+        values = {**obs, "action": actions, "reward": rewards, "done": dones, **extra}
+        count = len(rewards)
+        written = 0
+        while written < count:
+            if not self._chunk:
+                self._open_chunk()
+            n = min(count - written, self.chunk_size - self._length)
+            for name, chunk in self._chunk.items():
+                chunk[self._length:self._length + n] = np.reshape(
+                    values[name][written:written + n], (n, *chunk.shape[1:]))
+            self._length += n
+            written += n
+            if self._length == self.chunk_size:
+                self._close_chunk()
+
+    def close(self):
+        """ Finishes the last chunk, the dataset is complete afterwards """
+        if self._chunk:
+            self._close_chunk()
+        self._write_meta()
+
+    def _path(self, name: str, chunk: int) -> str:
+        return os.path.join(self.directory, f"{name}.{chunk:05d}.npy")
+
+    def _open_chunk(self):
+        index = len(self.chunk_lengths)
+        self._chunk = {
+            name: np.lib.format.open_memmap(
+                self._path(name, index), mode="w+", dtype=dtype,
+                shape=(self.chunk_size, *shape))
+            for name, (shape, dtype) in self.columns.items()}
+        self._length = 0
+
+    def _close_chunk(self):
+        for chunk in self._chunk.values():
+            chunk.flush()
+        self.chunk_lengths.append(self._length)
+        self._chunk = {}
+        self._length = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {"chunk_size": self.chunk_size,
+                "chunk_lengths": self.chunk_lengths,
+                "columns": {name: {"shape": list(shape), "dtype": dtype}
+                            for name, (shape, dtype) in self.columns.items()}}
+        # Replaced atomically, readers never see a partial file
+        path = os.path.join(self.directory, META_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(meta, file, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+class TrajectoryReader:
+    """
+    Memory mapped view of a dataset written by TrajectoryWriter.
+
+    Contiguous slices within a chunk are views onto the mapped files, i.e.
+    zero copy. Random minibatches only read the sampled steps' pages, they
+    are gathered chunk by chunk in file order.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, META_FILE)) as file:
+            meta = json.load(file)
+        self.directory = directory
+        self.chunk_size = meta["chunk_size"]
+        self.chunk_lengths: List[int] = meta["chunk_lengths"]
+        self.columns = list(meta["columns"])
+        self._chunks: List[Dict[str, np.ndarray]] = [
+            {name: np.load(os.path.join(directory, f"{name}.{i:05d}.npy"),
+                           mmap_mode="r")[:length]
+             for name in self.columns}
+            for i, length in enumerate(self.chunk_lengths)]
+        self._starts = np.cumsum([0] + self.chunk_lengths)
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def slice(self, start: int, stop: int,
+              columns: List[str] | None = None) -> Dict[str, np.ndarray]:
+        """ Steps [start, stop), views if they lie in one chunk """
+        columns = columns or self.columns
+        first = int(np.searchsorted(self._starts, start, side="right")) - 1
+        offset = start - int(self._starts[first])
+        if stop - int(self._starts[first]) <= self.chunk_lengths[first]:
+            return {name: self._chunks[first][name][offset:offset + stop - start]
+                    for name in columns}
+        return self.gather(np.arange(start, stop), columns)
+
+    def gather(self, indices: np.ndarray,
+               columns: List[str] | None = None) -> Dict[str, np.ndarray]:
+        """ Steps at the given indices, in the given order """
+        columns = columns or self.columns
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind="stable")
+        chunk_of = np.searchsorted(self._starts, indices[order], side="right") - 1
+
+        batch = {name: np.empty((len(indices), *self._chunks[0][name].shape[1:]),
+                                dtype=self._chunks[0][name].dtype)
+                 for name in columns}
+        bounds = np.flatnonzero(np.diff(chunk_of)) + 1
+        for positions in np.split(np.arange(len(indices)), bounds):
+            if len(positions) == 0:
+                continue
+            chunk = int(chunk_of[positions[0]])
+            rows = indices[order[positions]] - self._starts[chunk]
+            for name in columns:
+                batch[name][order[positions]] = self._chunks[chunk][name][rows]
+        return batch
+
+    def sample(self, batch_size: int, rng: np.random.Generator | None = None,
+               columns: List[str] | None = None) -> Dict[str, np.ndarray]:
+        """ Uniformly drawn steps, with replacement """
+        rng = rng or np.random.default_rng()
+        return self.gather(rng.integers(0, len(self), batch_size), columns)
+
+    def episodes(self) -> np.ndarray:
+        """
+        Returns:
+        np.ndarray: Shape (E, 2), start and stop step of the finished episodes
+        """
+        stops = np.flatnonzero(np.concatenate(
+            [chunk["done"] for chunk in self._chunks] or [np.empty(0, bool)])) + 1
+        return np.stack([np.concatenate(([0], stops[:-1])), stops], axis=1)
+
+
+def open_datasets(pattern: str) -> List[TrajectoryReader]:
+    """ Readers of all dataset directories matching a glob pattern """
+    return [TrajectoryReader(directory) for directory in sorted(glob.glob(pattern))
+            if os.path.exists(os.path.join(directory, META_FILE))]
+
+
+def record(directory: str, agent: str, num_steps: int, seed: int = 0,
+           chunk_size: int = 65536, env_kwargs: Dict | None = None,
+           sprite_states: bool = False) -> int:
+    """
+    Records an agent playing, see evaluate.load_agent.
+
+    Parameters:
+    sprite_states (bool): Also record the sprite_columns
+
+    Returns:
+    int: Number of finished episodes
+    """
+    from env import Environment
+    from evaluate import load_agent
+
+    env = Environment(**dict(screen_width=512, screen_height=512,
+                             screen_title="RescueAI", renderer="software",
+                             **(env_kwargs or {})))
+    columns = dict(COLUMNS, image=(env.image_obs_space.shape, "uint8"))
+    num_astroids = env.game.num_astroids
+    if sprite_states:
+        columns.update(sprite_columns(num_astroids))
+        # Terminal steps only tell whether Alfred was delivered
+        terminal = {name: np.zeros(shape, dtype)
+                    for name, (shape, dtype) in sprite_columns(num_astroids).items()}
+    writer = TrajectoryWriter(directory, chunk_size, columns)
+    act = load_agent(agent, seed)
+    obs = env.reset(seed=seed)[0]
+    episodes = 0
+    try:
+        for _ in range(num_steps):
+            action = act(obs)
+            # The observation buffers are overwritten by the step
+            acted_on = {key: value.copy() for key, value in obs.items()}
+            obs, reward, done = env.step(action)[0:3]
+            extra = {}
+            if sprite_states:
+                extra = dict(terminal, success=np.asarray(env.rescued_alfred)) \
+                    if done else sprite_state(env, num_astroids)
+            writer.add(acted_on, action, reward, done, **extra)
+            if done:
+                episodes += 1
+                obs = env.reset()[0]
+    finally:
+        writer.close()
+        env.close()
+    return episodes
+
+
+def main():
+    '''
+    Records trajectories, e.g.
+    python trajectory.py datasets/ckpt_3 --agent checkpoints/ckpt_3 --steps 1000000
+    python trajectory.py datasets/random --sprite-states
+    '''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("directory")
+    parser.add_argument("--agent", default="random",
+                        help="Checkpoint path or 'random'")
+    parser.add_argument("--steps", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sprite-states", action="store_true",
+                        help="Record positions and hit boxes, see sprite_columns")
+    args = parser.parse_args()
+
+    episodes = record(args.directory, args.agent, args.steps, args.seed,
+                      args.chunk_size, sprite_states=args.sprite_states)
+    print(f"Recorded {args.steps} steps, {episodes} episodes, to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
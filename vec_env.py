@@ -0,0 +1,419 @@
+import time
+import numpy as np
+import gymnasium as gym
+import multiprocessing as mp
+
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Type
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices
+from env import Environment
+from physics import NumpyPhysicsEngine, step_engines
+from profiling import profiler
+from reward import SmoothedReward
+
+
+class BatchedEnvironment(VecEnv):
+    """
+    Simulates K independent games in a single process.
+
+    All games render through the software rasterizer, hence they share the
+    decoded assets and need no window. Observations of all games are written
+    into stacked, contiguous arrays, i.e. one array per observation key with
+    the environment index as leading dimension, as expected by SB3's VecEnv.
+    The rewards of all running episodes are computed in one batched call,
+    and games on the 'numpy' physics backend are stepped together, with one
+    step_engines call per frame.
+    """
+
+    def __init__(self, num_envs: int, screen_width, screen_height,
+                 screen_title: str = "RescueAI", renderer: str = "software",
+                 **env_kwargs):
+        """
+        Parameters:
+        env_kwargs: Further Environment arguments, e.g. obs_size or frame_skip
+        """
+        self.envs: List[Environment] = [
+            Environment(screen_width, screen_height, screen_title, renderer,
+                        **env_kwargs)
+            for _ in range(num_envs)]
+        for env in self.envs:
+            env.defer_reward = True
+        self.reward_state = SmoothedReward(num_envs)
+        self.batched_physics = all(
+            isinstance(env.game.physics_engine, NumpyPhysicsEngine)
+            for env in self.envs)
+
+        env = self.envs[0]
+        super().__init__(num_envs, env.observation_space, env.action_space)
+
+        self._obs: Dict[str, np.ndarray] = {
+            key: np.zeros((num_envs, *space.shape), dtype=space.dtype)
+            for key, space in env.observation_space.spaces.items()}
+        self._rewards = np.zeros(num_envs, dtype=np.float32)
+        self._dones = np.zeros(num_envs, dtype=bool)
+        self._infos: List[Dict[str, Any]] = [{} for _ in range(num_envs)]
+        self._actions: np.ndarray | None = None
+
+    def reset(self):
+        for i, env in enumerate(self.envs):
+            obs, self.reset_infos[i] = env.reset(seed=self._seeds[i])
+            self._write_obs(i, obs)
+        self.reward_state.reset()
+        self._reset_seeds()
+        self._reset_options()
+        return self._copy_obs()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._actions = actions
+
+    def step_wait(self):
+        if self.batched_physics:
+            results = self._step_batched(self._actions)
+        else:
+            results = [env.step(self._actions[i]) for i, env in enumerate(self.envs)]
+
+        running = []
+        nearest = []
+        for i, env in enumerate(self.envs):
+            obs, reward, done, truncated, info = results[i]
+            self._dones[i] = done or truncated
+            info["TimeLimit.truncated"] = truncated and not done
+
+            if reward is None:
+                # Rewarded below, while the game still shows this step
+                running.append(i)
+                nearest.append(env.nearest_asteroid_distance())
+            else:
+                self._rewards[i] = reward
+            if self._dones[i]:
+                # Episodes end with an empty observation, restart right away
+                info["terminal_observation"] = obs
+                obs, self.reset_infos[i] = env.reset()
+                self.reward_state.reset([i])
+            self._write_obs(i, obs)
+            self._infos[i] = info
+
+        if running:
+            numerical = self._obs["numerical"][running]
+            with profiler.phase("reward_function"):
+                self._rewards[running] = self.reward_state.step(
+                    numerical[:, 0:2], numerical[:, 2:4], nearest, running)
+
+        return (self._copy_obs(), np.copy(self._rewards),
+                np.copy(self._dones), list(self._infos))
+
+    def _step_batched(self, actions: np.ndarray) -> List:
+        """
+        Environment.step of all envs, frame by frame. The physics engines of
+        the games whose episodes go on are advanced together by step_engines.
+        """
+        made_mistakes = [False] * self.num_envs
+        pending = list(range(self.num_envs))
+        for env in self.envs:
+            env.rescued_alfred = False
+
+        for _ in range(self.envs[0].frame_skip):
+            for i in pending:
+                self.envs[i].queue_actions(actions[i])
+                self.envs[i].game.apply_actions()
+            with profiler.phase("physics_step"):
+                step_engines([self.envs[i].game.physics_engine for i in pending])
+            for i in pending:
+                made_mistakes[i] = self.envs[i].game.after_physics_step()
+            pending = [i for i in pending
+                       if not self.envs[i].frame_ended(made_mistakes[i])]
+            if not pending:
+                break
+
+        return [env.finish_step(made_mistake)
+                for env, made_mistake in zip(self.envs, made_mistakes)]
+
+    def close(self) -> None:
+        for env in self.envs:
+            env.close()
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return [getattr(self.envs[i], attr_name)
+                for i in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any,
+                 indices: VecEnvIndices = None) -> None:
+        for i in self._get_indices(indices):
+            setattr(self.envs[i], attr_name, value)
+
+    def env_method(self, method_name: str, *method_args,
+                   indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs)
+                for i in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: Type[gym.Wrapper],
+                       indices: VecEnvIndices = None) -> List[bool]:
+        return [isinstance(self.envs[i], wrapper_class)
+                for i in self._get_indices(indices)]
+
+    def get_images(self) -> Sequence[Optional[np.ndarray]]:
+        return [env.game.get_patch(0, 0, env.game.width, env.game.height)
+                for env in self.envs]
+
+    def _write_obs(self, index: int, obs: Dict[str, np.ndarray]):
+        for key, buffer in self._obs.items():
+            buffer[index] = obs[key]
+
+    def _copy_obs(self) -> Dict[str, np.ndarray]:
+        # The buffers are reused for the next step, callers get their own copy
+        return {key: np.copy(buffer) for key, buffer in self._obs.items()}
+
+
+def _shared_memory_worker(remote, parent_remote, shm_specs, env_indices,
+                          env_kwargs):
+    """
+    Runs a slice of the environments in a subprocess. Observations are written
+    straight into the shared memory ring, only small per-step results such as
+    rewards and dones are sent back through the pipe.
+    """
+    parent_remote.close()
+
+    envs = [Environment(**env_kwargs) for _ in env_indices]
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in shm_specs]
+    rings = {key: np.ndarray(shape, dtype=dtype, buffer=block.buf)
+             for block, (_, key, (shape, dtype)) in zip(blocks, shm_specs)}
+
+    def write_obs(slot, i, obs):
+        for key, ring in rings.items():
+            ring[slot, env_indices[i]] = obs[key]
+
+    num_steps = 0
+    busy_time = 0.0
+    start_time = time.perf_counter()
+
+    try:
+        while True:
+            command, data = remote.recv()
+
+            if command == "step":
+                slot, actions = data
+                step_start = time.perf_counter()
+                results = []
+                for i, env in enumerate(envs):
+                    obs, reward, done, truncated, info = env.step(actions[i])
+                    info["TimeLimit.truncated"] = truncated and not done
+                    reset_info = None
+                    if done or truncated:
+                        info["terminal_observation"] = obs
+                        obs, reset_info = env.reset()
+                    write_obs(slot, i, obs)
+                    results.append((reward, done or truncated, info, reset_info))
+                busy_time += time.perf_counter() - step_start
+                num_steps += len(envs)
+                remote.send(results)
+            elif command == "reset":
+                slot, seeds = data
+                reset_infos = []
+                for i, env in enumerate(envs):
+                    obs, reset_info = env.reset(seed=seeds[i])
+                    write_obs(slot, i, obs)
+                    reset_infos.append(reset_info)
+                remote.send(reset_infos)
+            elif command == "stats":
+                remote.send({"env_steps": num_steps,
+                             "busy_time": busy_time,
+                             "wall_time": time.perf_counter() - start_time})
+            elif command == "get_attr":
+                attr_name, local = data
+                remote.send([getattr(envs[i], attr_name) for i in local])
+            elif command == "set_attr":
+                attr_name, value, local = data
+                remote.send([setattr(envs[i], attr_name, value) for i in local])
+            elif command == "env_method":
+                method_name, args, kwargs, local = data
+                remote.send([getattr(envs[i], method_name)(*args, **kwargs)
+                             for i in local])
+            elif command == "close":
+                break
+            else:
+                raise NotImplementedError(f"`{command}` is not implemented in the worker")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for env in envs:
+            env.close()
+        for block in blocks:
+            block.close()
+        remote.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Spreads the environments over a pool of worker processes.
+
+    Every worker owns its own games and writes their observations into a
+    shared memory ring of `ring_size` slots, shaped (ring_size, num_envs, ...)
+    per observation key. Steps return views onto the current slot without
+    copying or pickling the image patches. A slot is only overwritten
+    `ring_size` steps later, hence the default of 2 keeps the previous
+    observation valid while the next one is written, as SB3's rollout
+    collection requires.
+    """
+
+    def __init__(self, num_workers: int, screen_width, screen_height,
+                 screen_title: str = "RescueAI", envs_per_worker: int = 1,
+                 ring_size: int = 2, renderer: str = "software",
+                 start_method: str | None = None, **env_kwargs):
+        """
+        Parameters:
+        env_kwargs: Further Environment arguments, e.g. obs_size or frame_skip
+        """
+        env_kwargs = dict(screen_width=screen_width,
+                          screen_height=screen_height,
+                          screen_title=screen_title,
+                          renderer=renderer,
+                          **env_kwargs)
+
+        # Spaces are taken from a probe environment, which needs no display
+        probe = Environment(**{**env_kwargs, "renderer": "software"})
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        num_envs = num_workers * envs_per_worker
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.ring_size = ring_size
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._rings: Dict[str, np.ndarray] = {}
+        shm_specs = []
+        for key, space in observation_space.spaces.items():
+            shape = (ring_size, num_envs, *space.shape)
+            dtype = np.dtype(space.dtype)
+            block = shared_memory.SharedMemory(
+                create=True, size=int(np.prod(shape)) * dtype.itemsize)
+            self._blocks.append(block)
+            self._rings[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            shm_specs.append((block.name, key, (shape, dtype)))
+
+        if start_method is None:
+            # Fork is not thread safe, see SB3's SubprocVecEnv
+            forkserver_available = "forkserver" in mp.get_all_start_methods()
+            start_method = "forkserver" if forkserver_available else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.processes = [], []
+        self._worker_envs: List[List[int]] = []
+        for worker in range(num_workers):
+            env_indices = list(range(worker * envs_per_worker,
+                                     (worker + 1) * envs_per_worker))
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_shared_memory_worker,
+                args=(work_remote, remote, shm_specs, env_indices, env_kwargs),
+                daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+            self._worker_envs.append(env_indices)
+
+        self._slot = 0
+        self.closed = False
+
+    def reset(self):
+        self._slot = (self._slot + 1) % self.ring_size
+        for remote, env_indices in zip(self.remotes, self._worker_envs):
+            remote.send(("reset", (self._slot,
+                                   [self._seeds[i] for i in env_indices])))
+        for remote, env_indices in zip(self.remotes, self._worker_envs):
+            for i, reset_info in zip(env_indices, remote.recv()):
+                self.reset_infos[i] = reset_info
+        self._reset_seeds()
+        self._reset_options()
+        return self._current_obs()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._slot = (self._slot + 1) % self.ring_size
+        for remote, env_indices in zip(self.remotes, self._worker_envs):
+            remote.send(("step", (self._slot, actions[env_indices])))
+
+    def step_wait(self):
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos: List[Dict[str, Any]] = [{} for _ in range(self.num_envs)]
+        for remote, env_indices in zip(self.remotes, self._worker_envs):
+            for i, (reward, done, info, reset_info) in zip(env_indices, remote.recv()):
+                rewards[i], dones[i], infos[i] = reward, done, info
+                if reset_info is not None:
+                    self.reset_infos[i] = reset_info
+        return self._current_obs(), rewards, dones, infos
+
+    def throughput(self) -> List[Dict[str, float]]:
+        """
+        Returns:
+        List[Dict]: Per worker the number of environment steps taken and the
+        steps per second, both over the time spent stepping and over the
+        lifetime of the worker.
+        """
+        for remote in self.remotes:
+            remote.send(("stats", None))
+        report = []
+        for worker, remote in enumerate(self.remotes):
+            stats = remote.recv()
+            report.append({
+                "worker": worker,
+                "env_steps": stats["env_steps"],
+                "steps_per_sec": stats["env_steps"] / max(stats["busy_time"], 1e-9),
+                "wall_steps_per_sec": stats["env_steps"] / max(stats["wall_time"], 1e-9)})
+        return report
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self.closed = True
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return self._gather("get_attr", (attr_name,), indices)
+
+    def set_attr(self, attr_name: str, value: Any,
+                 indices: VecEnvIndices = None) -> None:
+        self._gather("set_attr", (attr_name, value), indices)
+
+    def env_method(self, method_name: str, *method_args,
+                   indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return self._gather("env_method", (method_name, method_args, method_kwargs),
+                            indices)
+
+    def env_is_wrapped(self, wrapper_class: Type[gym.Wrapper],
+                       indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+    def _gather(self, command: str, data: tuple, indices: VecEnvIndices) -> List[Any]:
+        """
+        Runs a command on the environments of the given indices, each in the
+        worker owning it, and returns the results in the order of indices.
+        """
+        indices = list(self._get_indices(indices))
+        # Per worker, the indices it owns within its own environments
+        local: Dict[int, List[int]] = {}
+        for i in dict.fromkeys(indices):
+            for worker, env_indices in enumerate(self._worker_envs):
+                if i in env_indices:
+                    local.setdefault(worker, []).append(env_indices.index(i))
+                    break
+            else:
+                raise IndexError(f"Environment index {i} out of range")
+
+        for worker, owned in local.items():
+            self.remotes[worker].send((command, (*data, owned)))
+        values = {}
+        for worker, owned in local.items():
+            for j, value in zip(owned, self.remotes[worker].recv()):
+                values[self._worker_envs[worker][j]] = value
+        return [values[i] for i in indices]
+
+    def _current_obs(self) -> Dict[str, np.ndarray]:
+        return {key: ring[self._slot] for key, ring in self._rings.items()}